@@ -1,13 +1,28 @@
 from __future__ import annotations
 from typing import Callable, Self
-from dataclasses import dataclass
+from collections import Counter, OrderedDict, deque
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 from enum import Enum
+import csv
+import functools
+import html
+import io
+import itertools
+import os
+import re
+import threading
+import time
+import weakref
 
 import wx
 import wx.grid
 
 from HelpersPackage import IsInt, IsNumeric, ListBlockMove
-from WxHelpers import MessageBoxInput
+from Log import Log
+from WxHelpers import MessageBoxInput, ProgressMessage
 from FanzineDateTime import FanzineDateRange, FanzineDate
 
 
@@ -22,8 +37,10 @@ class IsEditable(Enum):
 #================================================================
 # A class containing the definition of a single column
 class ColDefinition:
+    _renames: int=0     # Counts every change to any column's name, so that ColDefinitionsLists can tell when their name index is stale
+
     def __init__(self, Name: str="", Width: int=100, Type: str="str", IsEditable: IsEditable=IsEditable.Yes, Preferred: str="") -> None:
-        self.Name=Name
+        self._name=Name
         self.Width=Width
         self.Type=Type       # Empty is string, others are  "int", "date range",  "date", "year", "month", "day", and "required str"
         self.IsEditable=IsEditable
@@ -37,6 +54,14 @@ class ColDefinition:
     def Copy(self) -> ColDefinition:
         return ColDefinition(self.Name, self.Width, self.Type, self.IsEditable, self._preferred)
 
+    @property
+    def Name(self) -> str:
+        return self._name
+    @Name.setter
+    def Name(self, val: str) -> None:
+        self._name=val
+        ColDefinition._renames+=1
+
     @property
     def Preferred(self) -> str:
         if self._preferred != "":
@@ -45,6 +70,26 @@ class ColDefinition:
     @Preferred.setter
     def Preferred(self, val: str) -> None:
         self._preferred=val
+        ColDefinition._renames+=1
+
+
+#================================================================
+# The list held by a ColDefinitionsList.  It is an ordinary list, except that it counts the changes made to it, so that the
+#   ColDefinitionsList can tell when its name index is out of date however the list was changed -- including in place through
+#   ColDefinitionsList.List, e.g., by swapping two columns.
+class _ChangeCountedList(list):
+    Changes: int=0
+
+def _CountChanges(name: str) -> Callable:
+    method=getattr(list, name)
+    def CountedMethod(self, *args, **kwargs):
+        self.Changes+=1
+        return method(self, *args, **kwargs)
+    CountedMethod.__name__=name
+    return CountedMethod
+
+for _name in ("__setitem__", "__delitem__", "__iadd__", "__imul__", "append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse"):
+    setattr(_ChangeCountedList, _name, _CountChanges(_name))
 
 
 #================================================================
@@ -52,14 +97,47 @@ class ColDefinition:
 class ColDefinitionsList:
     def __init__(self, coldefs: ColDefinition | list[ColDefinition]) -> None:
         if isinstance(coldefs, list):
-            self.List: list[ColDefinition]=coldefs
+            self._list: _ChangeCountedList=coldefs if isinstance(coldefs, _ChangeCountedList) else _ChangeCountedList(coldefs)
         else:
-            self.List=[coldefs]
+            self._list=_ChangeCountedList([coldefs])
+
+        # Lookups by name go through dicts mapping lower-cased names to the index of the first column with that name.
+        # They're built when first needed and rebuilt whenever the list or any column's name has changed.
+        self._anyIndex: dict[str, int]|None=None       # Name or preferred name
+        self._nameIndex: dict[str, int]={}              # Name only
+        self._exactNameIndex: dict[str, int]={}         # Name only, case-sensitive
+        self._indexedRenames: int=-1
+        self._indexedChanges: int=-1
+
+    @property
+    def List(self) -> list[ColDefinition]:
+        return self._list
+    @List.setter
+    def List(self, val: list[ColDefinition]) -> None:
+        self._list=val if isinstance(val, _ChangeCountedList) else _ChangeCountedList(val)
+        self._anyIndex=None
+
+    # --------------------------
+    # Return the name index, rebuilding it if anything has changed since it was built.
+    # (The list counts its changes, which catches code which has modified List in place.)
+    def _Index(self) -> dict[str, int]:
+        if self._anyIndex is None or self._indexedRenames != ColDefinition._renames or self._indexedChanges != self._list.Changes:
+            self._anyIndex={}
+            self._nameIndex={}
+            self._exactNameIndex={}
+            for i, x in enumerate(self._list):
+                self._anyIndex.setdefault(x.Name.lower(), i)
+                self._anyIndex.setdefault(x._preferred.lower(), i)
+                self._nameIndex.setdefault(x.Name.lower(), i)
+                self._exactNameIndex.setdefault(x.Name, i)
+            self._indexedRenames=ColDefinition._renames
+            self._indexedChanges=self._list.Changes
+        return self._anyIndex
 
     # --------------------------
     # Implement 'in' as in "name" in ColDefinitionsList
     def __contains__(self, val: str) -> bool:       
-        return any([x.Name.lower() == val.lower() or x._preferred.lower() == val.lower() for x in self.List])
+        return val.lower() in self._Index()
 
 
     def __hash__(self) -> int:
@@ -72,16 +150,22 @@ class ColDefinitionsList:
     # Look up the index of a ColDefinition by name
     # Return -1 if missing
     def __index__(self, val: str) -> int:
-        if val not in self:
-            return -1
-
-        return self.index(val)
+        return self._Index().get(val.lower(), -1)
 
     # --------------------------
     def index(self, val: str) -> int:       
-        if val not in self: # Calls __contains__
+        i=self._Index().get(val.lower())
+        if i is None:
             raise IndexError(f"ColDefinitionsList.index({val}) not found.")
-        return [x.Name.lower() == val.lower() or x._preferred.lower() == val.lower() for x in self.List].index(True)
+        return i
+
+    # --------------------------
+    # Look up the index of a column by its Name alone (not its preferred name).  Return -1 if missing
+    def IndexOfName(self, val: str, CaseSensitive: bool=False) -> int:
+        self._Index()
+        if CaseSensitive:
+            return self._exactNameIndex.get(val, -1)
+        return self._nameIndex.get(val.lower(), -1)
 
     # --------------------------
     # Index can be a name or a list index
@@ -89,9 +173,10 @@ class ColDefinitionsList:
         if index is None:
             raise KeyError("ColDefinitionsList index cannot be None.")
         if isinstance(index, str):     # The name of the column
-            if index not in self: # Calls __contains__
+            i=self._Index().get(index.lower())
+            if i is None:
                 return ColDefinition(Name=index)
-            return [x for x in self.List if x.Name == index or x._preferred == index][0]
+            return self.List[i]
         if isinstance(index, int):
             return self.List[index]
         if isinstance(index, slice):
@@ -104,15 +189,18 @@ class ColDefinitionsList:
             if index in self: # Calls __contains__
                 i=self.index(index)
                 del self.List[i]
+                self._anyIndex=None
                 return None
             raise IndexError(f"ColDefinitionsList.__delitem__({index}) not found.")
 
         if isinstance(index, int):      # The index of the column
             del self.List[index]
+            self._anyIndex=None
             return None
 
         if isinstance(index, slice):
             del self.List[index]
+            self._anyIndex=None
             return None
 
         raise KeyError(f"ColDefinitionsList.__delitem__({index}) illegal index.")
@@ -123,6 +211,7 @@ class ColDefinitionsList:
             if index in self: # Calls __contains__
                 i=self.index(index)
                 self.List[i]=value
+                self._anyIndex=None
                 return None
 
             if value.Name == "":
@@ -132,10 +221,12 @@ class ColDefinitionsList:
                 raise ValueError(f"ColDefinitionsList.__setitem__({index}, {value}) name mismatch.")
 
             self.List.append(value)
+            self._anyIndex=None
             return None
 
         if isinstance(index, int):      # The index of the column
             self.List[index]=value
+            self._anyIndex=None
             return
 
         if isinstance(index, slice):
@@ -157,6 +248,7 @@ class ColDefinitionsList:
             self.List.extend(val.List)
         else:
             raise Exception(f"ColDefinitionsList.append({val}) only accepts ColDefinition or ColDefinitionsList.")
+        self._anyIndex=None
 
 
     def __add__(self, val: ColDefinitionsList) -> ColDefinitionsList:
@@ -189,45 +281,400 @@ class Color:
      Black=wx.Colour(0, 0, 0)
 
 
+#================================================================
+# A bounded LRU cache of validation results keyed on (column Type, value).
+# Real data repeats the same values over and over (e.g., "Spring 1953" or "Jan 1961") and parsing dates is slow,
+# so each distinct value is validated once rather than on every recolor.
+# A single cache, SharedValidationCache, is shared by all columns of all grids.
+class ValidationCache:
+    def __init__(self, MaxSize: int=50000) -> None:
+        self.MaxSize=MaxSize
+        self._results: OrderedDict[tuple[str, str], bool]=OrderedDict()
+        self._lock=threading.Lock()     # Validation isn't necessarily done on the UI thread
+        self.Hits: int=0
+        self.Misses: int=0
+
+    def __len__(self) -> int:     # ValidationCache
+        return len(self._results)
+
+    # Return the cached result for (coltype, val), calling validate(val) to compute it if it isn't cached
+    def IsValid(self, coltype: str, val: str, validate: Callable[[str], bool]) -> bool:     # ValidationCache
+        key=(coltype, val)
+        with self._lock:
+            result=self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.Hits+=1
+                return result
+            self.Misses+=1
+
+        result=validate(val)
+
+        with self._lock:
+            self._results[key]=result
+            if len(self._results) > self.MaxSize:
+                self._results.popitem(last=False)
+        return result
+
+    # Call this when the validation rules change.  Forget the cached results for one column type or (coltype=None) for all of them.
+    def Invalidate(self, coltype: str|None=None) -> None:     # ValidationCache
+        with self._lock:
+            if coltype is None:
+                self._results.clear()
+            else:
+                for key in [k for k in self._results if k[0] == coltype]:
+                    del self._results[key]
+
+    def ResetCounters(self) -> None:     # ValidationCache
+        self.Hits=0
+        self.Misses=0
+
+
+SharedValidationCache=ValidationCache()
+
+
+#================================================================
+# A validator checks the values in columns of one Type.
+# Derived classes must override IsValid().  ValidateColumn() checks a whole column's worth of values at once;
+# it can be overridden if there's a faster way to check a batch of values than one at a time.
+class CellValidator:
+    Type: str=""    # The column Type this validator is registered for.  (Set by RegisterValidator().)
+
+    def IsValid(self, val: str) -> bool:     # CellValidator
+        raise NotImplementedError("CellValidator.IsValid() needs to be implemented in derived class.")
+
+    # The same, but remembering the results in SharedValidationCache
+    def IsValidCached(self, val: str) -> bool:     # CellValidator
+        return SharedValidationCache.IsValid(self.Type, val, self.IsValid)
+
+    # Return the indexes of the invalid values in a list of values
+    def ValidateColumn(self, values: list[str]) -> list[int]:     # CellValidator
+        results: dict[str, bool]={}
+        invalid: list[int]=[]
+        for i, val in enumerate(values):
+            ok=results.get(val)
+            if ok is None:
+                ok=results[val]=self.IsValidCached(val)
+            if not ok:
+                invalid.append(i)
+        return invalid
+
+
+# An integer, optionally limited to the range Low..High.  Empty is OK.
+class IntValidator(CellValidator):
+    def __init__(self, Low: int|None=None, High: int|None=None) -> None:
+        self.Low=Low
+        self.High=High
+
+    def IsValid(self, val: str) -> bool:     # IntValidator
+        if val == "":
+            return True
+        if not IsInt(val):
+            return False
+        if self.Low is not None and int(val) < self.Low:
+            return False
+        if self.High is not None and int(val) > self.High:
+            return False
+        return True
+
+
+class FloatValidator(CellValidator):
+    def IsValid(self, val: str) -> bool:     # FloatValidator
+        return val == "" or IsNumeric(val)
+
+
+# A month number or the name of a month or season.  Empty is OK.
+class MonthValidator(CellValidator):
+    _names: frozenset[str]=frozenset(["", "jan", "january", "feb", "february", "mar", "march", "apr",
+                                      "april", "may", "jun", "june", "jul", "july", "aug", "august",
+                                      "sep", "sept", "september", "oct", "october", "nov", "november",
+                                      "dec", "december", "fal", "fall", "autumn", "win", "winter", "spr", "spring", "sum", "summer"])
+
+    def IsValid(self, val: str) -> bool:     # MonthValidator
+        if IsInt(val):
+            return 1 <= int(val) <= 12
+        return val.lower().strip() in self._names
+
+
+class DateValidator(CellValidator):
+    def IsValid(self, val: str) -> bool:     # DateValidator
+        return val == "" or not FanzineDate().Match(val).IsEmpty()
+
+
+class DateRangeValidator(CellValidator):
+    def IsValid(self, val: str) -> bool:     # DateRangeValidator
+        return val == "" or not FanzineDateRange().Match(val).IsEmpty()
+
+
+class RequiredStrValidator(CellValidator):
+    def IsValid(self, val: str) -> bool:     # RequiredStrValidator
+        return len(val) > 0
+
+
+#================================================================
+# The registry of validators, keyed by ColDefinition.Type.  Types with no validator (e.g., "str") accept anything.
+# Applications can register validators for their own types (e.g., "isbn") or replace the built-in ones.
+# A grid looks up its columns' validators when its column headers are set, so register validators before then.
+_validators: dict[str, CellValidator]={}
+
+def RegisterValidator(coltype: str, validator: CellValidator|None) -> None:
+    if validator is None:
+        _validators.pop(coltype, None)
+    else:
+        validator.Type=coltype
+        _validators[coltype]=validator
+    SharedValidationCache.Invalidate(coltype)   # The rules for this type have changed
+
+def GetValidator(coltype: str) -> CellValidator|None:
+    return _validators.get(coltype)
+
+RegisterValidator("int", IntValidator())
+RegisterValidator("day", IntValidator(1, 31))            # Day number is out of plausible range
+RegisterValidator("year", IntValidator(1926, 2050))      # Year number is out of plausible range
+RegisterValidator("float", FloatValidator())
+RegisterValidator("month", MonthValidator())
+RegisterValidator("date", DateValidator())
+RegisterValidator("date range", DateRangeValidator())
+RegisterValidator("required str", RequiredStrValidator())
+
+
+#================================================================
+# Sort keys, keyed by ColDefinition.Type.  A sort key function turns a cell's value into (rank, key):
+#   rank 0 for values it understands, which then sort by key; rank 1 for values it doesn't, which sort after them as text;
+#   and rank 2 for empty cells, which always sort last.
+# Types without a sort key of their own sort as text, ignoring case.
+def _TextSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, ""
+    return 0, val.casefold()
+
+def _Unparsed(val: str) -> tuple:
+    return 1, val.casefold()
+
+def _IntSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, 0
+    return (0, int(val)) if IsInt(val) else _Unparsed(val)
+
+def _FloatSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, 0
+    return (0, float(val)) if IsNumeric(val) else _Unparsed(val)
+
+# Months sort in calendar order, with each season just after the month it starts in
+_monthOrder: dict[str, float]={"jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3, "apr": 4, "april": 4, "may": 5,
+                               "jun": 6, "june": 6, "jul": 7, "july": 7, "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9,
+                               "oct": 10, "october": 10, "nov": 11, "november": 11, "dec": 12, "december": 12,
+                               "spr": 3.5, "spring": 3.5, "sum": 6.5, "summer": 6.5, "fal": 9.5, "fall": 9.5, "autumn": 9.5, "win": 12.5, "winter": 12.5}
+
+def _MonthSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, 0
+    if IsInt(val):
+        return 0, int(val)
+    month=_monthOrder.get(val.lower().strip())
+    return (0, month) if month is not None else _Unparsed(val)
+
+# Parsed dates and date ranges are put in the key as they are and ordered by FanzineDate's and FanzineDateRange's own comparisons.
+# (Keys are only compared with others of the same kind: unparsable values and empty cells have different first elements.)
+def _DateSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, 0
+    date=FanzineDate().Match(val)
+    return _Unparsed(val) if date.IsEmpty() else (0, date)
+
+def _DateRangeSortKey(val: str) -> tuple:
+    if val == "":
+        return 2, 0
+    dates=FanzineDateRange().Match(val)
+    return _Unparsed(val) if dates.IsEmpty() else (0, dates)
+
+_sortKeys: dict[str, Callable[[str], tuple]]={}
+
+def RegisterSortKey(coltype: str, keyfunc: Callable[[str], tuple]|None) -> None:
+    if keyfunc is None:
+        _sortKeys.pop(coltype, None)
+    else:
+        _sortKeys[coltype]=keyfunc
+
+def GetSortKey(coltype: str) -> Callable[[str], tuple]:
+    return _sortKeys.get(coltype, _TextSortKey)
+
+RegisterSortKey("int", _IntSortKey)
+RegisterSortKey("day", _IntSortKey)
+RegisterSortKey("year", _IntSortKey)
+RegisterSortKey("float", _FloatSortKey)
+RegisterSortKey("month", _MonthSortKey)
+RegisterSortKey("date", _DateSortKey)
+RegisterSortKey("date range", _DateRangeSortKey)
+
+
+#================================================================
+# The look of a single cell: its background and text colors and how its font is modified.
+# DataGrid.GetCellStyle() decides a cell's style; it is then applied either directly to the cell or, when coloring lazily,
+# through a shared GridCellAttr.
+class FontStyle(Enum):
+    Normal=1
+    Bold=2
+    Underlined=3
+
+class CellStyle:
+    def __init__(self, Background: wx.Colour, Text: wx.Colour=Color.Black, Font: FontStyle=FontStyle.Normal) -> None:
+        self.Background=Background
+        self.Text=Text
+        self.Font=Font
+
+    # wx.Colour isn't hashable, so styles are keyed by their RGB values
+    @property
+    def Key(self) -> tuple[int, int, FontStyle]:
+        return self.Background.GetRGB(), self.Text.GetRGB(), self.Font
+
+
+#================================================================
+# A wx attr provider which styles each cell on demand, as wx paints it, using DataGrid.GetCellStyle().
+# There are only a handful of distinct styles, so cells share a small set of ref-counted GridCellAttrs
+# rather than each cell getting its own attr.
+class DataGridAttrProvider(wx.grid.GridCellAttrProvider):
+
+    def __init__(self, dataGrid: DataGrid) -> None:
+        super().__init__()
+        self._dataGrid=dataGrid
+        self._attrs: dict[tuple[int, int, FontStyle], wx.grid.GridCellAttr]={}
+
+    def GetAttr(self, row: int, col: int, kind: int) -> wx.grid.GridCellAttr|None:     # DataGridAttrProvider
+        explicit=super().GetAttr(row, col, kind)    # E.g., the span of a merged text row, or a color set by the application
+        # When the grid asks for a specific kind of attr it is about to modify it, so it must never get one of the shared attrs
+        if kind != wx.grid.GridCellAttr.Any:
+            return explicit
+
+        attr=self._SharedAttr(self._dataGrid.GetCellStyle(self._dataGrid.SourceRow(row), col))
+        if explicit is None:
+            attr.IncRef()       # The caller takes a reference
+            return attr
+        # Anything explicitly set on the cell takes precedence over its computed style
+        merged=explicit.Clone()
+        merged.MergeWith(attr)
+        explicit.DecRef()
+        return merged
+
+    def _SharedAttr(self, style: CellStyle) -> wx.grid.GridCellAttr:     # DataGridAttrProvider
+        attr=self._attrs.get(style.Key)
+        if attr is None:
+            attr=wx.grid.GridCellAttr()
+            attr.SetBackgroundColour(style.Background)
+            attr.SetTextColour(style.Text)
+            font=self._dataGrid.Grid.GetDefaultCellFont().GetBaseFont()
+            if style.Font == FontStyle.Bold:
+                font=font.Bold()
+            elif style.Font == FontStyle.Underlined:
+                font=font.Underlined()
+            attr.SetFont(font)
+            self._attrs[style.Key]=attr
+        return attr
+
+    # Drop the shared attrs, e.g. after the grid's default font has been changed
+    def InvalidateStyles(self) -> None:     # DataGridAttrProvider
+        self._attrs.clear()
+
+
 #================================================================
 # A class to store and restore a selection in the grid
+# wx keeps every selection -- rows, columns, cells -- as blocks, so that's all we store: a list of (top, left, bottom, right)
+#   ranges, with overlapping and adjoining blocks merged.  Storing and restoring cost one SelectBlock() per range rather than
+#   one SelectRow() per row, so a select-all of a big grid is no slower than selecting one cell.
+# If the datasource is supplied, the rows of each range are also remembered by RowID, so that the restored selection follows
+#   its rows even if they have been sorted or moved or rows have been inserted or deleted above them.  (The Selection must
+#   be made before the datasource is changed for that to work: see DataGrid._SnapshotSelection().)
+#   Ranges which cover all of the data rows are kept by position, and so are very large ones, which only have their top
+#   and bottom rows remembered.
 class Selection:
-    def __init__(self, grid: wx.grid.Grid):
-        self.selectedBlocks=grid.GetSelectedBlocks()
-        self.selectedCols=grid.GetSelectedCols()
-        self.selectedRows=grid.GetSelectedRows()
-        self.selectedCells=grid.GetSelectedCells()
+    _maxTrackedRows: int=10000      # Ranges of more rows than this have only their top and bottom rows remembered by RowID
+
+    def __init__(self, grid: wx.grid.Grid, datasource: GridDataSource|None=None):
+        self.selectedBlocks=self.Merge([(b.TopRow, b.LeftCol, b.BottomRow, b.RightCol) for b in grid.GetSelectedBlocks()])
+
+        self._datasource=datasource
+        if datasource is not None:
+            # For each range: None if it's kept by position, the RowIDs of its rows, or (if it's very large) a (top, bottom) pair of them
+            self._blockIDs: list[list[int|None]|tuple[int|None, int|None]|None]=[]
+            for top, _, bottom, _ in self.selectedBlocks:
+                if top <= 0 and bottom >= datasource.NumRows-1:
+                    self._blockIDs.append(None)
+                elif bottom-top+1 > self._maxTrackedRows:
+                    self._blockIDs.append((datasource.RowIDAt(top), datasource.RowIDAt(bottom)))
+                else:
+                    self._blockIDs.append([datasource.RowIDAt(irow) for irow in range(top, bottom+1)])
+
+
+    # Merge overlapping and adjoining blocks: first those spanning the same columns, then those spanning the same rows
+    @staticmethod
+    def Merge(blocks: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:      # Selection
+        merged: list[list[int]]=[]
+        for top, left, bottom, right in sorted(blocks, key=lambda b: (b[1], b[3], b[0])):
+            if merged and merged[-1][1] == left and merged[-1][3] == right and top <= merged[-1][2]+1:
+                merged[-1][2]=max(merged[-1][2], bottom)
+            else:
+                merged.append([top, left, bottom, right])
+        blocks=merged
+        merged=[]
+        for top, left, bottom, right in sorted(blocks, key=lambda b: (b[0], b[2], b[1])):
+            if merged and merged[-1][0] == top and merged[-1][2] == bottom and left <= merged[-1][3]+1:
+                merged[-1][3]=max(merged[-1][3], right)
+            else:
+                merged.append([top, left, bottom, right])
+        return [(top, left, bottom, right) for top, left, bottom, right in merged]
+
+
+    # Where is the row which was at irow when the selection was saved?
+    def _Position(self, rowID: int|None, irow: int) -> int:      # Selection
+        if rowID is None:
+            return irow
+        pos=self._datasource.RowPosition(rowID)
+        return pos if pos >= 0 else irow     # If the row has been deleted, fall back to its old position
 
 
     def Restore(self, grid: wx.grid.Grid):      # Selection
         grid.ClearSelection()
-        for row in self.selectedRows:
-            grid.SelectRow(row, addToSelected=True)
-        for col in self.selectedCols:
-            grid.SelectCol(col, addToSelected=True)
-        # The first two are mutually exclusive, so we can select without preserving previous selections.
-        # But all these remaining selections have to be additive
-        for block in self.selectedBlocks:
-            grid.SelectBlock(block.TopLeft, block.BottomRight, True)
-        # I don't know how to deal with this right now...
-        if self.selectedCells:
-            print("self.selectedCells exception")
+        blocks=self.selectedBlocks
+        if self._datasource is not None:
+            blocks=[]
+            for (top, left, bottom, right), ids in zip(self.selectedBlocks, self._blockIDs):
+                if ids is None:
+                    blocks.append((top, left, bottom, right))
+                elif isinstance(ids, tuple):
+                    top=self._Position(ids[0], top)
+                    bottom=self._Position(ids[1], bottom)
+                    blocks.append((min(top, bottom), left, max(top, bottom), right))
+                else:
+                    # Rows beyond the end of the data have no RowID and stay where they were.  Rows which have been deleted are dropped.
+                    positions=[self._datasource.RowPosition(rowID) if rowID is not None else irow for irow, rowID in zip(range(top, bottom+1), ids)]
+                    blocks.extend((start, left, end, right) for start, end in CollapseToRanges(pos for pos in positions if pos >= 0))
+            blocks=self.Merge(blocks)     # Moved rows may have brought ranges together
+
+        for top, left, bottom, right in blocks:
+            grid.SelectBlock(top, left, bottom, right, True)
 
 
     def Print(self, label: str):      # Selection
-        for block in self.selectedBlocks:
-            print(f"{label}: selected block({block.TopLeft}, {block.BottomRight})")
-        selected=self.selectedCols
-        print(f"{label}: selected cols: {selected}")
-        selected=self.selectedRows
-        print(f"{label}: selected rows: {selected}")
-        for cell in self.selectedCells:
-            print(f"{label}: selected cell({cell.x}, {cell.y})")
+        for top, left, bottom, right in self.selectedBlocks:
+            print(f"{label}: selected block(({top}, {left}), ({bottom}, {right}))")
 
 
 #================================================================
 # An abstract class defining the columns of one row of the GridDataSource
 class GridDataRowClass:
+    _lastRowID: int=0     # The most recently issued RowID
+
+    # A stable identifier for this row which doesn't change when rows are inserted, deleted or moved.
+    # It's issued the first time it is asked for, so derived classes don't need to do anything to support it.
+    @property
+    def RowID(self) -> int:
+        try:
+            return self._rowID
+        except AttributeError:
+            GridDataRowClass._lastRowID+=1
+            self._rowID=GridDataRowClass._lastRowID
+            return self._rowID
 
     # Note that *all* signature calculation takes place in the external code on the Datasource and not on the wx grid.
     def Signature(self) -> int:
@@ -269,14 +716,370 @@ class GridDataRowClass:
         raise NotImplementedError ("GridDataRowClass.append() needs to be implemented in derived class.")
 
 
+#================================================================
+# Take a collection of ints and return it as a sorted list of inclusive (first, last) runs
+#   E.g., {1, 2, 3, 7, 9, 10} -> [(1, 3), (7, 7), (9, 10)]
+def CollapseToRanges(indexes) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]]=[]
+    for i in sorted(indexes):
+        if ranges and i <= ranges[-1][1]+1:
+            ranges[-1]=(ranges[-1][0], max(i, ranges[-1][1]))
+        else:
+            ranges.append((i, i))
+    return ranges
+
+
+#================================================================
+# Where does index i end up when the block of num items starting at start is moved so that it starts at dest?
+# (This is the same block move as done by ListBlockMove() and DataGrid.MoveRows().)
+def BlockMoveIndex(i: int, start: int, num: int, dest: int) -> int:
+    if start <= i < start+num:
+        return i-start+dest
+    if dest < start and dest <= i < start:
+        return i+num
+    if dest > start and start+num <= i < dest+num:
+        return i-num
+    return i
+
+
+#================================================================
+# The set of cells where editing has been permitted in spite of the column being IsEditable.Maybe
+# Cells in rows of the datasource are recorded by the row's stable RowID, so they follow their row when rows
+# are inserted, deleted or moved and nothing needs to be renumbered.
+# Cells beyond the end of the datasource (or all cells, if there is no datasource) are recorded by row number.
+# For those, inserting or deleting rows touches only the entries for rows after the change, and moving a block
+# of rows touches only the entries for rows within the moved span.  When rows are added to the end of the datasource,
+# RowsAdded() moves their entries over to RowIDs.
+# Membership tests are O(1).
+class EditableCellIndex:
+    def __init__(self, cells: list[tuple[int, int]]|None=None, datasource: GridDataSource|None=None) -> None:
+        self._datasource=datasource
+        self._byID: dict[int, set[int]]={}     # RowID -> the editable columns in that row
+        self._cols: dict[int, set[int]]={}     # Row number -> the editable columns in that row
+        self._rows: list[int]=[]               # The keys of _cols, kept sorted
+        self._count: int=0                     # The number of entries in _cols
+        if cells is not None:
+            for cell in cells:
+                self.append(cell)
+
+    # The RowID of a row number, or None if the row is beyond the end of the datasource
+    def _RowID(self, irow: int) -> int|None:     # EditableCellIndex
+        if self._datasource is None:
+            return None
+        return self._datasource.RowIDAt(irow)
+
+    def __contains__(self, cell: tuple[int, int]) -> bool:     # EditableCellIndex
+        irow, icol=cell
+        rowID=self._RowID(irow)
+        if rowID is not None:
+            cols=self._byID.get(rowID)
+            return cols is not None and icol in cols
+        cols=self._cols.get(irow)
+        return cols is not None and icol in cols
+
+    def __len__(self) -> int:     # EditableCellIndex
+        return sum(1 for _ in self)
+
+    # Iterate over the editable cells as (row, col).  (Entries for rows which have since been deleted are skipped.)
+    def __iter__(self):     # EditableCellIndex
+        if self._byID:
+            for rowID, cols in list(self._byID.items()):
+                irow=self._datasource.RowPosition(rowID)
+                if irow >= 0:
+                    for icol in sorted(cols):
+                        yield irow, icol
+        for irow in self._rows:
+            for icol in sorted(self._cols[irow]):
+                yield irow, icol
+
+    # Drop the entries for rows which are no longer in the datasource
+    def Prune(self) -> None:     # EditableCellIndex
+        for rowID in [rowID for rowID in self._byID if self._datasource.RowPosition(rowID) < 0]:
+            del self._byID[rowID]
+
+    def append(self, cell: tuple[int, int]) -> None:     # EditableCellIndex
+        irow, icol=cell
+        rowID=self._RowID(irow)
+        if rowID is not None:
+            self._byID.setdefault(rowID, set()).add(icol)
+            return
+        cols=self._cols.get(irow)
+        if cols is None:
+            cols=self._cols[irow]=set()
+            self._rows.insert(bisect_left(self._rows, irow), irow)
+        if icol not in cols:
+            cols.add(icol)
+            self._count+=1
+
+    def remove(self, cell: tuple[int, int]) -> None:     # EditableCellIndex
+        irow, icol=cell
+        rowID=self._RowID(irow)
+        if rowID is not None and rowID in self._byID:
+            self._byID[rowID].discard(icol)
+            if not self._byID[rowID]:
+                del self._byID[rowID]
+        cols=self._cols.get(irow)
+        if cols is None or icol not in cols:
+            return
+        cols.remove(icol)
+        self._count-=1
+        if not cols:
+            del self._cols[irow]
+            del self._rows[bisect_left(self._rows, irow)]
+
+    def clear(self) -> None:     # EditableCellIndex
+        self._byID.clear()
+        self._cols.clear()
+        self._rows.clear()
+        self._count=0
+
+    # --------------------------
+    # Row insertions, deletions and moves need only renumber the entries recorded by row number.
+    # Renumber the rows in _rows[i:j] using renumber(), which must map them onto rows not used by any other entry
+    def _RenumberRows(self, i: int, j: int, renumber: Callable[[int], int]) -> None:     # EditableCellIndex
+        affected=self._rows[i:j]
+        cols=[self._cols.pop(irow) for irow in affected]
+        newrows=[renumber(irow) for irow in affected]
+        for irow, c in zip(newrows, cols):
+            self._cols[irow]=c
+        self._rows[i:j]=sorted(newrows)
+
+    def InsertRows(self, index: int, num: int) -> None:     # EditableCellIndex
+        self._RenumberRows(bisect_left(self._rows, index), len(self._rows), lambda irow: irow+num)
+
+    # Rows index..index+num-1 have just been added to the datasource.  Any entries for them were recorded by row number
+    #   (they were beyond the end when the cells were made editable), and are now recorded by RowID so they follow their rows.
+    def RowsAdded(self, index: int, num: int) -> None:     # EditableCellIndex
+        if self._datasource is None:
+            return
+        i=bisect_left(self._rows, index)
+        j=bisect_left(self._rows, min(index+num, self._datasource.NumRows))
+        for irow in self._rows[i:j]:
+            cols=self._cols.pop(irow)
+            self._count-=len(cols)
+            self._byID.setdefault(self._datasource.RowIDAt(irow), set()).update(cols)
+        del self._rows[i:j]
+
+    def DeleteRows(self, index: int, num: int) -> None:     # EditableCellIndex
+        i=bisect_left(self._rows, index)
+        j=bisect_left(self._rows, index+num)
+        for irow in self._rows[i:j]:
+            self._count-=len(self._cols.pop(irow))
+        del self._rows[i:j]
+        self._RenumberRows(i, len(self._rows), lambda irow: irow-num)
+
+    # Move the block of num rows starting at start so that it starts at dest
+    def MoveRows(self, start: int, num: int, dest: int) -> None:     # EditableCellIndex
+        lo=min(start, dest)
+        hi=max(start, dest)+num
+        self._RenumberRows(bisect_left(self._rows, lo), bisect_left(self._rows, hi), lambda irow: BlockMoveIndex(irow, start, num, dest))
+
+    # --------------------------
+    # Column changes affect every row, but there are few columns and they rarely change
+    def _RenumberCols(self, renumber: Callable[[int], int|None]) -> None:     # EditableCellIndex
+        for rowID, cols in list(self._byID.items()):
+            cols={renumber(icol) for icol in cols}-{None}
+            if cols:
+                self._byID[rowID]=cols
+            else:
+                del self._byID[rowID]
+        cells=[(irow, icol) for irow in self._rows for icol in self._cols[irow]]
+        self._cols.clear()
+        self._rows.clear()
+        self._count=0
+        for irow, icol in cells:
+            icol=renumber(icol)
+            if icol is not None:
+                self.append((irow, icol))
+
+    def InsertCols(self, index: int, num: int) -> None:     # EditableCellIndex
+        self._RenumberCols(lambda icol: icol+num if icol >= index else icol)
+
+    def DeleteCols(self, index: int, num: int) -> None:     # EditableCellIndex
+        self._RenumberCols(lambda icol: None if index <= icol < index+num else (icol-num if icol >= index+num else icol))
+
+    def MoveCols(self, start: int, num: int, dest: int) -> None:     # EditableCellIndex
+        self._RenumberCols(lambda icol: BlockMoveIndex(icol, start, num, dest))
+
+
+#================================================================
+# A record of the changes made to a GridDataSource since the wx grid was last brought up to date.
+# Structural changes are kept in the order they happened so they can be replayed on the grid.
+# Dirty row and column numbers are always in terms of the *current* datasource: recording an insertion
+# or deletion renumbers the dirty rows or columns already recorded.
+class GridChanges:
+    def __init__(self) -> None:
+        self.DirtyRows: set[int]=set()     # Rows whose cells need to be reloaded and recolored
+        self.DirtyCols: set[int]=set()     # Likewise for entire columns
+        self.Structural: list[tuple[str, int, int]]=[]     # ("insert rows"|"delete rows"|"insert cols"|"delete cols", index, count)
+
+    @property
+    def IsEmpty(self) -> bool:     # GridChanges
+        return not self.DirtyRows and not self.DirtyCols and not self.Structural
+
+    def Clear(self) -> None:     # GridChanges
+        self.DirtyRows.clear()
+        self.DirtyCols.clear()
+        self.Structural.clear()
+
+    def MarkRowsDirty(self, start: int, num: int=1) -> None:     # GridChanges
+        self.DirtyRows.update(range(start, start+num))
+
+    def MarkColsDirty(self, start: int, num: int=1) -> None:     # GridChanges
+        self.DirtyCols.update(range(start, start+num))
+
+    def RowsInserted(self, index: int, num: int) -> None:     # GridChanges
+        if num <= 0:
+            return
+        self.Structural.append(("insert rows", index, num))
+        self.DirtyRows={r+num if r >= index else r for r in self.DirtyRows}
+        self.MarkRowsDirty(index, num)
+
+    def RowsDeleted(self, index: int, num: int) -> None:     # GridChanges
+        if num <= 0:
+            return
+        self.Structural.append(("delete rows", index, num))
+        self.DirtyRows={r-num if r >= index+num else r for r in self.DirtyRows if not index <= r < index+num}
+
+    def ColsInserted(self, index: int, num: int) -> None:     # GridChanges
+        if num <= 0:
+            return
+        self.Structural.append(("insert cols", index, num))
+        self.DirtyCols={c+num if c >= index else c for c in self.DirtyCols}
+        self.MarkColsDirty(index, num)
+
+    def ColsDeleted(self, index: int, num: int) -> None:     # GridChanges
+        if num <= 0:
+            return
+        self.Structural.append(("delete cols", index, num))
+        self.DirtyCols={c-num if c >= index+num else c for c in self.DirtyCols if not index <= c < index+num}
+
+
+#================================================================
+# The refreshing which has been asked for during a DataGrid.BatchUpdate() and which will be done when it ends.
+# Partial refreshes are recorded as dirty rows and columns in the datasource's GridChanges (which keeps them correctly
+# numbered as rows and columns come and go), so all that's needed here is whether a refresh is due and whether it must be a full one.
+class PendingRefresh:
+    def __init__(self) -> None:
+        self.Clear()
+
+    def Clear(self) -> None:     # PendingRefresh
+        self.Requested: bool=False
+        self.Full: bool=False
+        self.RetainSelection: bool=True
+        self.RetainCursorPos: bool=True
+
+    def RequestFull(self, RetainSelection: bool=True, RetainCursorPos: bool=True) -> None:     # PendingRefresh
+        self.Requested=True
+        self.Full=True
+        # If any of the requests didn't want the selection or cursor kept, don't
+        self.RetainSelection=self.RetainSelection and RetainSelection
+        self.RetainCursorPos=self.RetainCursorPos and RetainCursorPos
+
+
+#================================================================
+# An inverted index of the words in each row's cells, used to filter a DataGrid's rows (see DataGrid.SetFilter()).
+# Words are kept casefolded and are found by prefix, so "sci fi" matches a row containing "Science" and "Fiction".
+# Rows are identified by RowID, so the index is unaffected by rows being moved or sorted; rows whose contents change
+#   must be passed to UpdateRow() and deleted rows to RemoveRow().
+class RowSearchIndex:
+    _wordRE=re.compile(r"\w+")
+
+    def __init__(self) -> None:
+        self._postings: dict[str, set[int]]={}      # Word -> RowIDs of the rows containing it
+        self._rowWords: dict[int, frozenset[str]]={}     # RowID -> the words in the row
+        self._sortedWords: list[str]|None=None      # All the words, sorted for prefix lookups.  Rebuilt when needed.
+        self._version: int=0        # Incremented whenever the index changes
+        self._lastSearch: tuple[int, str, list[str], set[int]]|None=None     # (version, query, words, result) of the last search
+
+    @staticmethod
+    def Words(text: str) -> list[str]:     # RowSearchIndex
+        return RowSearchIndex._wordRE.findall(text.casefold())
+
+    def __len__(self) -> int:     # RowSearchIndex
+        return len(self._rowWords)
+
+    def Clear(self) -> None:     # RowSearchIndex
+        self._postings.clear()
+        self._rowWords.clear()
+        self._sortedWords=None
+        self._version+=1
+
+    # Index (or reindex) a row given the values of its cells
+    def UpdateRow(self, rowID: int, values) -> None:     # RowSearchIndex
+        words=frozenset(self.Words(" ".join("" if val is None else str(val) for val in values)))
+        old=self._rowWords.get(rowID, frozenset())
+        if words == old:
+            return
+        for word in old-words:
+            ids=self._postings[word]
+            ids.discard(rowID)
+            if not ids:
+                del self._postings[word]
+                self._sortedWords=None
+        for word in words-old:
+            ids=self._postings.get(word)
+            if ids is None:
+                ids=self._postings[word]=set()
+                self._sortedWords=None
+            ids.add(rowID)
+        if words:
+            self._rowWords[rowID]=words
+        else:
+            self._rowWords.pop(rowID, None)
+        self._version+=1
+
+    def RemoveRow(self, rowID: int) -> None:     # RowSearchIndex
+        self.UpdateRow(rowID, [])
+
+    # The RowIDs of the rows containing a word starting with each of the query's words.  None if the query has no words.
+    def Search(self, query: str) -> set[int]|None:     # RowSearchIndex
+        allWords=self.Words(query)
+        if not allWords:
+            return None
+
+        # If the query only adds to the last one (as it does while it's being typed), the last result already satisfies the words
+        #   the two have in common, so only the new words need to be looked up
+        last=self._lastSearch
+        if last is not None and last[0] == self._version and query.casefold().startswith(last[1]):
+            result=last[3]
+            words=[word for word in allWords if word not in last[2]]
+        else:
+            result=None
+            words=allWords
+        for word in sorted(set(words), key=len, reverse=True):      # Longer words usually match fewer rows
+            if result is not None and not result:
+                break
+            ids=self._RowsWithPrefix(word)
+            result=ids if result is None else result & ids
+        self._lastSearch=(self._version, query.casefold(), allWords, result)
+        return result
+
+    def _RowsWithPrefix(self, prefix: str) -> set[int]:     # RowSearchIndex
+        if self._sortedWords is None:
+            self._sortedWords=sorted(self._postings)
+        words=self._sortedWords
+        first=bisect_left(words, prefix)
+        last=bisect_right(words, prefix+"\U0010ffff", first)
+        if last-first == 1:
+            return set(self._postings[words[first]])
+        ids: set[int]=set()
+        for word in words[first:last]:
+            ids|=self._postings[word]
+        return ids
+
+
 #================================================================
 # An abstract class which defines the structure of a data source for the Grid class
 class GridDataSource():
 
     def __init__(self):     # GridDataSource() abstract class
         self._colDefs: ColDefinitionsList=ColDefinitionsList([])
-        self._allowCellEdits: list[tuple[int, int]]=[]     # A list of cells where editing has been permitted by overriding an IsEditable.Maybe for the col
+        self._allowCellEdits: EditableCellIndex=EditableCellIndex(datasource=self)     # The cells where editing has been permitted by overriding an IsEditable.Maybe for the col
         self._gridDataRowClass: type[GridDataRowClass]|None=None
+        self._changes: GridChanges=GridChanges()     # What has changed since the grid was last refreshed
+        self._rowPositions: dict[int, int]={}       # RowID -> row number.  See RowPosition()
+        self._rowPositionsLastID: int=-1            # The last RowID issued when _rowPositions was built (-1 means it must be rebuilt)
         # self.Rows must be supplied by the derived class
 
 
@@ -291,17 +1094,59 @@ class GridDataSource():
     def ColDefs(self, cds: ColDefinitionsList):     # GridDataSource() abstract class
         self._colDefs=cds
 
+    # The changes made since the grid was last refreshed.  Code which changes the datasource's structure records it here
+    # so that DataGrid.RefreshWxGridFromChanges() can update just the affected parts of the grid.
+    @property
+    def Changes(self) -> GridChanges:     # GridDataSource() abstract class
+        return self._changes
+
     @property
     def ColHeaders(self) -> list[str]:     # GridDataSource() abstract class
         return [l.Name for l in self.ColDefs]
 
     @property
-    def AllowCellEdits(self) -> list[tuple[int, int]]:     # GridDataSource() abstract class
+    def AllowCellEdits(self) -> EditableCellIndex:     # GridDataSource() abstract class
         return self._allowCellEdits
     @AllowCellEdits.setter
-    def AllowCellEdits(self, val: list[tuple[int, int]]) -> None:     # GridDataSource() abstract class
+    def AllowCellEdits(self, val: EditableCellIndex|list[tuple[int, int]]) -> None:     # GridDataSource() abstract class
+        if not isinstance(val, EditableCellIndex):
+            val=EditableCellIndex(val, datasource=self)
         self._allowCellEdits=val
 
+    # --------------------------------------------------------
+    # Each row has a stable RowID (see GridDataRowClass.RowID).  Per-row information which must follow its row
+    # (editing permissions, the selection, etc.) is recorded by RowID and converted to and from row numbers here.
+    def RowIDAt(self, irow: int) -> int|None:     # GridDataSource() abstract class
+        if 0 <= irow < self.NumRows:
+            return self.Rows[irow].RowID
+        return None
+
+    # The row number of the row with this RowID, or -1 if there is no such row
+    # The RowID->row number map is checked on each lookup and rebuilt if it has gone stale, so it stays correct no matter
+    # how the derived class modifies Rows.  Code which moves rows can keep it current with NoteRowsMoved().
+    def RowPosition(self, rowID: int) -> int:     # GridDataSource() abstract class
+        irow=self._rowPositions.get(rowID)
+        if irow is not None:
+            if irow < self.NumRows and self.Rows[irow].RowID == rowID:
+                return irow
+        elif rowID <= self._rowPositionsLastID:
+            return -1   # The map is complete for every row whose ID had been issued when it was built, so the row is gone
+
+        self._rowPositions={row.RowID: i for i, row in enumerate(self.Rows)}
+        self._rowPositionsLastID=GridDataRowClass._lastRowID
+        return self._rowPositions.get(rowID, -1)
+
+    # Rows start..end-1 have been rearranged among themselves.  Update just their entries in the RowID->row number map.
+    def NoteRowsMoved(self, start: int, end: int) -> None:     # GridDataSource() abstract class
+        rows=self.Rows
+        for irow in range(start, end):
+            self._rowPositions[rows[irow].RowID]=irow
+
+    # Force the RowID->row number map to be rebuilt.  (Needed only if rows which were once removed are put back.)
+    def InvalidateRowPositions(self) -> None:     # GridDataSource() abstract class
+        self._rowPositionsLastID=-1
+        self._rowPositions.clear()
+
     @property
     def TextAndHrefCols(self) -> tuple[int, int]:
         raise AttributeError("GridDataSource.TextAndHrefCols getter should never be called.")
@@ -329,11 +1174,38 @@ class GridDataSource():
 
     def AppendEmptyRows(self, num: int = 1) -> list:
         self.InsertEmptyRows(self.NumRows, num)
+        self._changes.RowsInserted(self.NumRows-num, num)
+        self.AllowCellEdits.RowsAdded(self.NumRows-num, num)
         return self.Rows[self.NumRows-num:]     # Return the list of newly-added rows
 
     def InsertEmptyRows(self, insertat: int, num: int=1) -> None:
         raise NotImplementedError ("GridDataSource.InsertEmptyRows base class InsertEmptyRows should never be called.")
 
+    # Store a block of values (a list of rows of cell values) with its upper-left corner at (top, left).  The rows and columns must already exist.
+    # This goes cell by cell; override it if the datasource can store a block more efficiently.
+    def SetBlock(self, top: int, left: int, values: list[list[str]]) -> None:
+        for irow, vals in enumerate(values, start=top):
+            row=self[irow]
+            for icol, val in enumerate(vals, start=left):
+                row[icol]=val
+        self._changes.MarkRowsDirty(top, len(values))
+
+    # Move the block of num rows starting at start so that it starts at dest.
+    # Only the span of rows between the block's old and new positions is touched: it is rotated in place.
+    def MoveRowBlock(self, start: int, num: int, dest: int) -> None:
+        if num <= 0 or start == dest:
+            return
+        rows=self.Rows
+        lo=min(start, dest)
+        hi=max(start, dest)+num
+        if dest < start:
+            rows[lo:hi]=rows[start:start+num]+rows[dest:start]
+        else:
+            rows[lo:hi]=rows[start+num:dest+num]+rows[start:start+num]
+        if self.Rows is not rows:
+            self.Rows=rows      # The derived class handed us a copy of its rows rather than the list itself
+        self.NoteRowsMoved(lo, hi)
+
     @property
     def CanAddColumns(self) -> bool:
         return False            # Override this if adding columns is allowed
@@ -349,14 +1221,7 @@ class GridDataSource():
 
     # Fnd the index of a possible header in the column header. -1 in not found
     def ColHeaderIndex(self, s: str, CaseSensitive=False) -> int:
-        if CaseSensitive:
-            if s in self.ColHeaders:
-                return self.ColHeaders.index(s)
-        else:
-            temp=[header.lower() for header in self.ColHeaders]
-            if s.lower() in temp:
-                return temp.index(s.lower())
-        return -1
+        return self.ColDefs.IndexOfName(s, CaseSensitive)
 
 
     # Insert a new column header.  NOTE: This does not insert the column in the data
@@ -382,25 +1247,45 @@ class GridDataSource():
         if index == -1:
             for row in self.Rows:
                 row.append("")
+            self._changes.ColsInserted(self.NumCols-1, 1)
             return
 
         for row in self.Rows:
             row.Cells=row.Cells[:index]+[""]+row.Cells[index:]
+        self._allowCellEdits.InsertCols(index, 1)
+        self._changes.ColsInserted(index, 1)
 
 
     def DeleteColumn(self, index: int) -> None:
         self._colDefs=self._colDefs[:index]+self._colDefs[index+1:]
         for row in self.Rows:
             row.Cells=row.Cells[:index]+row.Cells[index+1:]
+        self._allowCellEdits.DeleteCols(index, 1)
+        self._changes.ColsDeleted(index, 1)
+
+
+    # Delete num columns starting at index.  The data is deleted row-by-row using GridDataRowClass.DelCol()
+    def DeleteColumns(self, index: int, num: int=1) -> None:
+        if num <= 0:
+            return
+        icols=index if num == 1 else slice(index, index+num)
+        del self._colDefs[icols]
+        for row in self.Rows:
+            row.DelCol(icols)
+        self._allowCellEdits.DeleteCols(index, num)
+        self._changes.ColsDeleted(index, num)
 
 
     def MoveColumns(self, index: int, num: int, targetIndex: int) -> None:
         assert targetIndex < self.NumCols and targetIndex >= 0
 
         self._colDefs.List=ListBlockMove(self._colDefs.List, index, num, targetIndex)
-        self._allowCellEdits=ListBlockMove(self._allowCellEdits, index, num, targetIndex)
+        self._allowCellEdits.MoveCols(index, num, targetIndex)
         for row in self.Rows:
             row.Cells=ListBlockMove(row.Cells, index, num, targetIndex)
+        # Every column between the block's old and new positions has changed
+        first=min(index, targetIndex)
+        self._changes.MarkColsDirty(first, max(index, targetIndex)+num-first)
 
 
     # Take a box of cols/col indexes such as used in a selection: (top, left, bottom, right)
@@ -425,11 +1310,1081 @@ class GridDataSource():
         return
 
 
+#================================================================
+# Undo and redo.  Each change made through DataGrid is recorded in its UndoLog as an UndoEntry holding just what is needed
+#   to reverse it and make it again: the old and new values of edited cells, the row objects of inserted or deleted rows,
+#   the parameters of a block move, and so on -- never a copy of the whole datasource.
+# Cells are recorded by RowID, so undoing an edit still finds its cell after rows have been moved or sorted.
+# The entries make their changes through the DataGrid and datasource methods, so they're recorded in the datasource's Changes
+#   and undoing or redoing needs only a RefreshWxGridFromChanges().
+
+# A rough count of the bytes taken by a block of cell values
+def _ApproxBytes(values: list[list]) -> int:
+    return sum(56+sum(len(val)+8 if isinstance(val, str) else 24 for val in row) for row in values)
+
+
+class UndoEntry:
+    Bytes: int=64
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # UndoEntry
+        raise NotImplementedError("UndoEntry.Undo() needs to be implemented in derived class.")
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # UndoEntry
+        raise NotImplementedError("UndoEntry.Redo() needs to be implemented in derived class.")
+
+    # Absorb the entry recorded next, if the two can be undone as one.  Return True if it was absorbed.
+    def Merge(self, other: UndoEntry) -> bool:     # UndoEntry
+        return False
+
+
+# Cells were changed.  Old and New are lists of rows of values, starting in column Left of the rows with these RowIDs.
+class CellsEdit(UndoEntry):
+    def __init__(self, rowIDs: list[int], left: int, old: list[list], new: list[list]) -> None:
+        self.RowIDs=rowIDs
+        self.Left=left
+        self.Old=old
+        self.New=new
+        self.Bytes=_ApproxBytes(old)+_ApproxBytes(new)+8*len(rowIDs)
+
+    def _Set(self, dataGrid: DataGrid, values: list[list]) -> None:     # CellsEdit
+        ds=dataGrid.Datasource
+        for rowID, vals in zip(self.RowIDs, values):
+            irow=ds.RowPosition(rowID)
+            if irow < 0:
+                continue
+            row=ds[irow]
+            for icol, val in enumerate(vals, start=self.Left):
+                row[icol]=val
+            ds.Changes.MarkRowsDirty(irow)
+            dataGrid._IndexRows(irow, irow)
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # CellsEdit
+        self._Set(dataGrid, self.Old)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # CellsEdit
+        self._Set(dataGrid, self.New)
+
+
+# Rows were inserted or deleted at Index.  The row objects themselves are kept, so putting them back restores their contents and RowIDs.
+class RowsChange(UndoEntry):
+    def __init__(self, index: int, rows: list[GridDataRowClass], inserted: bool, numCols: int) -> None:
+        self.Index=index
+        self.Rows=rows
+        self.Inserted=inserted
+        # Inserted rows' cells belong to the datasource until the insertion is undone, and the entry then moves to the redo stack
+        self.Bytes=64+8*len(rows) if inserted else 64+_ApproxBytes([[row[icol] for icol in range(numCols)] for row in rows])
+
+    def _Remove(self, dataGrid: DataGrid) -> None:     # RowsChange
+        dataGrid.DeleteRows(self.Index, len(self.Rows))
+
+    def _Restore(self, dataGrid: DataGrid) -> None:     # RowsChange
+        dataGrid._InsertRowObjects(self.Index, self.Rows)
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # RowsChange
+        self._Remove(dataGrid) if self.Inserted else self._Restore(dataGrid)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # RowsChange
+        self._Restore(dataGrid) if self.Inserted else self._Remove(dataGrid)
+
+
+# A block of Num rows was moved from Start to Dest.  A run of moves of the same block (e.g., by the arrow keys) is one entry.
+class RowsMove(UndoEntry):
+    def __init__(self, start: int, num: int, dest: int) -> None:
+        self.Start=start
+        self.Num=num
+        self.Dest=dest
+
+    def _Move(self, dataGrid: DataGrid, start: int, dest: int) -> None:     # RowsMove
+        dataGrid.MoveRows(start, self.Num, dest)
+        lo=min(start, dest)
+        dataGrid.Datasource.Changes.MarkRowsDirty(lo, max(start, dest)+self.Num-lo)
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # RowsMove
+        self._Move(dataGrid, self.Dest, self.Start)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # RowsMove
+        self._Move(dataGrid, self.Start, self.Dest)
+
+    def Merge(self, other: UndoEntry) -> bool:     # RowsMove
+        if type(other) is type(self) and other.Num == self.Num and other.Start == self.Dest:
+            self.Dest=other.Dest
+            return True
+        return False
+
+
+# The rows were put into a new order (e.g., by sorting).  The orders are lists of RowIDs.
+class RowsReorder(UndoEntry):
+    def __init__(self, oldOrder: list[int], newOrder: list[int]) -> None:
+        self.OldOrder=oldOrder
+        self.NewOrder=newOrder
+        self.Bytes=64+16*len(oldOrder)
+
+    @staticmethod
+    def _Reorder(dataGrid: DataGrid, order: list[int]) -> None:     # RowsReorder
+        ds=dataGrid.Datasource
+        byID={row.RowID: row for row in ds.Rows}
+        rows=[byID.pop(rowID) for rowID in order if rowID in byID]
+        rows.extend(row for row in ds.Rows if row.RowID in byID)     # Any rows added since go at the end
+        ds.Rows=rows
+        ds.InvalidateRowPositions()
+        ds.Changes.MarkRowsDirty(0, len(rows))
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # RowsReorder
+        self._Reorder(dataGrid, self.OldOrder)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # RowsReorder
+        self._Reorder(dataGrid, self.NewOrder)
+
+
+# The rows holding cells in columns icol..icol+num-1 and their values there.
+# A ColumnarRow's cells are in the datasource's column lists, so deleted rows which are still held (e.g., by an UndoLog) lose
+#   their cells along with the columns, too, and must be included.
+def _ColumnCells(ds: GridDataSource, icol: int, num: int) -> tuple[list[GridDataRowClass], list[list]]:
+    rows=list(ds.Rows)
+    if isinstance(ds, ColumnarGridDataSource):
+        rows+=ds.DetachedRows()
+    return rows, [[row[i] for i in range(icol, icol+num)] for row in rows]
+
+
+# Columns were inserted or deleted at Index.  Whenever they are removed, their cells are kept along with their rows so they can be put back.
+# (The rows are kept as objects rather than RowIDs since they may include deleted rows held by other entries.)
+class ColumnsChange(UndoEntry):
+    def __init__(self, index: int, coldefs: list[ColDefinition], inserted: bool, rows: list[GridDataRowClass]|None=None, values: list[list]|None=None) -> None:
+        self.Index=index
+        self.ColDefs=coldefs
+        self.Inserted=inserted
+        self.Rows=rows or []
+        self.Values=values or []
+        self.Bytes=64*(1+len(coldefs))+_ApproxBytes(self.Values)+8*len(self.Rows)
+
+    def _Remove(self, dataGrid: DataGrid) -> None:     # ColumnsChange
+        ds=dataGrid.Datasource
+        self.Rows, self.Values=_ColumnCells(ds, self.Index, len(self.ColDefs))
+        ds.DeleteColumns(self.Index, len(self.ColDefs))
+        dataGrid._IndexRows(0, ds.NumRows-1)
+
+    def _Restore(self, dataGrid: DataGrid) -> None:     # ColumnsChange
+        ds=dataGrid.Datasource
+        for i, coldef in enumerate(self.ColDefs):
+            ds.InsertColumn2(self.Index+i, coldef)
+        for row, vals in zip(self.Rows, self.Values):
+            for icol, val in enumerate(vals, start=self.Index):
+                row[icol]=val
+        if self.Inserted:
+            self.Rows, self.Values=[], []       # They're in the datasource again
+        dataGrid._IndexRows(0, ds.NumRows-1)
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # ColumnsChange
+        self._Remove(dataGrid) if self.Inserted else self._Restore(dataGrid)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # ColumnsChange
+        self._Restore(dataGrid) if self.Inserted else self._Remove(dataGrid)
+
+
+# A block of Num columns was moved from Start to Dest
+class ColumnsMove(RowsMove):
+    def _Move(self, dataGrid: DataGrid, start: int, dest: int) -> None:     # ColumnsMove
+        dataGrid.Datasource.MoveColumns(start, self.Num, dest)
+
+
+# A column was renamed
+class ColumnRename(UndoEntry):
+    def __init__(self, coldef: ColDefinition, oldName: str, newName: str) -> None:
+        self.ColDef=coldef
+        self.OldName=oldName
+        self.NewName=newName
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # ColumnRename
+        self.ColDef.Name=self.OldName
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # ColumnRename
+        self.ColDef.Name=self.NewName
+
+
+# Several entries to be undone and redone as one
+class UndoGroup(UndoEntry):
+    def __init__(self, entries: list[UndoEntry]) -> None:
+        self.Entries=entries
+        self.Bytes=sum(entry.Bytes for entry in entries)
+
+    def Undo(self, dataGrid: DataGrid) -> None:     # UndoGroup
+        for entry in reversed(self.Entries):
+            entry.Undo(dataGrid)
+
+    def Redo(self, dataGrid: DataGrid) -> None:     # UndoGroup
+        for entry in self.Entries:
+            entry.Redo(dataGrid)
+
+
+# The undo and redo stacks.  When the undo entries take more than MaxBytes, the oldest are forgotten.
+class UndoLog:
+    def __init__(self, MaxBytes: int=64_000_000) -> None:
+        self.MaxBytes=MaxBytes
+        self._undo: deque[UndoEntry]=deque()
+        self._redo: list[UndoEntry]=[]
+        self._bytes: int=0
+        self._group: list[UndoEntry]=[]
+        self._groupDepth: int=0
+        self._suspended: int=0
+
+    @property
+    def CanUndo(self) -> bool:     # UndoLog
+        return len(self._undo) > 0
+
+    @property
+    def CanRedo(self) -> bool:     # UndoLog
+        return len(self._redo) > 0
+
+    @property
+    def Bytes(self) -> int:     # UndoLog
+        return self._bytes
+
+    def Clear(self) -> None:     # UndoLog
+        self._undo.clear()
+        self._redo.clear()
+        self._bytes=0
+
+    @property
+    def IsRecording(self) -> bool:     # UndoLog
+        return self._suspended == 0
+
+    def Record(self, entry: UndoEntry) -> None:     # UndoLog
+        if self._suspended > 0:
+            return
+        if self._groupDepth > 0:
+            self._group.append(entry)
+            return
+        self._redo.clear()
+        if self._undo and self._undo[-1].Merge(entry):
+            return
+        self._undo.append(entry)
+        self._bytes+=entry.Bytes
+        self._Trim()
+
+    # Forget the oldest undo entries until they fit in MaxBytes (but always keep the newest)
+    def _Trim(self) -> None:     # UndoLog
+        while self._bytes > self.MaxBytes and len(self._undo) > 1:
+            self._bytes-=self._undo.popleft().Bytes
+
+    # Everything recorded within a "with undoLog.Group():" block is undone and redone as one entry
+    @contextmanager
+    def Group(self):
+        self._groupDepth+=1
+        try:
+            yield
+        finally:
+            self._groupDepth-=1
+            if self._groupDepth == 0 and self._group:
+                entries=self._group
+                self._group=[]
+                self.Record(entries[0] if len(entries) == 1 else UndoGroup(entries))
+
+    # Nothing is recorded within a "with undoLog.Suspended():" block
+    @contextmanager
+    def Suspended(self):
+        self._suspended+=1
+        try:
+            yield
+        finally:
+            self._suspended-=1
+
+    def Undo(self, dataGrid: DataGrid) -> bool:     # UndoLog
+        if not self._undo:
+            return False
+        entry=self._undo.pop()
+        self._bytes-=entry.Bytes
+        with self.Suspended():
+            entry.Undo(dataGrid)
+        self._redo.append(entry)
+        return True
+
+    def Redo(self, dataGrid: DataGrid) -> bool:     # UndoLog
+        if not self._redo:
+            return False
+        entry=self._redo.pop()
+        with self.Suspended():
+            entry.Redo(dataGrid)
+        self._undo.append(entry)
+        self._bytes+=entry.Bytes
+        self._Trim()
+        return True
+
+
+#================================================================
+# A row of a ColumnarGridDataSource.  It holds no cells of its own: it is a view onto its slot in each of the
+# datasource's column lists, so that DataGrid and other code can go on treating the data row by row.
+class ColumnarRow(GridDataRowClass):
+    def __init__(self, datasource: ColumnarGridDataSource, slot: int):
+        self._datasource=datasource
+        self._slot=slot     # The index of this row's cells in each of the datasource's column lists
+
+    def Signature(self) -> int:     # ColumnarRow(GridDataRowClass)
+        return hash(tuple(self.Cells))
+
+    @property
+    def Cells(self) -> list[str]:     # ColumnarRow(GridDataRowClass)
+        slot=self._slot
+        return [col[slot] for col in self._datasource._columns]
+    @Cells.setter
+    def Cells(self, cells: list[str]) -> None:     # ColumnarRow(GridDataRowClass)
+        slot=self._slot
+        for i, col in enumerate(self._datasource._columns):
+            col[slot]=cells[i] if i < len(cells) else ""
+
+    # Get or set a value by name or column number
+    def __getitem__(self, index: str|int|slice) -> str|list[str]:     # ColumnarRow(GridDataRowClass)
+        if isinstance(index, str):
+            index=self._datasource.ColDefs.index(index)
+        if isinstance(index, slice):
+            return [col[self._slot] for col in self._datasource._columns[index]]
+        return self._datasource._columns[index][self._slot]
+
+    def __setitem__(self, index: str|int|slice, value: str|int|bool) -> None:     # ColumnarRow(GridDataRowClass)
+        if isinstance(index, str):
+            index=self._datasource.ColDefs.index(index)
+        if isinstance(index, slice):
+            for col, val in zip(self._datasource._columns[index], value):
+                col[self._slot]=val
+            return
+        self._datasource._columns[index][self._slot]=value
+
+    @property
+    def IsEmptyRow(self) -> bool:     # ColumnarRow(GridDataRowClass)
+        slot=self._slot
+        return all(col[slot] == "" or col[slot] is None for col in self._datasource._columns)
+
+    # Columns can only be deleted for all rows at once.  Use ColumnarGridDataSource.DeleteColumns()
+    def DelCol(self, icol) -> None:     # ColumnarRow(GridDataRowClass)
+        raise NotImplementedError("ColumnarRow.DelCol(): use ColumnarGridDataSource.DeleteColumns() instead.")
+
+    # Called after a new column header has been appended to the datasource's ColDefs
+    def append(self, val):     # ColumnarRow(GridDataRowClass)
+        self._datasource._MatchColumnsToColDefs()
+        self._datasource._columns[-1][self._slot]=val
+
+
+#================================================================
+# A concrete GridDataSource which stores each column's cells as a list of its own rather than storing each row's cells.
+# Inserting, deleting and moving columns then rearranges the list of columns -- O(columns) -- rather than rebuilding every row.
+# The rows are ColumnarRow views, each of which owns one slot (index) in all the column lists.  Moving, inserting and
+#   deleting rows moves the views around and never touches the cells.
+# Columns should be added and removed using the datasource's methods (InsertColumn2(), DeleteColumn(), DeleteColumns(),
+#   MoveColumns()) or by appending to ColDefs, and not by editing ColDefs in place.
+class ColumnarGridDataSource(GridDataSource):
+    def __init__(self, coldefs: ColDefinitionsList|None=None, rows: list[list[str]]|None=None):
+        super().__init__()
+        self._gridDataRowClass=ColumnarRow
+        if coldefs is not None:
+            self._colDefs=coldefs
+        self._columns: list[list[str]]=[[] for _ in range(len(self._colDefs))]     # _columns[icol][slot]
+        self._numSlots: int=0       # The length of every column list.  (Kept separately, since there may be no columns.)
+        self._rows: list[ColumnarRow]=[]     # The rows in display order
+        self._views: weakref.WeakSet[ColumnarRow]=weakref.WeakSet()     # Every live view, including deleted rows still held elsewhere (e.g., by an UndoLog)
+        if rows:
+            self.AppendRowValues(rows)
+
+    @property
+    def ColDefs(self) -> ColDefinitionsList:     # ColumnarGridDataSource(GridDataSource)
+        return self._colDefs
+    @ColDefs.setter
+    def ColDefs(self, cds: ColDefinitionsList):     # ColumnarGridDataSource(GridDataSource)
+        self._colDefs=cds
+        self._MatchColumnsToColDefs()
+
+    # Add or drop columns at the right so there is exactly one column list per column definition
+    def _MatchColumnsToColDefs(self) -> None:     # ColumnarGridDataSource(GridDataSource)
+        if len(self._columns) > len(self._colDefs):
+            del self._columns[len(self._colDefs):]
+        while len(self._columns) < len(self._colDefs):
+            self._columns.append([""]*self._numSlots)
+
+    @property
+    def NumRows(self) -> int:     # ColumnarGridDataSource(GridDataSource)
+        return len(self._rows)
+
+    def __getitem__(self, index: int) -> ColumnarRow:     # ColumnarGridDataSource(GridDataSource)
+        return self._rows[index]
+
+    # Copy the values of row into the row at index
+    def __setitem__(self, index: int, row: GridDataRowClass) -> None:     # ColumnarGridDataSource(GridDataSource)
+        dest=self._rows[index]
+        if row is not dest:
+            dest.Cells=[row[icol] for icol in range(self.NumCols)]
+
+    @property
+    def Rows(self) -> list[ColumnarRow]:     # ColumnarGridDataSource(GridDataSource)
+        return self._rows
+    @Rows.setter
+    def Rows(self, rows: list[GridDataRowClass]) -> None:     # ColumnarGridDataSource(GridDataSource)
+        # Our own rows are kept as-is.  Any others get new slots and have their values copied in.
+        newrows=[]
+        for row in rows:
+            if not isinstance(row, ColumnarRow) or row._datasource is not self:
+                values=[row[icol] for icol in range(self.NumCols)]
+                row=self._NewRows(1)[0]
+                row.Cells=values
+            newrows.append(row)
+        self._rows=newrows
+        self._CompactIfWasteful()
+
+    # Add rows given as lists of cell values
+    def AppendRowValues(self, rows: list[list[str]]) -> None:     # ColumnarGridDataSource(GridDataSource)
+        self._MatchColumnsToColDefs()
+        first=self._numSlots
+        for icol, col in enumerate(self._columns):
+            col.extend(row[icol] if icol < len(row) else "" for row in rows)
+        self._numSlots+=len(rows)
+        newrows=[ColumnarRow(self, slot) for slot in range(first, first+len(rows))]
+        self._views.update(newrows)
+        self._rows.extend(newrows)
+        self.AllowCellEdits.RowsAdded(len(self._rows)-len(rows), len(rows))
+
+    # Allocate num new slots (filled with empty cells) and return views onto them
+    def _NewRows(self, num: int) -> list[ColumnarRow]:     # ColumnarGridDataSource(GridDataSource)
+        self._MatchColumnsToColDefs()
+        first=self._numSlots
+        for col in self._columns:
+            col.extend([""]*num)
+        self._numSlots+=num
+        newrows=[ColumnarRow(self, slot) for slot in range(first, first+num)]
+        self._views.update(newrows)
+        return newrows
+
+    def InsertEmptyRows(self, insertat: int, num: int=1) -> None:     # ColumnarGridDataSource(GridDataSource)
+        if num <= 0:
+            return
+        self._CompactIfWasteful()
+        self._rows[insertat:insertat]=self._NewRows(num)
+
+    # Store the block a column at a time
+    def SetBlock(self, top: int, left: int, values: list[list[str]]) -> None:     # ColumnarGridDataSource(GridDataSource)
+        if not values:
+            return
+        slots=[row._slot for row in self._rows[top:top+len(values)]]
+        width=max(len(vals) for vals in values)
+        for i, col in enumerate(self._columns[left:left+width]):
+            for slot, vals in zip(slots, values):
+                if i < len(vals):
+                    col[slot]=vals[i]
+        self._changes.MarkRowsDirty(top, len(values))
+
+    # Deleting rows leaves their cells behind in the column lists.  When the dead cells outnumber the live ones,
+    # copy the live rows' cells into fresh lists and renumber their slots.
+    # A deleted row whose view is still held somewhere (e.g., by an UndoLog, so it can be put back) is still live.
+    def _CompactIfWasteful(self) -> None:     # ColumnarGridDataSource(GridDataSource)
+        if self._numSlots > 2*len(self._views)+1000:
+            self.Compact()
+
+    def Compact(self) -> None:     # ColumnarGridDataSource(GridDataSource)
+        views=self._rows+self.DetachedRows()
+        slots=[row._slot for row in views]
+        self._columns=[[col[slot] for slot in slots] for col in self._columns]
+        self._numSlots=len(slots)
+        for i, row in enumerate(views):
+            row._slot=i
+
+    # The views of deleted rows which are still held somewhere
+    def DetachedRows(self) -> list[ColumnarRow]:     # ColumnarGridDataSource(GridDataSource)
+        inuse={id(row) for row in self._rows}
+        return [row for row in self._views if id(row) not in inuse]
+
+    @property
+    def CanAddColumns(self) -> bool:     # ColumnarGridDataSource(GridDataSource)
+        return True
+
+    # --------------------------------------------------------
+    # Column operations.  These rearrange the list of columns and never touch the rows.
+    def InsertColumn2(self, index: int, cdef: str|ColDefinition) -> None:     # ColumnarGridDataSource(GridDataSource)
+        self._MatchColumnsToColDefs()
+        self.InsertColumnHeader(index, cdef)
+        newcol=[""]*self._numSlots
+        if index == -1:
+            self._columns.append(newcol)
+            self._changes.ColsInserted(self.NumCols-1, 1)
+            return
+        self._columns.insert(index, newcol)
+        self._allowCellEdits.InsertCols(index, 1)
+        self._changes.ColsInserted(index, 1)
+
+    def DeleteColumn(self, index: int) -> None:     # ColumnarGridDataSource(GridDataSource)
+        self.DeleteColumns(index, 1)
+
+    def DeleteColumns(self, index: int, num: int=1) -> None:     # ColumnarGridDataSource(GridDataSource)
+        if num <= 0:
+            return
+        self._MatchColumnsToColDefs()
+        del self._colDefs[index:index+num]
+        del self._columns[index:index+num]
+        self._allowCellEdits.DeleteCols(index, num)
+        self._changes.ColsDeleted(index, num)
+
+    def MoveColumns(self, index: int, num: int, targetIndex: int) -> None:     # ColumnarGridDataSource(GridDataSource)
+        assert targetIndex < self.NumCols and targetIndex >= 0
+
+        self._MatchColumnsToColDefs()
+        self._colDefs.List=ListBlockMove(self._colDefs.List, index, num, targetIndex)
+        self._columns=ListBlockMove(self._columns, index, num, targetIndex)
+        self._allowCellEdits.MoveCols(index, num, targetIndex)
+        first=min(index, targetIndex)
+        self._changes.MarkColsDirty(first, max(index, targetIndex)+num-first)
+
+
+#================================================================
+# Clipboard formats.  A block of cells is a list of rows, each a list of cell values.
+
+# Write cells as tab-separated text, the format spreadsheets put on (and take from) the clipboard.
+# Values containing tabs, newlines or quotes are quoted.
+def CellsToTSV(cells: list[list[str]]) -> str:
+    buf=io.StringIO()
+    writer=csv.writer(buf, delimiter="\t", lineterminator="\n")
+    for row in cells:
+        writer.writerow("" if val is None else val for val in row)
+    return buf.getvalue()
+
+# Read tab-separated text into cells
+def TSVToCells(text: str) -> list[list[str]]:
+    if '"' not in text:
+        # Nothing is quoted (by far the commonest case), so the lines and cells can simply be split
+        # (Not by splitlines(), which also breaks lines at form feeds, \x1c-\x1e, \u2028 and so on, all of which can be in a cell.)
+        lines=text.replace("\r\n", "\n").split("\n")
+        if lines[-1] == "":
+            del lines[-1]
+        return [line.split("\t") for line in lines]
+    return [row for row in csv.reader(io.StringIO(text, newline=""), delimiter="\t")]
+
+# Write cells as an HTML table, which word processors and the like will paste as a table
+def CellsToHTML(cells: list[list[str]]) -> str:
+    buf=io.StringIO()
+    buf.write("<table>\n")
+    for row in cells:
+        buf.write("<tr>")
+        for val in row:
+            buf.write("<td>")
+            buf.write(html.escape("" if val is None else str(val)))
+            buf.write("</td>")
+        buf.write("</tr>\n")
+    buf.write("</table>\n")
+    return buf.getvalue()
+
+
+#================================================================
+# A wx grid table which reads and writes cell values straight from a DataGrid's GridDataSource.
+# When a DataGrid is in virtual mode the wx grid holds no copy of the data: wx asks this table for each
+# value as it paints, so refreshing only requires telling the grid how big the table now is.
+class DataSourceGridTable(wx.grid.GridTableBase):
+
+    def __init__(self, dataGrid: DataGrid) -> None:
+        super().__init__()
+        self._dataGrid=dataGrid
+        # The number of rows and columns the wx grid has been told about.
+        # These only change via the Notify... methods, which keep the grid in step with them.
+        self._numRows: int=0
+        self._numCols: int=0
+
+    def GetNumberRows(self) -> int:     # DataSourceGridTable
+        return self._numRows
+
+    def GetNumberCols(self) -> int:     # DataSourceGridTable
+        return self._numCols
+
+    def IsEmptyCell(self, row: int, col: int) -> bool:     # DataSourceGridTable
+        return self.GetValue(row, col) == ""
+
+    def GetValue(self, row: int, col: int) -> str:     # DataSourceGridTable
+        ds=self._dataGrid.Datasource
+        row=self._dataGrid.SourceRow(row)
+        # The grid is allowed to be bigger than the datasource (e.g., the spare rows at the bottom)
+        if row < 0 or row >= ds.NumRows or col >= len(ds.ColDefs):
+            return ""
+        val=ds[row][col]
+        if val is None:
+            return ""
+        return str(val)
+
+    # The grid's cell editor commits its value here.  OnGridCellChanged then does the usual post-edit processing.
+    def SetValue(self, row: int, col: int, value: str) -> None:     # DataSourceGridTable
+        row=self._dataGrid.SourceRow(row)
+        if row < 0:
+            return
+        self._dataGrid.ExpandDataSourceToInclude(row, col)
+        self._dataGrid.Datasource[row][col]=value
+
+    def GetColLabelValue(self, col: int) -> str:     # DataSourceGridTable
+        ds=self._dataGrid.Datasource
+        if col < len(ds.ColDefs):
+            return ds.ColDefs[col].Preferred
+        return ""
+
+    # --------------------------------------------------------
+    # Change the size of the table, telling the grid about rows and columns added or removed at the end
+    def Resize(self, numRows: int, numCols: int) -> None:     # DataSourceGridTable
+        grid=self.GetView()
+        if grid is None:
+            self._numRows=numRows
+            self._numCols=numCols
+            return
+
+        grid.BeginBatch()
+        for current, new, delmsg, addmsg in [(self._numRows, numRows, wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED, wx.grid.GRIDTABLE_NOTIFY_ROWS_APPENDED),
+                                             (self._numCols, numCols, wx.grid.GRIDTABLE_NOTIFY_COLS_DELETED, wx.grid.GRIDTABLE_NOTIFY_COLS_APPENDED)]:
+            if new < current:
+                msg=wx.grid.GridTableMessage(self, delmsg, new, current-new)
+            elif new > current:
+                msg=wx.grid.GridTableMessage(self, addmsg, new-current)
+            else:
+                continue
+            if delmsg == wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED:
+                self._numRows=new
+            else:
+                self._numCols=new
+            grid.ProcessTableMessage(msg)
+        grid.EndBatch()
+        grid.AdjustScrollbars()
+
+    # --------------------------------------------------------
+    # Tell the grid about rows or columns inserted or deleted in the middle of the table
+    def NotifyRowsInserted(self, pos: int, num: int) -> None:     # DataSourceGridTable
+        self._numRows+=num
+        self._Notify(wx.grid.GRIDTABLE_NOTIFY_ROWS_INSERTED, pos, num)
+
+    def NotifyRowsDeleted(self, pos: int, num: int) -> None:     # DataSourceGridTable
+        self._numRows-=num
+        self._Notify(wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED, pos, num)
+
+    def NotifyColsInserted(self, pos: int, num: int) -> None:     # DataSourceGridTable
+        self._numCols+=num
+        self._Notify(wx.grid.GRIDTABLE_NOTIFY_COLS_INSERTED, pos, num)
+
+    def NotifyColsDeleted(self, pos: int, num: int) -> None:     # DataSourceGridTable
+        self._numCols-=num
+        self._Notify(wx.grid.GRIDTABLE_NOTIFY_COLS_DELETED, pos, num)
+
+    def _Notify(self, msgid: int, pos: int, num: int) -> None:     # DataSourceGridTable
+        grid=self.GetView()
+        if grid is not None:
+            grid.ProcessTableMessage(wx.grid.GridTableMessage(self, msgid, pos, num))
+
+
+#================================================================
+# Validates a DataGrid's columns on worker threads (see DataGrid's BackgroundValidation argument).
+# A pass over a range of rows of a column snapshots their values and RowIDs on the UI thread and validates them on a worker.
+#   The set of RowIDs of invalid cells is posted back to the UI thread (by wx.CallAfter), which recolors just the cells whose
+#   validity changed.  So recoloring a few thousand rows (e.g., a chunk of a file being loaded) costs a few thousand rows' work.
+# Every pass and every cell revalidated on the UI thread gets a number from a generation counter.  A pass answers only for
+#   those of its rows which no newer pass of the column has taken over, and its results are discarded if any of the column's
+#   cells have been revalidated since its snapshot was taken (in which case its rows are passed over again).
+# Results are kept by ColDefinition and RowID, so they follow columns and rows as they are moved.
+class BackgroundValidator:
+    def __init__(self, dataGrid: DataGrid, MaxWorkers: int=4) -> None:
+        self._dataGrid=dataGrid
+        self._maxWorkers=MaxWorkers
+        self._executor: ThreadPoolExecutor|None=None      # Created when first needed
+        self._generation: int=0
+        self._results: dict[int, tuple[ColDefinition, CellValidator, set[int]]]={}     # id(coldef) -> (coldef, validator, RowIDs of invalid cells)
+        self._pending: dict[int, dict[int, set[int]]]={}       # id(coldef) -> {generation of a pass in progress: the RowIDs it answers for}
+        self._revalidated: dict[int, int]={}   # id(coldef) -> generation at which a cell was last revalidated on the UI thread
+
+    # Is this cell invalid?  None if there's no result for its column.
+    def IsInvalid(self, coldef: ColDefinition, validator: CellValidator, rowID: int) -> bool|None:     # BackgroundValidator
+        result=self._results.get(id(coldef))
+        if result is not None and result[0] is coldef and result[1] is validator:
+            return rowID in result[2]
+        if id(coldef) in self._pending:
+            return False    # It will be colored when the pass completes
+        return None
+
+    # Start a pass over rows StartRow..EndRow (inclusive; -1 means the last row) of each of these columns
+    def Schedule(self, icols: list[int], StartRow: int=0, EndRow: int=-1) -> None:     # BackgroundValidator
+        ds=self._dataGrid.Datasource
+        if EndRow == -1 or EndRow >= ds.NumRows:
+            EndRow=ds.NumRows-1
+        live: list[GridDataRowClass]|None=None
+        for icol in icols:
+            if icol >= ds.NumCols:
+                continue
+            coldef=ds.ColDefs[icol]
+            validator=self._dataGrid._ColumnValidator(icol, coldef)
+            if validator is None:
+                continue
+            if live is None:
+                # Text, link and empty rows are never colored as invalid, so leave them out
+                live=[row for row in ds.Rows[max(StartRow, 0):EndRow+1] if not row.IsTextRow and not row.IsLinkRow and not row.IsEmptyRow]
+            self._Start(coldef, validator, live, icol)
+
+    def _Start(self, coldef: ColDefinition, validator: CellValidator, rows: list[GridDataRowClass], icol: int) -> None:     # BackgroundValidator
+        if not rows:
+            return
+        rowIDs=[row.RowID for row in rows]
+        values=[row[icol] for row in rows]
+        values=["" if val is None else str(val) for val in values]
+        self._generation+=1
+        generation=self._generation
+        passes=self._pending.setdefault(id(coldef), {})
+        for older in passes.values():
+            older.difference_update(rowIDs)     # This pass takes these rows over from any older one
+        passes[generation]=set(rowIDs)
+        if self._executor is None:
+            self._executor=ThreadPoolExecutor(max_workers=self._maxWorkers, thread_name_prefix="BackgroundValidator")
+        future=self._executor.submit(self._Validate, validator, rowIDs, values)
+        future.add_done_callback(lambda f, coldef=coldef, validator=validator, generation=generation: wx.CallAfter(self._Apply, coldef, validator, generation, f))
+
+    # Runs on a worker thread
+    @staticmethod
+    def _Validate(validator: CellValidator, rowIDs: list[int], values: list[str]) -> set[int]:     # BackgroundValidator
+        return {rowIDs[i] for i in validator.ValidateColumn(values)}
+
+    # Record the validity of one cell, found on the UI thread
+    def NoteCell(self, coldef: ColDefinition, validator: CellValidator, rowID: int, invalid: bool) -> None:     # BackgroundValidator
+        if id(coldef) in self._pending:
+            # A pass in progress may have seen an older value
+            self._generation+=1
+            self._revalidated[id(coldef)]=self._generation
+        result=self._results.get(id(coldef))
+        if result is None or result[0] is not coldef or result[1] is not validator:
+            # Start the column's results, since a pass over other rows may now give it some
+            result=self._results[id(coldef)]=(coldef, validator, set())
+        if invalid:
+            result[2].add(rowID)
+        else:
+            result[2].discard(rowID)
+
+    # Runs on the UI thread when a pass completes
+    def _Apply(self, coldef: ColDefinition, validator: CellValidator, generation: int, future: Future) -> None:     # BackgroundValidator
+        key=id(coldef)
+        passes=self._pending.get(key)
+        if passes is None or generation not in passes:
+            return      # The results have been cleared since
+        rowIDs=passes.pop(generation)
+        if not passes:
+            del self._pending[key]
+        if future.exception() is not None or not rowIDs:
+            return
+
+        ds=self._dataGrid.Datasource
+        icol=next((i for i, cd in enumerate(ds.ColDefs) if cd is coldef), -1)
+        if icol == -1:
+            return      # The column is gone
+        if self._revalidated.get(key, 0) > generation:
+            # Cells have been changed since the snapshot was taken: pass over this pass's rows again
+            positions=sorted(irow for irow in (ds.RowPosition(rowID) for rowID in rowIDs) if irow >= 0)
+            self._Start(coldef, validator, [ds.Rows[irow] for irow in positions], icol)
+            return
+
+        invalid=future.result() & rowIDs
+        old=self._results.get(key)
+        if old is None or old[0] is not coldef or old[1] is not validator:
+            changed=invalid
+            self._results[key]=(coldef, validator, invalid)
+        else:
+            changed=(old[2] & rowIDs) ^ invalid
+            old[2].difference_update(rowIDs)
+            old[2].update(invalid)
+        self._dataGrid._RecolorRows(icol, changed)
+
+    # Forget all results, e.g. when the datasource is replaced
+    def Clear(self) -> None:     # BackgroundValidator
+        self._results.clear()
+        self._pending.clear()
+        self._revalidated.clear()
+
+
+#================================================================
+# A bounded LRU cache of text widths keyed on (font description, text).
+# Measuring text means a round trip to GDI/Pango, and the same strings get measured over and over: by autosizing, and
+# each time a cell editor is opened to check whether its value will fit.  So each distinct string is measured once per font.
+# A single measurer, SharedTextMeasurer, is shared by all grids.  Anything else which measures cell text
+# (wrapping, row heights, ...) should use it, too.
+class TextMeasurer:
+    def __init__(self, MaxSize: int=200_000) -> None:
+        self.MaxSize=MaxSize
+        self._widths: OrderedDict[tuple[str, str], int]=OrderedDict()
+        self.Hits: int=0
+        self.Misses: int=0
+
+    def __len__(self) -> int:     # TextMeasurer
+        return len(self._widths)
+
+    # The width in pixels of text drawn in font, measured (if it isn't cached) by window.GetFullTextExtent()
+    # fontKey is font.GetNativeFontInfoDesc(); callers measuring many strings in the same font can pass it in to save asking each time.
+    def Width(self, window: wx.Window, text: str, font: wx.Font, fontKey: str|None=None) -> int:     # TextMeasurer
+        if not text:
+            return 0
+        if fontKey is None:
+            fontKey=font.GetNativeFontInfoDesc()
+        key=(fontKey, text)
+        width=self._widths.get(key)
+        if width is not None:
+            self._widths.move_to_end(key)
+            self.Hits+=1
+            return width
+
+        self.Misses+=1
+        width=window.GetFullTextExtent(text, font)[0]
+        self._widths[key]=width
+        if len(self._widths) > self.MaxSize:
+            self._widths.popitem(last=False)
+        return width
+
+    # The widths of a batch of values drawn in the same font.  Values are converted to str; a value with several lines
+    #   is as wide as its widest line.  None and "" have a width of 0.
+    def Widths(self, window: wx.Window, values: list[object], font: wx.Font, fontKey: str|None=None) -> list[int]:     # TextMeasurer
+        if fontKey is None:
+            fontKey=font.GetNativeFontInfoDesc()
+        widths=self._widths
+        result=[]
+        for val in values:
+            if val is None or val == "":
+                result.append(0)
+                continue
+            text=val if isinstance(val, str) else str(val)
+            width=widths.get((fontKey, text))
+            if width is not None:
+                widths.move_to_end((fontKey, text))
+                self.Hits+=1
+            elif "\n" in text:
+                width=max(self.Width(window, line, font, fontKey) for line in text.split("\n"))
+            else:
+                width=self.Width(window, text, font, fontKey)
+            result.append(width)
+        return result
+
+    # Forget all the widths, e.g. if the display's DPI has changed
+    def Clear(self) -> None:     # TextMeasurer
+        self._widths.clear()
+
+    def ResetCounters(self) -> None:     # TextMeasurer
+        self.Hits=0
+        self.Misses=0
+
+
+SharedTextMeasurer=TextMeasurer()
+
+
+#================================================================
+# The width each of a DataGrid's columns needs in order to show its widest cell (and its label), kept up to date so that
+#   autosizing doesn't have to measure every cell in the grid.
+# A column is measured in full the first time its width is needed, and again only when its widest cell gets narrower or
+#   is deleted.  Otherwise it is updated from just the cells which change (see NoteCell() and NoteRows()).
+# Only each column's widest width and the RowIDs of the cells that wide are kept here; the text widths themselves are kept
+#   (once) by SharedTextMeasurer, so measuring a column again mostly costs cache lookups.
+# Columns are identified by their ColDefinition and cells by RowID, so moving rows or columns changes nothing.
+# Text rows are merged across the whole row, so they don't widen any one column.
+class ColumnWidths:
+    _margin: int=10         # Room left beside the text, as wx's own autosizing does
+
+    def __init__(self, dataGrid: DataGrid) -> None:
+        self._dataGrid=dataGrid
+        self._columns: dict[int, tuple[ColDefinition, int, set[int]]]={}     # id(coldef) -> (coldef, widest cell, RowIDs of the cells that wide)
+        self._fonts: tuple[tuple[wx.Font, str], tuple[wx.Font, str]]|None=None    # The (font, key) for cells and for labels
+
+    # Forget all the columns' widths, e.g. after the datasource has been replaced or the grid's font changed
+    def Clear(self) -> None:     # ColumnWidths
+        self._columns.clear()
+        self._fonts=None
+
+    # Forget one column's width so it is measured again next time
+    def ForgetColumn(self, icol: int) -> None:     # ColumnWidths
+        cols=self._dataGrid.Datasource.ColDefs
+        if icol < len(cols):
+            self._columns.pop(id(cols[icol]), None)
+
+    def _Fonts(self) -> tuple[tuple[wx.Font, str], tuple[wx.Font, str]]:     # ColumnWidths
+        if self._fonts is None:
+            grid=self._dataGrid._grid
+            cellFont=grid.GetDefaultCellFont()
+            labelFont=grid.GetLabelFont()
+            self._fonts=((cellFont, cellFont.GetNativeFontInfoDesc()), (labelFont, labelFont.GetNativeFontInfoDesc()))
+        return self._fonts
+
+    # The widths of column icol's cells in these rows
+    def _CellWidths(self, rows: list[GridDataRowClass], icol: int) -> list[int]:     # ColumnWidths
+        font, fontKey=self._Fonts()[0]
+        return SharedTextMeasurer.Widths(self._dataGrid._grid, [None if row.IsTextRow else row[icol] for row in rows], font, fontKey)
+
+    def _Measure(self, icol: int) -> tuple[ColDefinition, int, set[int]]:     # ColumnWidths
+        ds=self._dataGrid.Datasource
+        coldef=ds.ColDefs[icol]
+        widest=0
+        holders: set[int]=set()
+        rows=ds.Rows
+        for row, width in zip(rows, self._CellWidths(rows, icol)):
+            if width > widest:
+                widest=width
+                holders={row.RowID}
+            elif width == widest and width > 0:
+                holders.add(row.RowID)
+        entry=self._columns[id(coldef)]=(coldef, widest, holders)
+        return entry
+
+    # A cell has changed
+    def NoteCell(self, irow: int, icol: int) -> None:     # ColumnWidths
+        self._NoteCells(irow, irow, icol)
+
+    # Rows start..end (inclusive) have changed, in columns StartCol..EndCol (inclusive; by default, all of them)
+    def NoteRows(self, start: int, end: int, StartCol: int=0, EndCol: int=-1) -> None:     # ColumnWidths
+        if EndCol == -1:
+            EndCol=len(self._dataGrid.Datasource.ColDefs)-1
+        for icol in range(StartCol, EndCol+1):
+            self._NoteCells(start, end, icol)
+
+    # Rows start..end (inclusive) have been loaded into the grid.  Like NoteRows(), but a column which hasn't been measured yet
+    #   is started from just these rows, rather than waiting to be measured in full.  (ViewportFirst loads the rows in chunks,
+    #   and so sizes the columns from the rows loaded so far.)
+    def NoteRowsLoaded(self, start: int, end: int) -> None:     # ColumnWidths
+        for icol, coldef in enumerate(self._dataGrid.Datasource.ColDefs):
+            entry=self._columns.get(id(coldef))
+            if entry is None or entry[0] is not coldef:
+                self._columns[id(coldef)]=(coldef, 0, set())
+            self._NoteCells(start, end, icol)
+
+    def _NoteCells(self, start: int, end: int, icol: int) -> None:     # ColumnWidths
+        ds=self._dataGrid.Datasource
+        if icol >= len(ds.ColDefs):
+            return
+        coldef=ds.ColDefs[icol]
+        entry=self._columns.get(id(coldef))
+        if entry is None or entry[0] is not coldef:
+            return      # The column hasn't been measured yet
+        _, widest, holders=entry
+        rows=ds.Rows[start:end+1]
+        for row, width in zip(rows, self._CellWidths(rows, icol)):
+            if width > widest:
+                widest=width
+                holders={row.RowID}
+            elif width == widest and width > 0:
+                holders.add(row.RowID)
+            else:
+                holders.discard(row.RowID)      # If that was the last of the widest cells, the column will be measured again
+        self._columns[id(coldef)]=(coldef, widest, holders)
+
+    # Rows have been deleted.  Drop them from the widest cells, so columns which have lost all their widest cells are measured again.
+    def NoteRowsDeleted(self) -> None:     # ColumnWidths
+        ds=self._dataGrid.Datasource
+        for coldef, widest, holders in self._columns.values():
+            holders.difference_update([rowID for rowID in holders if ds.RowPosition(rowID) < 0])
+
+    # The width column icol needs
+    def Width(self, icol: int) -> int:     # ColumnWidths
+        ds=self._dataGrid.Datasource
+        coldef=ds.ColDefs[icol]
+        entry=self._columns.get(id(coldef))
+        if entry is None or entry[0] is not coldef or (entry[1] > 0 and not entry[2]):
+            entry=self._Measure(icol)
+        return max(entry[1], SharedTextMeasurer.Widths(self._dataGrid._grid, [coldef.Preferred], *self._Fonts()[1])[0])+self._margin
+
+
+#================================================================
+# Timings and wx call counts for a DataGrid, collected while instrumentation is on (see DataGrid.Instrument()).
+# The work is divided into named phases -- "refresh", "reload", "color", "autosize", "selection restore", "paste", "move", etc.
+# Phases nest: a phase's time includes that of the phases within it, but each wx call is counted only in the innermost phase.
+@dataclass
+class PhaseStats:
+    Count: int=0            # The number of times the phase was entered
+    Seconds: float=0.0
+    Rows: int=0             # The rows and cells the phase touched
+    Cells: int=0
+    Calls: Counter=field(default_factory=Counter)     # wx grid calls, by method name
+
+
+class GridInstrumentation:
+    def __init__(self) -> None:
+        self.Phases: dict[str, PhaseStats]={}
+        self.Calls: Counter=Counter()        # All wx grid calls, by method name
+        self._stack: list[PhaseStats]=[]
+
+    @contextmanager
+    def Phase(self, name: str, Rows: int=0, Cells: int=0):
+        stats=self.Phases.get(name)
+        if stats is None:
+            stats=self.Phases[name]=PhaseStats()
+        stats.Count+=1
+        stats.Rows+=Rows
+        stats.Cells+=Cells
+        self._stack.append(stats)
+        start=time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.Seconds+=time.perf_counter()-start
+            self._stack.pop()
+
+    def CountCall(self, name: str) -> None:     # GridInstrumentation
+        self.Calls[name]+=1
+        if self._stack:
+            self._stack[-1].Calls[name]+=1
+
+    def Report(self, TopCalls: int=3) -> str:     # GridInstrumentation
+        lines=[f"{'phase':<18} {'count':>6} {'ms':>10} {'rows':>9} {'cells':>10}  wx calls"]
+        for name, stats in sorted(self.Phases.items(), key=lambda item: -item[1].Seconds):
+            calls=", ".join(f"{call} {num:,}" for call, num in stats.Calls.most_common(TopCalls))
+            lines.append(f"{name:<18} {stats.Count:>6,} {stats.Seconds*1000:>10.1f} {stats.Rows:>9,} {stats.Cells:>10,}  {calls}")
+        return "\n".join(lines)
+
+
+# Stands in for the wx grid while instrumentation is on, counting the calls made on it
+# Reading a property such as NumberRows counts as a call, since it is one.
+class _CountingGrid:
+    def __init__(self, grid: wx.grid.Grid, instrumentation: GridInstrumentation) -> None:
+        self._wxGrid=grid
+        self._instrumentation=instrumentation
+
+    def __getattr__(self, name: str):     # _CountingGrid
+        attr=getattr(self._wxGrid, name)
+        instrumentation=self._instrumentation
+        if not callable(attr):
+            instrumentation.CountCall(name)
+            return attr
+
+        def Counted(*args, **kwargs):
+            instrumentation.CountCall(name)
+            return attr(*args, **kwargs)
+        return Counted
+
+
+_noPhase=nullcontext()      # What DataGrid._Phase() returns when instrumentation is off
+
+
+# Time every call of a DataGrid method as a phase, when instrumentation is on
+def _Instrumented(phase: str) -> Callable:
+    def Decorate(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def Wrapper(self: DataGrid, *args, **kwargs):
+            if self._instrumentation is None:
+                return method(self, *args, **kwargs)
+            with self._instrumentation.Phase(phase):
+                return method(self, *args, **kwargs)
+        return Wrapper
+    return Decorate
+
+
 ################################################################################
 class DataGrid():
 
-    def __init__(self, grid: wx.grid.Grid, ColorSingleCellByValue: Callable[[int, int], None]|None=None):        
-        self._grid: wx.grid.Grid=grid
+    _spareRows: int=12      # The number of empty rows kept below the data so there's always somewhere to type
+    _pasteProgressCells: int=100000     # Pastes of more cells than this show a progress dialog and can be cancelled
+    _pasteChunkRows: int=2000           # ...and are done this many rows at a time
+    _backgroundValidationRows: int=500  # With BackgroundValidation, recoloring more rows than this validates on worker threads
+    _scheduledRefreshDelayMs: int=50    # A refresh queued by ScheduleRefresh() is done when the app is next idle, or after this long at most
+    _viewportMarginRows: int=100        # With ViewportFirst, the rows above and below the screen which are loaded along with it
+    _populateChunkRows: int=2000        # ...and the rest are loaded this many rows at a time while the app is idle
+
+    # Cells copied from any DataGrid are put on the system clipboard as text and HTML and are also kept here, together with a token
+    # which is put on the clipboard in a private format.  If the token is still on the clipboard when pasting, the cells kept here
+    # are used directly rather than reading the text back.
+    _clipboardFormatName: str="WxDataGrid.Cells"
+    _clipboardSerial: int=0
+    _lastCopy: tuple[str, list[list[str]]]|None=None       # (token, cells)
+
+    # VirtualMode=True backs the wx grid with a DataSourceGridTable rather than copying every value into the grid
+    # LazyColoring=True styles cells through a DataGridAttrProvider as they are painted rather than coloring every cell on each refresh
+    # BackgroundValidation=True validates large ranges of cells on worker threads and marks the invalid ones when the results come in
+    # ViewportFirst=True makes a full refresh load and color just the rows on screen (and a margin around them) before returning,
+    #   leaving the rest to be done a chunk at a time while the app is idle
+    def __init__(self, grid: wx.grid.Grid, ColorSingleCellByValue: Callable[[int, int], None]|None=None, VirtualMode: bool=False,
+                 LazyColoring: bool=False, BackgroundValidation: bool=False, UndoMemoryLimit: int=64_000_000, ViewportFirst: bool=False):
+        self._wxGrid: wx.grid.Grid=grid
+        self._grid: wx.grid.Grid=grid       # While instrumentation is on, this is a _CountingGrid wrapping _wxGrid
+        self._instrumentation: GridInstrumentation|None=None
 
         self._datasource: GridDataSource=GridDataSource()
         self.clipboard=None         # The grid's clipboard
@@ -438,6 +2393,351 @@ class DataGrid():
         self.clickedRow: int|None=None
         self.clickType: str|None=None
         self._colorSingleCellByValue=ColorSingleCellByValue
+        self._colValidators: list[tuple[str, CellValidator|None]]=[]     # (Type, validator) for each column
+        self._batchDepth: int=0     # The nesting depth of BatchUpdate() blocks
+        self._pendingRefresh: PendingRefresh=PendingRefresh()     # Refreshing asked for during a BatchUpdate() or queued by ScheduleRefresh()
+        self._refreshTimer: wx.CallLater|None=None      # Running while a refresh queued by ScheduleRefresh() is waiting to be done
+        self._scheduledVisibleCell: tuple[int, int]|None=None      # A cell to scroll into view when it is
+        self._idleBound: bool=False
+        self._viewportFirst: bool=ViewportFirst
+        self._unpopulatedRows: list[list[int]]=[]       # With ViewportFirst, the [start, end] ranges of grid rows still to be loaded and colored
+
+        self._table: DataSourceGridTable|None=None
+        if VirtualMode:
+            # We keep our own reference to the table, so the grid must not take ownership of it
+            self._table=DataSourceGridTable(self)
+            self._grid.SetTable(self._table, takeOwnership=False)
+
+        self._attrProvider: DataGridAttrProvider|None=None
+        if LazyColoring:
+            # This must be done after any SetTable(), since the provider belongs to the grid's table
+            self._attrProvider=DataGridAttrProvider(self)
+            self._grid.GetTable().SetAttrProvider(self._attrProvider)
+
+        self._backgroundValidator: BackgroundValidator|None=BackgroundValidator(self) if BackgroundValidation else None
+        self._sortKeyCache: dict[int, tuple[ColDefinition, Callable[[str], tuple], dict[int, tuple[str, tuple]]]]={}     # See _SortKeys()
+        self._searchIndex: RowSearchIndex|None=None     # Built by the first SetFilter()
+        self._viewRowIDs: list[int]|None=None       # When filtered, the RowIDs of the rows shown, in grid order
+        self._filterText: str=""
+        self._undoLog: UndoLog=UndoLog(UndoMemoryLimit)     # UndoMemoryLimit is roughly how many bytes the undo history may take
+        self._selectionSnapshot: tuple[Selection, int|None, int, int]|None=None     # See _SnapshotSelection()
+        self._columnWidths: ColumnWidths=ColumnWidths(self)
+
+
+    # --------------------------------------------------------
+    # Is the wx grid backed directly by the datasource?
+    @property
+    def IsVirtual(self) -> bool:
+        return self._table is not None
+
+
+    # --------------------------------------------------------
+    # Collect timings and wx call counts for everything done inside the block:
+    #       with dataGrid.Instrument() as stats:
+    #           dataGrid.RefreshWxGridFromDatasource()
+    #       print(stats.Report())
+    # OnDone, if supplied, is also called with the results when the block ends.  A nested Instrument() shares the outer one's results.
+    # When instrumentation is off, it costs nothing but a test at the start of each phase.
+    @contextmanager
+    def Instrument(self, OnDone: Callable[[GridInstrumentation], None]|None=None):
+        if self._instrumentation is not None:
+            yield self._instrumentation
+            if OnDone is not None:
+                OnDone(self._instrumentation)
+            return
+
+        instrumentation=GridInstrumentation()
+        self._instrumentation=instrumentation
+        self._grid=_CountingGrid(self._wxGrid, instrumentation)
+        try:
+            yield instrumentation
+        finally:
+            self._grid=self._wxGrid
+            self._instrumentation=None
+        if OnDone is not None:
+            OnDone(instrumentation)
+
+    # A phase of the work to be timed when instrumentation is on
+    def _Phase(self, name: str, Rows: int=0, Cells: int=0):
+        if self._instrumentation is None:
+            return _noPhase
+        return self._instrumentation.Phase(name, Rows=Rows, Cells=Cells)
+
+
+    # --------------------------------------------------------
+    # Group a series of changes so the grid is refreshed just once:
+    #       with dataGrid.BatchUpdate():
+    #           ...edit the datasource, calling RefreshWxGridFromDatasource(), ColorSingleCellByValue(), etc. as usual...
+    # Inside the block the grid doesn't repaint, and the refreshing and recoloring asked for is recorded rather than done.
+    # When the outermost block exits, a single refresh covering all of it is done.  Blocks may be nested.
+    @contextmanager
+    def BatchUpdate(self):
+        self._batchDepth+=1
+        self._grid.BeginBatch()
+        try:
+            yield self
+        finally:
+            self._batchDepth-=1
+            try:
+                if self._batchDepth == 0:
+                    self._FlushPendingRefresh()
+            finally:
+                self._grid.EndBatch()
+
+    @property
+    def InBatchUpdate(self) -> bool:
+        return self._batchDepth > 0
+
+    # Record a refresh asked for during a BatchUpdate().  The arguments are those of RefreshWxGridFromDatasource().
+    def _DeferRefresh(self, StartRow: int=-1, EndRow: int=-1, StartCol: int=-1, EndCol: int=-1, RetainSelection: bool=True, RetainCursorPos: bool=True) -> None:
+        changes=self._datasource.Changes
+        rowsOnly=StartCol == -1 and EndCol == -1
+        box=StartCol != -1 and EndCol != -1 and StartCol <= EndCol
+        if StartRow != -1 and EndRow != -1 and StartRow <= EndRow and (rowsOnly or box):
+            changes.MarkRowsDirty(StartRow, EndRow-StartRow+1)      # A box of cells is recorded as its rows
+        elif box and StartRow == -1 and EndRow == -1:
+            changes.MarkColsDirty(StartCol, EndCol-StartCol+1)
+        else:
+            self._pendingRefresh.RequestFull(RetainSelection, RetainCursorPos)
+        self._pendingRefresh.Requested=True
+
+    # Record a recoloring asked for during a BatchUpdate().  The arguments are those of ColorCellsByValue().
+    def _DeferColoring(self, StartRow: int=-1, EndRow: int=-1, StartCol: int=-1, EndCol: int=-1) -> None:
+        changes=self._datasource.Changes
+        if StartRow != -1 or EndRow != -1:
+            if StartRow == -1:
+                StartRow=0
+            if EndRow == -1:
+                EndRow=self._datasource.NumRows-1
+            if StartRow <= EndRow:
+                changes.MarkRowsDirty(StartRow, EndRow-StartRow+1)
+        else:
+            if StartCol == -1:
+                StartCol=0
+            if EndCol == -1:
+                EndCol=self._datasource.NumCols-1
+            if StartCol <= EndCol:
+                changes.MarkColsDirty(StartCol, EndCol-StartCol+1)
+        self._pendingRefresh.Requested=True
+
+    # Do the refreshing recorded during a BatchUpdate()
+    def _FlushPendingRefresh(self) -> None:
+        pending=self._pendingRefresh
+        if not pending.Requested:
+            return
+        full, retainSelection, retainCursorPos=pending.Full, pending.RetainSelection, pending.RetainCursorPos
+        pending.Clear()
+        if full:
+            self.RefreshWxGridFromDatasource(RetainSelection=retainSelection, RetainCursorPos=retainCursorPos)
+        else:
+            self.RefreshWxGridFromChanges()
+
+
+    # --------------------------------------------------------
+    # Queue a refresh to be done when the app is next idle (or after _scheduledRefreshDelayMs at most) rather than right now.
+    # The arguments are those of RefreshWxGridFromDatasource().  MakeVisible, if given, is a (row, col) to scroll into view afterwards.
+    # Refreshes queued before the app gets a chance to go idle are merged, as they are in a BatchUpdate(), and done as one.
+    #   This is for changes which come faster than the grid can be repainted, such as moving rows with an auto-repeating arrow key:
+    #   the datasource is changed at once each time, but the grid is only brought up to date once the keystrokes stop piling up.
+    # FlushScheduledRefresh() does the queued refresh right away.  A full refresh makes it moot.
+    def ScheduleRefresh(self, StartRow: int=-1, EndRow: int=-1, StartCol: int=-1, EndCol: int=-1, MakeVisible: tuple[int, int]|None=None) -> None:
+        self._DeferRefresh(StartRow, EndRow, StartCol, EndCol)
+        if MakeVisible is not None:
+            self._scheduledVisibleCell=MakeVisible
+        if self._batchDepth > 0:
+            return      # The end of the batch will do it
+
+        self._BindIdle()
+        if self._refreshTimer is None:
+            self._refreshTimer=wx.CallLater(self._scheduledRefreshDelayMs, self._OnRefreshTimer)
+
+    @property
+    def HasScheduledRefresh(self) -> bool:
+        return self._refreshTimer is not None
+
+    # Do any refresh queued by ScheduleRefresh() now
+    def FlushScheduledRefresh(self) -> None:
+        if self._refreshTimer is None or self._batchDepth > 0:
+            return
+        self._refreshTimer.Stop()
+        self._refreshTimer=None
+        self._FlushPendingRefresh()
+        if self._scheduledVisibleCell is not None:
+            irow, icol=self._scheduledVisibleCell
+            self._scheduledVisibleCell=None
+            if irow < self._grid.NumberRows and icol < self._grid.NumberCols:
+                self._grid.MakeCellVisible(irow, icol)
+
+    def _BindIdle(self) -> None:
+        if not self._idleBound:
+            self._wxGrid.Bind(wx.EVT_IDLE, self._OnIdle)
+            self._idleBound=True
+
+    def _OnIdle(self, event) -> None:
+        event.Skip()
+        self.FlushScheduledRefresh()
+        if self._unpopulatedRows and self._batchDepth == 0:
+            self._PopulateNextChunk()
+            if self._unpopulatedRows:
+                event.RequestMore()     # Keep the idle events coming until everything is loaded
+
+    def _OnRefreshTimer(self) -> None:
+        if self._wxGrid:       # The grid may have been destroyed meanwhile
+            self.FlushScheduledRefresh()
+
+    # Forget any queued refresh, e.g. because everything is about to be reloaded anyway
+    def _CancelScheduledRefresh(self) -> None:
+        self._pendingRefresh.Clear()
+        if self._refreshTimer is not None:
+            self._refreshTimer.Stop()
+            self._refreshTimer=None
+
+
+    # --------------------------------------------------------
+    # Filtering.  SetFilter(text) shows only the rows with a word starting with each of text's words; the datasource is untouched.
+    # While a filter is set the grid shows a view of the datasource: grid row i is the datasource row with RowID _viewRowIDs[i].
+    #   The grid's event handlers translate grid rows to datasource rows (see SourceRow()), but DataGrid's other methods
+    #   take datasource rows as always.
+    # The rows shown stay the same until the filter is changed, even if they're edited.  Pasting and moving, inserting and deleting
+    #   rows are turned off in the UI meanwhile.
+    # Filtering needs VirtualMode=True and LazyColoring=True, so the grid holds no values or colors by row of its own.
+    @property
+    def IsFiltered(self) -> bool:
+        return self._viewRowIDs is not None
+
+    @property
+    def FilterText(self) -> str:
+        return self._filterText
+
+    # The datasource row shown in grid row irow, or -1 if that row has since been deleted
+    def SourceRow(self, irow: int) -> int:
+        if self._viewRowIDs is None:
+            return irow
+        if irow >= len(self._viewRowIDs):
+            return -1
+        return self._datasource.RowPosition(self._viewRowIDs[irow])
+
+    def SetFilter(self, text: str) -> None:
+        if self._table is None or self._attrProvider is None:
+            raise RuntimeError("DataGrid.SetFilter() needs a DataGrid created with VirtualMode=True and LazyColoring=True")
+        self._grid.SaveEditControlValue()
+        if self._searchIndex is None:
+            self.RebuildSearchIndex()
+        rowIDs=self._searchIndex.Search(text)
+        if rowIDs is None:
+            self.ClearFilter()
+            return
+
+        ds=self._datasource
+        if len(rowIDs) < ds.NumRows//8:
+            positions=sorted(irow for irow in (ds.RowPosition(rowID) for rowID in rowIDs) if irow >= 0)
+            self._viewRowIDs=[ds.Rows[irow].RowID for irow in positions]
+        else:
+            self._viewRowIDs=[rowID for rowID in (row.RowID for row in ds.Rows) if rowID in rowIDs]
+        self._filterText=text
+        self._grid.ClearSelection()
+        self._unpopulatedRows=[]       # They're in terms of the unfiltered grid.  (ClearFilter() does a full refresh.)
+        self._RefreshFilteredView(Reset=True)
+
+    def ClearFilter(self) -> None:
+        if self._viewRowIDs is None:
+            return
+        self._viewRowIDs=None
+        self._filterText=""
+        self._grid.ClearSelection()
+        self.RefreshWxGridFromDatasource(RetainSelection=False)
+
+    # Bring a filtered grid up to date.  Rows which have been deleted are dropped from the view.
+    # Spans and any attributes the application set on cells belong to grid rows, not to datasource rows, so whenever the rows being shown change
+    #   (Reset is True when the filter itself has changed) they are cleared by emptying the grid, and the text rows in the view are merged again.
+    def _RefreshFilteredView(self, Reset: bool=False) -> None:
+        self._selectionSnapshot=None       # The filtered view's selection is cleared when the filter is set
+        self._datasource.Changes.Clear()     # They're in terms of the unfiltered grid.  (ClearFilter() does a full refresh.)
+        ds=self._datasource
+        numShown=len(self._viewRowIDs)
+        self._viewRowIDs=[rowID for rowID in self._viewRowIDs if ds.RowPosition(rowID) >= 0]
+        self.SetColHeaders(ds.ColDefs)
+        if Reset or len(self._viewRowIDs) != numShown:
+            viewStart=self._grid.GetViewStart()
+            self._table.Resize(0, ds.NumCols)
+            self._table.Resize(len(self._viewRowIDs), ds.NumCols)
+            rows=ds.Rows
+            for irow, rowID in enumerate(self._viewRowIDs):
+                if rows[ds.RowPosition(rowID)].IsTextRow:
+                    self._grid.SetCellSize(irow, 0, 1, self.NumCols)
+            if not Reset:
+                self._grid.Scroll(-1, viewStart[1])     # Rows were deleted from the view: keep it where it was
+        else:
+            self._table.Resize(len(self._viewRowIDs), ds.NumCols)
+        self._grid.ForceRefresh()
+
+    # Index every row of the datasource for filtering
+    def RebuildSearchIndex(self) -> None:
+        self._searchIndex=RowSearchIndex()
+        self._IndexRows(0, self._datasource.NumRows-1)
+
+    # Reindex rows start..end (inclusive) after their cells have changed.  (Only needed once filtering has been used.)
+    def _IndexRows(self, start: int, end: int) -> None:
+        if self._searchIndex is None:
+            return
+        ds=self._datasource
+        ncols=ds.NumCols
+        rows=ds.Rows
+        for irow in range(max(start, 0), min(end, ds.NumRows-1)+1):
+            row=rows[irow]
+            self._searchIndex.UpdateRow(row.RowID, [row[icol] for icol in range(ncols)])
+
+
+    # --------------------------------------------------------
+    # Undo and redo the changes made through the DataGrid.  Each returns False if there was nothing to undo or redo.
+    @property
+    def UndoLog(self) -> UndoLog:
+        return self._undoLog
+
+    def Undo(self) -> bool:
+        self._grid.SaveEditControlValue()
+        snapshotted=self._selectionSnapshot is None
+        self._SnapshotSelection()
+        if not self._undoLog.Undo(self):
+            if snapshotted:
+                self._selectionSnapshot=None        # Nothing changed, so no refresh will take it
+            return False
+        self.RefreshWxGridFromChanges()
+        return True
+
+    def Redo(self) -> bool:
+        self._grid.SaveEditControlValue()
+        snapshotted=self._selectionSnapshot is None
+        self._SnapshotSelection()
+        if not self._undoLog.Redo(self):
+            if snapshotted:
+                self._selectionSnapshot=None        # Nothing changed, so no refresh will take it
+            return False
+        self.RefreshWxGridFromChanges()
+        return True
+
+    # Put back rows which had been removed (e.g., by DeleteRows()), keeping their RowIDs
+    def _InsertRowObjects(self, irow: int, rows: list[GridDataRowClass]) -> None:
+        ds=self._datasource
+        allrows=ds.Rows
+        allrows[irow:irow]=rows
+        if ds.Rows is not allrows:
+            ds.Rows=allrows
+        ds.InvalidateRowPositions()
+        ds.AllowCellEdits.InsertRows(irow, len(rows))
+        ds.Changes.RowsInserted(irow, len(rows))
+        self._IndexRows(irow, irow+len(rows)-1)
+
+    # Record a change to a block of cells.  Old and new are lists of rows of values starting at (top, left).
+    def _RecordCellsEdit(self, top: int, left: int, old: list[list], new: list[list]) -> None:
+        if self._undoLog.IsRecording and old:
+            rows=self._datasource.Rows
+            self._undoLog.Record(CellsEdit([rows[irow].RowID for irow in range(top, top+len(old))], left, old, new))
+
+    # The values in the block of cells with its upper-left at (top, left)
+    def _BlockValues(self, top: int, left: int, bottom: int, right: int) -> list[list]:
+        rows=self._datasource.Rows
+        return [[rows[irow][icol] for icol in range(left, right+1)] for irow in range(top, bottom+1)]
 
 
     # --------------------------------------------------------
@@ -447,7 +2747,7 @@ class DataGrid():
         self._datasource.AllowCellEdits.append((irow, icol))
         # If necessary, append some empty lines to make this row a real row,
         if irow >= self.NumRows:
-            self._grid.AppendRows(irow-self.NumRows+1)
+            self._AppendGridRows(irow-self.NumRows+1)
 
 
     # --------------------------------------------------------
@@ -473,9 +2773,9 @@ class DataGrid():
         if self._grid.NumberCols == nCols:
             return
         if self._grid.NumberCols > nCols:
-            self._grid.DeleteCols(nCols, self._grid.NumberCols-nCols)
+            self._DeleteGridCols(nCols, self._grid.NumberCols-nCols)
         else:
-            self._grid.AppendCols(nCols-self._grid.NumberCols)
+            self._AppendGridCols(nCols-self._grid.NumberCols)
 
     # --------------------------------------------------------
     @property
@@ -489,11 +2789,60 @@ class DataGrid():
     @Datasource.setter
     def Datasource(self, val: GridDataSource):
         self._datasource=val
+        if self._backgroundValidator is not None:
+            self._backgroundValidator.Clear()
+        self._searchIndex=None
+        self._viewRowIDs=None
+        self._filterText=""
+        self._undoLog.Clear()
+        self._columnWidths.Clear()
+        self._CancelScheduledRefresh()
+        self._scheduledVisibleCell=None
+        self._unpopulatedRows=[]
+        self._selectionSnapshot=None
 
     # --------------------------------------------------------
     @property
     def Grid(self) -> wx.grid.Grid:
-        return self._grid
+        return self._wxGrid
+
+    # --------------------------------------------------------
+    # Change the shape of the wx grid.  In virtual mode the grid's shape is owned by the table, so we tell the table instead.
+    def _AppendGridRows(self, num: int) -> None:
+        if self._table is not None:
+            self._table.Resize(self._table.GetNumberRows()+num, self._table.GetNumberCols())
+        else:
+            self._grid.AppendRows(num)
+
+    def _InsertGridRows(self, pos: int, num: int) -> None:
+        if self._table is not None:
+            self._table.NotifyRowsInserted(pos, num)
+        else:
+            self._grid.InsertRows(pos, num)
+
+    def _DeleteGridRows(self, pos: int, num: int) -> None:
+        if self._table is not None:
+            self._table.NotifyRowsDeleted(pos, num)
+        else:
+            self._grid.DeleteRows(pos, num)
+
+    def _AppendGridCols(self, num: int) -> None:
+        if self._table is not None:
+            self._table.Resize(self._table.GetNumberRows(), self._table.GetNumberCols()+num)
+        else:
+            self._grid.AppendCols(num)
+
+    def _InsertGridCols(self, pos: int, num: int) -> None:
+        if self._table is not None:
+            self._table.NotifyColsInserted(pos, num)
+        else:
+            self._grid.InsertCols(pos, num)
+
+    def _DeleteGridCols(self, pos: int, num: int) -> None:
+        if self._table is not None:
+            self._table.NotifyColsDeleted(pos, num)
+        else:
+            self._grid.DeleteCols(pos, num)
 
     # --------------------------------------------------------
     def AppendRows(self, nrows: int) -> None:
@@ -504,15 +2853,18 @@ class DataGrid():
     # Insert one or more empty rows in the data source.
     # Then refresh the grid
     def InsertEmptyRows(self, irow: int, nrows: int) -> None:       
+        self._SnapshotSelection()
         self.Datasource.InsertEmptyRows(irow, nrows)    # Insert the requisite number of rows at irow
+        if self._undoLog.IsRecording:
+            self._undoLog.Record(RowsChange(irow, self.Datasource.Rows[irow:irow+nrows], True, self.Datasource.NumCols))
 
         # Now update the editable status of non-editable columns
         # All cols numbers >= irow are incremented by nrows
-        for i, (row, col) in enumerate(self._datasource.AllowCellEdits):
-            if row >= irow:
-                self.Datasource.AllowCellEdits[i]=(row+nrows, col)
+        self.Datasource.AllowCellEdits.InsertRows(irow, nrows)
+        self.Datasource.AllowCellEdits.RowsAdded(irow, nrows)
 
-        self.RefreshWxGridFromDatasource()
+        self.Datasource.Changes.RowsInserted(irow, nrows)
+        self.RefreshWxGridFromChanges()
 
     # --------------------------------------------------------
     def DeleteRows(self, irow: int, numrows: int=1) -> None:
@@ -520,18 +2872,17 @@ class DataGrid():
             return
 
         numrows=min(numrows, self.Datasource.NumRows-irow)  # If the request goes beyond the end of the data, ignore the extras
+        self._SnapshotSelection()
+        if self._undoLog.IsRecording:
+            self._undoLog.Record(RowsChange(irow, self.Datasource.Rows[irow:irow+numrows], False, self.Datasource.NumCols))
+        if self._searchIndex is not None:
+            for row in self.Datasource.Rows[irow:irow+numrows]:
+                self._searchIndex.RemoveRow(row.RowID)
         del self.Datasource.Rows[irow:irow+numrows]
+        self.Datasource.Changes.RowsDeleted(irow, numrows)
 
         # We also need to drop entries in AllowCellEdits which refer to these cols and adjust the indexes of ones referring to all later rows
-        for index, (i, j) in enumerate(self.Datasource.AllowCellEdits):
-            if i >= irow:
-                if i < irow+numrows:
-                    # Mark it for deletion
-                    self.Datasource.AllowCellEdits[index]=(-1, -1)  # We tag them rather than deleting them so we don't mess up the enumerate loop
-                else:
-                    # Update it to the new cols indexing scheme
-                    self.Datasource.AllowCellEdits[index]=(i-numrows, j)
-        self.Datasource.AllowCellEdits=[x for x in self.Datasource.AllowCellEdits if x[0] != -1]  # Get rid of the tagged entries
+        self.Datasource.AllowCellEdits.DeleteRows(irow, numrows)
 
 
     # Scroll so as to make as many as possible of the rows visible
@@ -550,7 +2901,7 @@ class DataGrid():
 
     # --------------------------------------------------------
     def AppendEmptyCols(self, ncols: int) -> None:       
-        self._grid.AppendCols(ncols)
+        self._AppendGridCols(ncols)
 
 
     # --------------------------------------------------------
@@ -558,125 +2909,149 @@ class DataGrid():
         # If necessary, change the grid to match the ColDefs
         self.NumCols=len(coldefs)
 
+        # Look up each column's validator now rather than for every cell
+        self._colValidators=[(cd.Type, GetValidator(cd.Type)) for cd in coldefs]
+
         # Add the column headers
+        if self._table is not None:
+            return      # The table supplies the labels directly from the ColDefs
         for i, cd in enumerate(coldefs):
             self._grid.SetColLabelValue(i, cd.Preferred)
 
     # --------------------------------------------------------
+    # Size the columns to fit their contents.  The widths come from ColumnWidths, which measures only what has changed.
+    @_Instrumented("autosize")
     def AutoSizeColumns(self) -> None:
-        self._grid.AutoSizeColumns()
-        if len(self._datasource.ColDefs) == self._grid.NumberCols-1:
-            iCol=0
-            for cd in self._datasource.ColDefs:
-                w=self._grid.GetColSize(iCol)
-                if w < cd.Width:
-                    self._grid.SetColSize(iCol, cd.Width)
-                iCol+=1
+        coldefs=self._datasource.ColDefs
+        ncols=min(len(coldefs), self._grid.NumberCols)
+        clamp=len(coldefs) == self._grid.NumberCols-1
+        for iCol in range(ncols):
+            w=self._columnWidths.Width(iCol)
+            if clamp and w < coldefs[iCol].Width:
+                w=coldefs[iCol].Width
+            if w != self._grid.GetColSize(iCol):
+                self._grid.SetColSize(iCol, w)
 
     # --------------------------------------------------------
     def SetCellBackgroundColor(self, irow: int, icol: int, color) -> None:
         self._grid.SetCellBackgroundColour(irow, icol, color)
 
     # --------------------------------------------------------
+    # The validator for a column.  These are looked up once, by SetColHeaders(), but are checked against the column's
+    # current Type in case the ColDefs have been changed since.
+    def _ColumnValidator(self, icol: int, coldef: ColDefinition) -> CellValidator|None:
+        if icol < len(self._colValidators):
+            coltype, validator=self._colValidators[icol]
+            if coltype == coldef.Type:
+                return validator
+        return GetValidator(coldef.Type)
+
+
+    # --------------------------------------------------------
+    # Decide how a cell should look, based on its column's definition, its row and its value.
+    # This touches only the datasource (never the wx grid), so it is cheap enough to call while wx is painting.
     # Row, col are Grid coordinates
-    def ColorSingleCellByValue(self, irow: int, icol: int) -> None:       
-        # Start by setting color to white
-        self.SetCellBackgroundColor(irow, icol, Color.White)
+    def GetCellStyle(self, irow: int, icol: int) -> CellStyle:
+        ds=self._datasource
 
         # Deal with col overflow
-        if icol >= len(self._datasource.ColDefs):
-            return
+        if icol >= len(ds.ColDefs):
+            return CellStyle(Color.White)
 
-        if irow >= self.Datasource.NumRows:
+        coldef=ds.ColDefs[icol]
+        if irow < 0 or irow >= ds.NumRows:
             # These are trailing rows and should get default formatting
             # Row overflow is permitted and extra rows (rows in the grid, but not in the datasource) are colored generically
-            self._grid.SetCellSize(irow, icol, 1, 1)  # Eliminate any spans
-            self._grid.SetCellFont(irow, icol, self._grid.GetCellFont(irow, icol).GetBaseFont())
-            if self._datasource.ColDefs[icol].IsEditable == IsEditable.No or self._datasource.ColDefs[icol].IsEditable == IsEditable.Maybe:
-                self.SetCellBackgroundColor(irow, icol, Color.LightGray)
-            return
+            if coldef.IsEditable == IsEditable.No or coldef.IsEditable == IsEditable.Maybe:
+                return CellStyle(Color.LightGray)
+            return CellStyle(Color.White)
 
         # We're now in a col that includes data
-        # First turn off any special formatting
-        self._grid.SetCellFont(irow, icol, self._grid.GetCellFont(irow, icol).GetBaseFont())
-        self.SetCellBackgroundColor(irow, icol, Color.White)
-        self._grid.SetCellTextColour(irow, icol, Color.Black)
+        row=ds.Rows[irow]
+        val=ds[irow][icol]
+        val="" if val is None else str(val)
+        background=Color.White
+        text=Color.Black
+        font=FontStyle.Normal
 
         # If the col is a text col and if there's a special text color
         # The special text color can be a color, which we then use to color the text or
         # It can be anything else, in which case we BOLD the text.
-        if irow < self._datasource.NumRows and self._datasource.Rows[irow].IsTextRow:
-            if self._datasource.SpecialTextColor is not None:
-                self.SetCellBackgroundColor(irow, icol, self._datasource.SpecialTextColor)
+        if row.IsTextRow:
+            if ds.SpecialTextColor is not None:
+                background=ds.SpecialTextColor
             else:
-                self._grid.SetCellFont(irow, icol, self._grid.GetCellFont(irow, icol).Bold())
+                font=FontStyle.Bold
 
         # If the col is a link col give it the look of a link
-        elif irow < self._datasource.NumRows and self._datasource.Rows[irow].IsLinkRow:
-            _, hrefcol=self.Datasource.TextAndHrefCols
-            # Is there a "Display Name" column?
-            self._grid.SetCellFont(irow, hrefcol, self._grid.GetCellFont(irow, icol).Underlined())
+        elif row.IsLinkRow:
+            _, hrefcol=ds.TextAndHrefCols
+            if icol == hrefcol:
+                font=FontStyle.Underlined
 
         # If the column is not editable, color it light gray regardless of its value
-        elif self._datasource.ColDefs[icol].IsEditable == IsEditable.No:
-            self.SetCellBackgroundColor(irow, icol, Color.LightGray)
-
-        elif self._datasource.ColDefs[icol].IsEditable == IsEditable.Maybe and (irow, icol) not in self._datasource.AllowCellEdits:
-            self.SetCellBackgroundColor(irow, icol, Color.LightGray)
-
-        else:
-            # If it *is* editable or potentially editable, then color it according to its value
-            # We skip testing for "str"-type columns since anything at all is OK in a str column
-            if not self._datasource.Rows[irow].IsEmptyRow:  # Don't bother filling in colors in completely empty rows
-                val=self._grid.GetCellValue(irow, icol)
-                if val is not None:
-                    if self._datasource.ColDefs[icol].Type == "int" or self._datasource.ColDefs[icol].Type == "day" or self._datasource.ColDefs[icol].Type == "year":
-                        if val != "" and not IsInt(val):
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    if self._datasource.ColDefs[icol].Type == "float":
-                        if val != "" and not IsNumeric(val):
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    elif self._datasource.ColDefs[icol].Type == "year":             # Year number is out of plausible range
-                        if IsInt(val) and (int(val) < 1926 or int(val) > 2050):
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    elif self._datasource.ColDefs[icol].Type == "day":             # Day number is out of plausible range
-                        if IsInt(val) and (int(val) < 1 or int(val) > 31):
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    elif self._datasource.ColDefs[icol].Type == "month":             # Month number is out of plausible range or month name is not recognized
-                        if IsInt(val):
-                            if int(val) < 1 or int(val) > 12:
-                                self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                        else:
-                            lowermonths=["", "jan", "january", "feb", "february", "mar", "march", "apr",
-                                    "april", "may", "jun", "june", "jul", "july", "aug", "august",
-                                    "sep", "sept", "september", "oct", "october", "nov", "november",
-                                    "dec", "december", "fal", "fall", "autumn", "win", "winter", "spr", "spring", "sum", "summer"]
-                            if val.lower().strip() not in lowermonths:
-                                self.SetCellBackgroundColor(irow, icol, Color.Pink)
-
-
-                    elif self._datasource.ColDefs[icol].Type == "date range":
-                        if val is not None and val != "" and FanzineDateRange().Match(val).IsEmpty():
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    elif self._datasource.ColDefs[icol].Type == "date":
-                        if val is not None and val != "" and FanzineDate().Match(val).IsEmpty():
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
-                    elif self._datasource.ColDefs[icol].Type == "required str":
-                        if val is None or len(val) == 0:
-                            self.SetCellBackgroundColor(irow, icol, Color.Pink)
+        elif coldef.IsEditable == IsEditable.No:
+            background=Color.LightGray
+
+        elif coldef.IsEditable == IsEditable.Maybe and (irow, icol) not in ds.AllowCellEdits:
+            background=Color.LightGray
+
+        # If it *is* editable or potentially editable, then color it according to its value
+        elif not row.IsEmptyRow:  # Don't bother filling in colors in completely empty rows
+            validator=self._ColumnValidator(icol, coldef)
+            if validator is not None:
+                invalid=None
+                if self._backgroundValidator is not None:
+                    invalid=self._backgroundValidator.IsInvalid(coldef, validator, row.RowID)
+                if invalid is None:
+                    invalid=not validator.IsValidCached(val)
+                if invalid:
+                    background=Color.Pink
 
         # Special handling for URLs: we add an underline and paint the text blue
-        if self._datasource.ColDefs[icol].Type == "url" and not self._datasource.Rows[irow].IsTextRow:
-            val=self._grid.GetCellValue(irow, icol)
-            font=self._grid.GetCellFont(irow, icol)
-            if val is not None and val != "": # and self._datasource.Rows[irow].URL:
-                self._grid.SetCellTextColour(irow, icol, Color.Blue)
-                font.MakeUnderlined()
-                self._grid.SetCellFont(irow, icol, font)
+        if coldef.Type == "url" and not row.IsTextRow:
+            if val != "":
+                text=Color.Blue
+                font=FontStyle.Underlined
             else:
-                # self._grid.SetCellTextColour(irow, icol, Color.Blue)
-                font.SetUnderlined(False)
-                self._grid.SetCellFont(irow, icol, font)
+                font=FontStyle.Normal
+
+        return CellStyle(background, text, font)
+
+
+    # --------------------------------------------------------
+    # Row, col are Grid coordinates
+    def ColorSingleCellByValue(self, irow: int, icol: int) -> None:       
+        if self._batchDepth > 0 and irow < self.Datasource.NumRows:
+            self._datasource.Changes.MarkRowsDirty(irow)
+            self._pendingRefresh.Requested=True
+            return
+
+        if self._backgroundValidator is not None:
+            self._RevalidateCells(irow, irow, icol, icol)
+        self._ColorCell(irow, icol)
+
+
+    # Color a cell without revalidating it
+    def _ColorCell(self, irow: int, icol: int) -> None:
+        if self._attrProvider is not None:
+            # The attr provider styles the cell when it is next painted
+            if callable(self._colorSingleCellByValue):
+                self._colorSingleCellByValue(icol, irow)
+            self._grid.ForceRefresh()
+            return
+
+        style=self.GetCellStyle(irow, icol)
+        if irow >= self.Datasource.NumRows:
+            self._grid.SetCellSize(irow, icol, 1, 1)  # Eliminate any spans
+        self.SetCellBackgroundColor(irow, icol, style.Background)
+        self._grid.SetCellTextColour(irow, icol, style.Text)
+        font=self._grid.GetCellFont(irow, icol).GetBaseFont()
+        if style.Font == FontStyle.Bold:
+            font=font.Bold()
+        elif style.Font == FontStyle.Underlined:
+            font=font.Underlined()
+        self._grid.SetCellFont(irow, icol, font)
 
         # Finally, if an override was specified, give it a call
         if callable(self._colorSingleCellByValue):
@@ -689,6 +3064,10 @@ class DataGrid():
     # Rows are inclusive (I.e., StartRow=1 and EndRow=2 colors both rows 1 and 2.
     def ColorCellsByValue(self, StartRow: int=-1, EndRow: int=-1, StartCol: int=-1, EndCol: int=-1):       
         # Analyze the data and highlight cells where the data type doesn't match the type specified by ColHeaders.  (E.g., Volume='August', Month='17', year='20')
+        if self._batchDepth > 0:
+            self._DeferColoring(StartRow=StartRow, EndRow=EndRow, StartCol=StartCol, EndCol=EndCol)
+            return
+
         if StartRow == -1:
             StartRow=0
         if EndRow == -1:
@@ -698,9 +3077,52 @@ class DataGrid():
         if EndCol == -1:
             EndCol=self._grid.NumberCols-1
 
-        for iRow in range(StartRow, EndRow+1):
-            for iCol in range(StartCol, EndCol+1):
-                self.ColorSingleCellByValue(iRow, iCol)
+        if self._backgroundValidator is not None:
+            if EndRow-StartRow+1 > self._backgroundValidationRows:
+                self._backgroundValidator.Schedule(list(range(StartCol, EndCol+1)), StartRow, EndRow)
+            else:
+                self._RevalidateCells(StartRow, EndRow, StartCol, EndCol)
+
+        with self._Phase("color", Rows=max(EndRow-StartRow+1, 0), Cells=max(EndRow-StartRow+1, 0)*max(EndCol-StartCol+1, 0)):
+            if self._attrProvider is not None:
+                # Cells are styled by the attr provider as they are painted, so there's nothing to do but the overrides and a repaint
+                if callable(self._colorSingleCellByValue):
+                    for iRow in range(StartRow, EndRow+1):
+                        for iCol in range(StartCol, EndCol+1):
+                            self._colorSingleCellByValue(iCol, iRow)
+                self._grid.ForceRefresh()
+                return
+
+            for iRow in range(StartRow, EndRow+1):
+                for iCol in range(StartCol, EndCol+1):
+                    self._ColorCell(iRow, iCol)
+
+
+    # With BackgroundValidation, validate a (small) box of cells right now and record the results
+    def _RevalidateCells(self, StartRow: int, EndRow: int, StartCol: int, EndCol: int) -> None:
+        ds=self._datasource
+        for iCol in range(StartCol, min(EndCol, ds.NumCols-1)+1):
+            coldef=ds.ColDefs[iCol]
+            validator=self._ColumnValidator(iCol, coldef)
+            if validator is None:
+                continue
+            for iRow in range(StartRow, min(EndRow, ds.NumRows-1)+1):
+                val=ds[iRow][iCol]
+                invalid=not validator.IsValidCached("" if val is None else str(val))
+                self._backgroundValidator.NoteCell(coldef, validator, ds.Rows[iRow].RowID, invalid)
+
+
+    # Recolor the cells in column icol of the rows with these RowIDs.  (Used when background validation results come in.)
+    def _RecolorRows(self, icol: int, rowIDs: set[int]) -> None:
+        if not rowIDs:
+            return
+        if self._attrProvider is not None:
+            self._grid.ForceRefresh()
+            return
+        for rowID in rowIDs:
+            irow=self._datasource.RowPosition(rowID)
+            if irow >= 0:
+                self._ColorCell(irow, icol)
 
     # --------------------------------------------------------
     def GetSelectedRowRange(self) -> tuple[int, int]|None:       
@@ -720,84 +3142,365 @@ class DataGrid():
         return None
 
     # ------------------
+    @_Instrumented("refresh")
     def RefreshWxGridFromDatasource(self, RetainSelection: bool=True, StartRow: int=-1, EndRow: int=-1, StartCol: int=-1, EndCol: int=-1, RetainCursorPos: bool=True):       
-        #Log("RefreshWxGridFromDatasource entered")
-        selection=Selection(self._grid)
+        if self._batchDepth > 0:
+            self._DeferRefresh(StartRow, EndRow, StartCol, EndCol, RetainSelection, RetainCursorPos)
+            return
+        if self._viewRowIDs is not None:
+            self._RefreshFilteredView()
+            return
 
-        cursrow=self._grid.GetGridCursorRow()
-        curscol=self._grid.GetGridCursorCol()
+        # The selection and the cursor, with the cursor's row by RowID so it can stay with its row.  If they were saved before the
+        #   datasource was changed, use those.  (Taking them now would find whatever rows have since moved to their positions.)
+        snapshot=self._selectionSnapshot
+        self._selectionSnapshot=None
+        selection, cursorID, cursrow, curscol=snapshot if snapshot is not None else self._CaptureSelection()
 
         # When both StartRow and EndRow != -1 or both StartCol and EndCol != -1, we want only a portion of the grid to be redisplayed.
         # We are saying:
         #   (1) that only the StartRow to EndRow rows may have changed and
         #   (2) That the number of rows is unchanged
         #   (3) We do not need to change ths state of scrolling
-        #   (4) We do not need to change the column headers or the column widths
+        #   (4) We do not need to change the column headers, and the column widths need only take in the changed cells
         # This will most typically be used for moving a small block of rows up or down one row
         if StartRow != -1 and EndRow != -1 and StartRow <= EndRow and StartCol != -1 and EndCol != -1 and StartCol <= EndCol:
+            self._GrowGridToDatasource()
             # Reload the cells
-            for irow in range(StartRow, EndRow+1):
-                for icol in range(StartCol, EndCol+1):
-                    self.ReloadCell(irow, icol)
+            with self._Phase("reload", Rows=EndRow-StartRow+1, Cells=(EndRow-StartRow+1)*(EndCol-StartCol+1)):
+                for irow in range(StartRow, EndRow+1):
+                    for icol in range(StartCol, EndCol+1):
+                        self.ReloadCell(irow, icol)
             self.ColorCellsByValue(StartRow=StartRow, EndRow=EndRow, StartCol=StartCol, EndCol=EndCol)
             self.SetColHeaders(self._datasource.ColDefs)
+            self._columnWidths.NoteRows(StartRow, EndRow, StartCol, EndCol)
+            self.AutoSizeColumns()
+            if snapshot is not None:
+                self._RestoreSelection(snapshot)
+            self._RepaintIfVirtual()
             return
 
         if StartRow != -1 and EndRow != -1 and StartRow <= EndRow and StartCol == -1 and EndCol == -1:
+            self._GrowGridToDatasource()
             # Reload the cells
-            #Log("RefreshWxGridFromDatasource ReloadRows started")
-            for irow in range(StartRow, EndRow+1):
-                self.ReloadRow(irow)
+            with self._Phase("reload", Rows=EndRow-StartRow+1, Cells=(EndRow-StartRow+1)*self.Datasource.NumCols):
+                for irow in range(StartRow, EndRow+1):
+                    self.ReloadRow(irow)
             self.ColorCellsByValue(StartRow=StartRow, EndRow=EndRow)
-            #Log("RefreshWxGridFromDatasource ReloadRows ended")
+            self._columnWidths.NoteRows(StartRow, EndRow)
+            self.AutoSizeColumns()
+            if not self._datasource.Changes.Structural:     # These rows are now up to date
+                self._datasource.Changes.DirtyRows.difference_update(range(StartRow, EndRow+1))
+            if snapshot is not None:
+                self._RestoreSelection(snapshot)
+            self._RepaintIfVirtual()
             return
 
         # Likewise for columns
         if StartCol != -1 and EndCol != -1 and StartCol <= EndCol and StartRow == -1 and EndRow == -1:
+            self._GrowGridToDatasource()
             # Reload the cells
-            for irow in range(self.Datasource.NumRows):
-                for icol in range(StartCol, EndCol+1):
-                    self.ReloadCell(irow, icol)
+            if self._table is None:
+                with self._Phase("reload", Rows=self.Datasource.NumRows, Cells=self.Datasource.NumRows*(EndCol-StartCol+1)):
+                    for irow in range(self.Datasource.NumRows):
+                        for icol in range(StartCol, EndCol+1):
+                            self.ReloadCell(irow, icol)
             self.ColorCellsByValue(StartCol=StartCol, EndCol=EndCol)
             self.SetColHeaders(self._datasource.ColDefs)
+            for icol in range(StartCol, EndCol+1):
+                self._columnWidths.ForgetColumn(icol)
+            self.AutoSizeColumns()
+            if not self._datasource.Changes.Structural:     # These columns are now up to date
+                self._datasource.Changes.DirtyCols.difference_update(range(StartCol, EndCol+1))
+            if snapshot is not None:
+                self._RestoreSelection(snapshot)
+            self._RepaintIfVirtual()
             return
 
-        #Log("RefreshWxGridFromDatasource stage #1")
-        # Record the visible lines so we can make them visible again later
-        visibleRows=[]
-        if self._grid.NumberCols > 0:
-            visibleRows=[i for i in range(self._grid.NumberRows) if self._grid.IsVisible(i, 0, wholeCellVisible=True)]
+        # Everything is about to be reloaded, so any recorded changes (and any refresh queued by ScheduleRefresh()) are moot
+        self._datasource.Changes.Clear()
+        self._CancelScheduledRefresh()
+
+        # Record the scroll position and the lines on screen so we can show them again later
+        viewStart=self._grid.GetViewStart()
+        firstVisible, lastVisible=self._ViewportRows()
 
         scroll=self._grid.ScrollLineX
 
-        self._grid.ClearGrid()
+        if self._table is None:
+            self._grid.ClearGrid()
         if self._grid.NumberRows > 0:
-            self._grid.DeleteRows(0, self._grid.NumberRows)
-        #Log("RefreshWxGridFromDatasource stage #2")
+            self._DeleteGridRows(0, self._grid.NumberRows)
         self.SetColHeaders(self._datasource.ColDefs)
         # Put in the requisite rows plus 5 spares
-        self._grid.AppendRows(self._datasource.NumRows+12)
-        #Log("RefreshWxGridFromDatasource stage #4")
-        # Fill in the cells
-        for irow in range(self._datasource.NumRows):
-            self.ReloadRow(irow)
-        #Log("RefreshWxGridFromDatasource stage #5")
-
-        self.ColorCellsByValue()
+        self._AppendGridRows(self._datasource.NumRows+self._spareRows)
+        # Fill in the cells.  With ViewportFirst, only those on screen (or near it) are filled now, and the rest when the app is idle.
+        self._unpopulatedRows=[]
+        first, last=0, self._grid.NumberRows-1
+        if self._viewportFirst and self._grid.NumberRows > 2*self._viewportMarginRows+max(lastVisible-firstVisible+1, 0):
+            # The rows which will be on screen: those which were, if they're going to be shown again, and otherwise those which are now
+            loadFirst, loadLast=(firstVisible, lastVisible) if RetainSelection and firstVisible >= 0 else self._ViewportRows()
+            first=min(max(loadFirst-self._viewportMarginRows, 0), self._grid.NumberRows-1)
+            last=min(max(loadLast, first)+self._viewportMarginRows, self._grid.NumberRows-1)
+            if first > 0:
+                self._unpopulatedRows.append([0, first-1])
+            if last < self._grid.NumberRows-1:
+                self._unpopulatedRows.append([last+1, self._grid.NumberRows-1])
+            self._BindIdle()
+        self._LoadRows(first, last)
+        if self._unpopulatedRows:
+            self.ColorCellsByValue(StartRow=first, EndRow=last)
+            # Size the columns from the rows loaded; _PopulateRows() widens them as it loads the rest.  The widths are kept, not
+            #   cleared: every row is measured again as it's loaded, which corrects any that have changed.
+            self._columnWidths.NoteRowsLoaded(first, last)
+        else:
+            self.ColorCellsByValue()
+            self._columnWidths.Clear()      # Anything may have changed, so measure everything (mostly from the cache)
         self.AutoSizeColumns()
         #self._grid.AutoSize()
-        #Log("RefreshWxGridFromDatasource stage #6")
 
         if RetainCursorPos:
+            if cursorID is not None and self._datasource.RowPosition(cursorID) >= 0:
+                cursrow=self._datasource.RowPosition(cursorID)
             self._grid.SetGridCursor(cursrow, curscol)
 
         if RetainSelection:
-            selection.Restore(self._grid)
-            # Make the lines which were visible before we messed with things visible again
-            if visibleRows:
-                self._grid.MakeCellVisible(min(visibleRows), 0)
-                self._grid.MakeCellVisible(max(visibleRows), 0)
-        #Log("RefreshWxGridFromDatasource Done")
+            with self._Phase("selection restore"):
+                selection.Restore(self._grid)
+                # Make the lines which were visible before we messed with things visible again
+                if firstVisible >= 0:
+                    self._grid.Scroll(-1, viewStart[1])
+        self._RepaintIfVirtual()
+
+
+    #--------------------------------------------------
+    # The selection and the cursor as (Selection, cursor's RowID, cursor row, cursor col)
+    def _CaptureSelection(self) -> tuple[Selection, int|None, int, int]:
+        cursrow=self._grid.GetGridCursorRow()
+        return Selection(self._grid, self._datasource), self._datasource.RowIDAt(cursrow), cursrow, self._grid.GetGridCursorCol()
+
+    # Call this before rows are sorted, moved, inserted or deleted: it remembers the selection and the cursor by RowID so that
+    #   the next refresh can put them back on the same rows.  A snapshot already taken since the last refresh is kept.
+    # The snapshot is dropped once a refresh has restored it, or if the selection is set anew (e.g., by SelectRows()) before then.
+    def _SnapshotSelection(self) -> None:
+        if self._selectionSnapshot is None and self._viewRowIDs is None:
+            self._selectionSnapshot=self._CaptureSelection()
+
+    def _RestoreSelection(self, snapshot: tuple[Selection, int|None, int, int]) -> None:
+        selection, cursorID, cursrow, curscol=snapshot
+        if cursorID is not None and self._datasource.RowPosition(cursorID) >= 0:
+            cursrow=self._datasource.RowPosition(cursorID)
+        if cursrow < self._grid.NumberRows and curscol < self._grid.NumberCols:
+            self._grid.SetGridCursor(cursrow, curscol)
+        selection.Restore(self._grid)
+
+
+    #--------------------------------------------------
+    # The first and last grid rows on screen, found from the scroll position rather than by asking about every row.
+    # (-1, -1) if the grid has no rows.
+    def _ViewportRows(self) -> tuple[int, int]:
+        if self._grid.NumberRows == 0:
+            return -1, -1
+        top=self._grid.GetViewStart()[1]*self._grid.GetScrollPixelsPerUnit()[1]
+        height=max(self._grid.GetGridWindow().GetClientSize().GetHeight(), 1)
+        return self._grid.YToRow(top, clipToMinMax=True), self._grid.YToRow(top+height-1, clipToMinMax=True)
+
+
+    #--------------------------------------------------
+    # Fill in grid rows start..end (inclusive) from the datasource, as a full refresh does
+    def _LoadRows(self, start: int, end: int) -> None:
+        end=min(end, self._datasource.NumRows-1)
+        if start > end:
+            return
+        with self._Phase("reload", Rows=end-start+1, Cells=(end-start+1)*self._datasource.NumCols if self._table is None else 0):
+            if self._table is None:
+                for irow in range(start, end+1):
+                    self.ReloadRow(irow)
+            else:
+                # In virtual mode the values come straight from the datasource, so all that's needed is to merge text rows
+                # (Deleting all the rows in the full refresh has already removed any old merges.)
+                rows=self._datasource.Rows
+                for irow in range(start, end+1):
+                    if rows[irow].IsTextRow:
+                        self._grid.SetCellSize(irow, 0, 1, self.NumCols)
+
+
+    #--------------------------------------------------
+    # With ViewportFirst, load and color those of grid rows start..end (inclusive) which a full refresh has left for later
+    def _PopulateRows(self, start: int, end: int) -> None:
+        remaining: list[list[int]]=[]
+        todo: list[tuple[int, int]]=[]
+        for s, e in self._unpopulatedRows:
+            if e < start or s > end:
+                remaining.append([s, e])
+                continue
+            if s < start:
+                remaining.append([s, start-1])
+            if e > end:
+                remaining.append([end+1, e])
+            todo.append((max(s, start), min(e, end)))
+        if not todo:
+            return
+        self._unpopulatedRows=remaining
+        with self._Phase("populate", Rows=sum(e-s+1 for s, e in todo)):
+            self._grid.BeginBatch()
+            try:
+                for s, e in todo:
+                    self._LoadRows(s, e)
+                    self.ColorCellsByValue(StartRow=s, EndRow=e)
+                    self._columnWidths.NoteRowsLoaded(s, e)
+                self.AutoSizeColumns()
+            finally:
+                self._grid.EndBatch()
+
+    # Load the next chunk of the rows left for later: those on screen first, if any are, and then from the top down
+    def _PopulateNextChunk(self) -> None:
+        first, last=self._ViewportRows()
+        if first >= 0:
+            for s, e in self._unpopulatedRows:
+                if s <= last and e >= first:
+                    self._PopulateRows(max(first-self._viewportMarginRows, s), min(last+self._viewportMarginRows, e))
+                    return
+        s, e=self._unpopulatedRows[0]
+        self._PopulateRows(s, min(e, s+self._populateChunkRows-1))
+
+    # Load and color everything a ViewportFirst refresh left for later now, e.g. before reading back all of the grid's cells
+    def PopulateAllRows(self) -> None:
+        while self._unpopulatedRows:
+            self._PopulateRows(self._unpopulatedRows[0][0], self._unpopulatedRows[-1][1])
+
+    @property
+    def IsFullyPopulated(self) -> bool:
+        return not self._unpopulatedRows
+
+    # Keep the rows left for later in step with rows inserted into or deleted from the grid.  (Inserted rows are loaded when they're inserted.)
+    def _ShiftUnpopulatedRows(self, kind: str, index: int, num: int) -> None:
+        shifted: list[list[int]]=[]
+        for s, e in self._unpopulatedRows:
+            if e < index:
+                shifted.append([s, e])
+            elif kind == "insert rows":
+                if s >= index:
+                    shifted.append([s+num, e+num])
+                else:
+                    shifted.extend([[s, index-1], [index+num, e+num]])
+            else:
+                if s < index:
+                    shifted.append([s, index-1])
+                if e >= index+num:
+                    shifted.append([max(s, index+num)-num, e-num])
+        # A deletion can leave two ranges side by side
+        merged: list[list[int]]=[]
+        for s, e in shifted:
+            if merged and s <= merged[-1][1]+1:
+                merged[-1][1]=max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        self._unpopulatedRows=merged
+
+
+    #--------------------------------------------------
+    # Make sure the grid has a row for every datasource row.  (Partial refreshes otherwise assume the grid's size
+    # is unchanged, but the datasource may have grown by a cell being edited or pasted beyond its end.)
+    def _GrowGridToDatasource(self) -> None:
+        if self._grid.NumberRows < self._datasource.NumRows:
+            self._AppendGridRows(self._datasource.NumRows+self._spareRows-self._grid.NumberRows)
+        if self._grid.NumberCols < len(self._datasource.ColDefs):
+            self._AppendGridCols(len(self._datasource.ColDefs)-self._grid.NumberCols)
+
+
+    #--------------------------------------------------
+    # Bring the grid up to date by applying only the changes recorded in the datasource's Changes since the last refresh:
+    # inserted and deleted rows and columns are inserted and deleted in the grid, and then the dirty rows and columns
+    # are reloaded and recolored.  This costs about the same no matter how big the grid is.
+    @_Instrumented("refresh changes")
+    def RefreshWxGridFromChanges(self) -> None:
+        if self._batchDepth > 0:
+            self._pendingRefresh.Requested=True
+            return
+        if self._viewRowIDs is not None:
+            self._RefreshFilteredView()
+            return
+
+        changes=self._datasource.Changes
+
+        # The deltas can only be replayed onto a grid which was loaded from this datasource.
+        # If the grid has never been loaded or has drifted out of step, just do a full refresh.
+        if self._grid.NumberRows == 0 and self._datasource.NumRows > 0:
+            self.RefreshWxGridFromDatasource()
+            return
+        nrows=self._grid.NumberRows
+        ncols=self._grid.NumberCols
+        for kind, index, num in changes.Structural:
+            match kind:
+                case "insert rows":
+                    ok=index <= nrows
+                    nrows+=num
+                case "delete rows":
+                    ok=index+num <= nrows
+                    nrows-=num
+                case "insert cols":
+                    ok=index <= ncols
+                    ncols+=num
+                case _:
+                    ok=index+num <= ncols
+                    ncols-=num
+            if not ok:
+                self.RefreshWxGridFromDatasource()
+                return
+
+        self._grid.BeginBatch()
+        for kind, index, num in changes.Structural:
+            if self._unpopulatedRows and kind.endswith("rows"):
+                self._ShiftUnpopulatedRows(kind, index, num)
+            match kind:
+                case "insert rows":
+                    self._InsertGridRows(index, num)
+                case "delete rows":
+                    self._DeleteGridRows(index, num)
+                case "insert cols":
+                    self._InsertGridCols(index, num)
+                case "delete cols":
+                    self._DeleteGridCols(index, num)
+        colsChanged=any(kind.endswith("cols") for kind, _, _ in changes.Structural)
+        rowsDeleted=any(kind == "delete rows" for kind, _, _ in changes.Structural)
+        if rowsDeleted:
+            self._columnWidths.NoteRowsDeleted()
+
+        self.SetColHeaders(self._datasource.ColDefs)
+        self._GrowGridToDatasource()
+
+        for start, end in CollapseToRanges(r for r in changes.DirtyRows if r < self._datasource.NumRows):
+            with self._Phase("reload", Rows=end-start+1, Cells=(end-start+1)*self._datasource.NumCols):
+                for irow in range(start, end+1):
+                    self.ReloadRow(irow)
+            self.ColorCellsByValue(StartRow=start, EndRow=end)
+            self._columnWidths.NoteRows(start, end)
+        for start, end in CollapseToRanges(c for c in changes.DirtyCols if c < len(self._datasource.ColDefs)):
+            for icol in range(start, end+1):
+                self._columnWidths.ForgetColumn(icol)
+            if self._table is None:
+                with self._Phase("reload", Rows=self._datasource.NumRows, Cells=self._datasource.NumRows*(end-start+1)):
+                    for irow in range(self._datasource.NumRows):
+                        for icol in range(start, end+1):
+                            self.ReloadCell(irow, icol)
+            self.ColorCellsByValue(StartCol=start, EndCol=end)
+
+        if colsChanged or rowsDeleted or changes.DirtyCols or changes.DirtyRows:
+            self.AutoSizeColumns()
+        changes.Clear()
+        if self._selectionSnapshot is not None:
+            self._RestoreSelection(self._selectionSnapshot)
+            self._selectionSnapshot=None
+        self._grid.EndBatch()
+        self._RepaintIfVirtual()
+
+
+    #--------------------------------------------------
+    # Nothing is copied into a virtual grid, so it must be told to repaint to pick up changed values
+    def _RepaintIfVirtual(self) -> None:
+        if self._table is not None:
+            self._grid.ForceRefresh()
 
 
 
@@ -823,7 +3526,8 @@ class DataGrid():
         else:
             self._grid.SetCellSize(irow, 0, 1, 1)  # Set as normal unspanned cell
 
-
+        if self._table is not None:
+            return      # In virtual mode the grid gets its values straight from the datasource
 
         # Fill in the cell values
         for icol in range(len(self._datasource.ColDefs)):
@@ -854,6 +3558,9 @@ class DataGrid():
         # else:
         #     self._grid.SetCellSize(irow, 0, 1, 1)  # Set as normal unspanned cell
 
+        if self._table is not None:
+            return      # In virtual mode the grid gets its values straight from the datasource
+
         val=self._datasource[irow][icol]
         if val is None:
             val=""
@@ -867,50 +3574,72 @@ class DataGrid():
     # All cols numbers are logical
     # Oldrow is the 1st cols of the block to be moved
     # Newrow is the target position to which oldrow is moved
+    @_Instrumented("move")
     def MoveRows(self, oldrow: int, numrows: int, newrow: int):       
-        rows=self._datasource.Rows
+        self._SnapshotSelection()
+        self._datasource.MoveRowBlock(oldrow, numrows, newrow)
+        self._undoLog.Record(RowsMove(oldrow, numrows, newrow))     # Successive moves of the same block (e.g., by arrow keys) are merged
 
-        dest=newrow
-        start=oldrow
-        end=oldrow+numrows-1
-        if newrow < oldrow:
-            # Move earlier
-            b1=rows[0:dest]
-            i1=list(range(0, dest))
-            b2=rows[dest:start]
-            i2=list(range(dest, start))
-            b3=rows[start:end+1]
-            i3=list(range(start, end+1))
-            b4=rows[end+1:]
-            i4=list(range(end+1, len(rows)))
-        else:
-            # Move later
-            b1=rows[0:start]
-            i1=list(range(0, start))
-            b2=rows[start:end+1]
-            i2=list(range(start, end+1))
-            b3=rows[end+1:end+1+dest-start]
-            i3=list(range(end+1, end+1+dest-start))
-            b4=rows[end+1+dest-start:]
-            i4=list(range(end+1+dest-start, len(rows)))
-
-        rows=b1+b3+b2+b4
-        self._datasource.Rows=rows
-
-        tpermuter=i1+i3+i2+i4
-        permuter=[-1]*len(tpermuter)     # This next bit of code inverts the permuter into its anti-permuter. (There ought to be a more elegant way to generate it!)
-        for i, r in enumerate(tpermuter):
-            permuter[r]=i
-
-        # Log("\npermuter: "+str(permuter))
-        # Log("old editable rows: "+str(sorted(list(set([x[0] for x in self._datasource.AllowCellEdits])))))
-        # Now use the permuter to update the cols numbers of the cells which are allowed to be edited
-        for i, (row, col) in enumerate(self._datasource.AllowCellEdits):
-            try:
-                self._datasource.AllowCellEdits[i]=(permuter[row], col)
-            except IndexError:
-                pass
-        # Log("new editable rows: "+str(sorted(list(set([x[0] for x in self._datasource.AllowCellEdits])))))
+        # Cells in the datasource which are allowed to be edited are recorded by RowID and so follow their rows,
+        # but those beyond the end of the data are recorded by row number
+        self._datasource.AllowCellEdits.MoveRows(oldrow, numrows, newrow)
+
+
+    #--------------------------------------------------------
+    # Sort the rows of the datasource.  Keys is a list of columns, most significant first, each given by number or name and
+    #   optionally paired with a bool which is False for a descending sort, e.g., SortByColumns(["Year", ("Issue", False)]).
+    # Values are compared according to their column's Type (see RegisterSortKey()).  Empty cells sort last.  The sort is stable.
+    # Editable cells, the selection and the cursor are recorded by RowID and so stay with their rows.
+    def SortByColumns(self, keys: list[int|str|tuple[int|str, bool]]) -> None:
+        self._grid.SaveEditControlValue()
+        ds=self._datasource
+        rows=ds.Rows
+        order=list(range(len(rows)))
+        # Sort on each column in turn, least significant first, relying on the sort being stable
+        for key in reversed(keys):
+            col, ascending=key if isinstance(key, tuple) else (key, True)
+            icol=col if isinstance(col, int) else ds.ColDefs.index(col)
+            sortkeys=self._SortKeys(icol, rows)
+            if not ascending:
+                # Reversing would put the empty cells first, so rank them lowest
+                sortkeys=[k if k[0] != 2 else (-1,) for k in sortkeys]
+            order.sort(key=sortkeys.__getitem__, reverse=not ascending)
+
+        if all(i == j for i, j in enumerate(order)):
+            return      # Already in order
+        if self._undoLog.IsRecording:
+            self._undoLog.Record(RowsReorder([row.RowID for row in rows], [rows[i].RowID for i in order]))
+        self._SnapshotSelection()
+        ds.Rows=[rows[i] for i in order]
+        ds.InvalidateRowPositions()
+        self.RefreshWxGridFromDatasource()
+
+
+    # The sort key of each row's cell in column icol
+    # The keys are cached by column and RowID along with the value they were made from, so only cells edited since the last sort
+    #   need to be parsed again.
+    def _SortKeys(self, icol: int, rows: list[GridDataRowClass]) -> list[tuple]:
+        coldef=self._datasource.ColDefs[icol]
+        keyfunc=GetSortKey(coldef.Type)
+        cached=self._sortKeyCache.get(id(coldef))
+        if cached is None or cached[0] is not coldef or cached[1] is not keyfunc:
+            cached=(coldef, keyfunc, {})
+            self._sortKeyCache[id(coldef)]=cached
+        cache=cached[2]
+        if len(cache) > 2*len(rows)+1000:     # Drop the keys of rows which have been deleted
+            live={row.RowID for row in rows}
+            cache={rowID: entry for rowID, entry in cache.items() if rowID in live}
+            self._sortKeyCache[id(coldef)]=(coldef, keyfunc, cache)
+
+        sortkeys: list[tuple]=[]
+        for rowID, val in zip([row.RowID for row in rows], [row[icol] for row in rows]):
+            if val is None:
+                val=""
+            entry=cache.get(rowID)
+            if entry is None or entry[0] != val:
+                entry=cache[rowID]=(val, keyfunc(str(val)))
+            sortkeys.append(entry[1])
+        return sortkeys
 
 
     #--------------------------------------------------------
@@ -919,21 +3648,90 @@ class DataGrid():
     # Oldcol is the 1st cols of the block to be moved
     # Numcols is the number of columns to be moved
     # Newcol is the target position to which oldrow is moved
+    @_Instrumented("move")
     def MoveCols(self, oldcol: int, numcols: int, newcol: int):       
-        self.Datasource.ColDefs.List=ListBlockMove(self.Datasource.ColDefs.List, oldcol, numcols, newcol)
-        self.Datasource.AllowCellEdits=ListBlockMove(self.Datasource.AllowCellEdits, oldcol, numcols, newcol)
-        for row in self._datasource.Rows:
-            row.Cells=ListBlockMove(row.Cells, oldcol, numcols, newcol)
+        self.Datasource.MoveColumns(oldcol, numcols, newcol)
+        self._undoLog.Record(ColumnsMove(oldcol, numcols, newcol))
 
 
     # ------------------
+    # Top and bottom are grid rows.  (They differ from datasource rows when the grid is filtered.)
     def CopyCells(self, top: int, left: int, bottom: int, right: int) -> None:       
         self.clipboard=[]
         for iRow in range(top, bottom+1):
-            v=[]
-            for jCol in range(left, right+1):
-                v.append(self._datasource[iRow][jCol])
-            self.clipboard.append(v)
+            iSource=self.SourceRow(iRow)
+            if iSource < 0:
+                continue    # A filtered-in row which has since been deleted
+            row=self._datasource[iSource]
+            self.clipboard.append([row[jCol] for jCol in range(left, right+1)])
+        self._PutCellsOnSystemClipboard(self.clipboard)
+
+
+    # ------------------
+    # Put cells on the system clipboard as TSV and HTML, plus our private token
+    def _PutCellsOnSystemClipboard(self, cells: list[list[str]]) -> None:
+        DataGrid._clipboardSerial+=1
+        token=f"{os.getpid()}:{DataGrid._clipboardSerial}"
+        DataGrid._lastCopy=(token, cells)
+
+        data=wx.DataObjectComposite()
+        tsv=wx.TextDataObject(CellsToTSV(cells))
+        data.Add(tsv, preferred=True)
+        data.Add(wx.HTMLDataObject(CellsToHTML(cells)))
+        private=wx.CustomDataObject(wx.DataFormat(self._clipboardFormatName))
+        private.SetData(token.encode())
+        data.Add(private)
+        if wx.TheClipboard.Open():
+            try:
+                wx.TheClipboard.SetData(data)    # The clipboard takes ownership of data
+            finally:
+                wx.TheClipboard.Close()
+
+
+    # ------------------
+    # Get the cells on the system clipboard, or None if there are none
+    # If the system clipboard can't be opened, fall back on the cells last copied in this program
+    def _GetCellsFromSystemClipboard(self) -> list[list[str]]|None:
+        if not wx.TheClipboard.Open():
+            return self.clipboard
+        try:
+            # If what's on the clipboard was put there by our last copy, use the cells we kept
+            fmt=wx.DataFormat(self._clipboardFormatName)
+            if DataGrid._lastCopy is not None and wx.TheClipboard.IsSupported(fmt):
+                private=wx.CustomDataObject(fmt)
+                if wx.TheClipboard.GetData(private) and bytes(private.GetData()).decode(errors="replace") == DataGrid._lastCopy[0]:
+                    return DataGrid._lastCopy[1]
+
+            if wx.TheClipboard.IsSupported(wx.DataFormat(wx.DF_UNICODETEXT)):
+                text=wx.TextDataObject()
+                if wx.TheClipboard.GetData(text):
+                    cells=TSVToCells(text.GetText())
+                    if len(cells) > 0 and len(cells[0]) > 0:
+                        return cells
+            return None
+        finally:
+            wx.TheClipboard.Close()
+
+
+    # ------------------
+    # Is there anything on the system clipboard that could be pasted?
+    def _ClipboardHasCells(self) -> bool:
+        if not wx.TheClipboard.Open():
+            return self.clipboard is not None and len(self.clipboard) > 0 and len(self.clipboard[0]) > 0
+        try:
+            return wx.TheClipboard.IsSupported(wx.DataFormat(wx.DF_UNICODETEXT))
+        finally:
+            wx.TheClipboard.Close()
+
+
+    # ------------------
+    # Paste whatever is on the system clipboard with its upper-left corner at (top, left)
+    def PasteFromClipboard(self, top: int, left: int) -> None:
+        cells=self._GetCellsFromSystemClipboard()
+        if cells is None or len(cells) == 0 or len(cells[0]) == 0:
+            return
+        self.clipboard=cells
+        self.PasteCells(top, left)
 
 
     # ------------------
@@ -947,23 +3745,72 @@ class DataGrid():
         pasteLeft=left
         pasteRight=left+len(self.clipboard[0])-1
 
-        # Does the paste-to box extend beyond the end of the available rows?  If so, extend the available rows.
-        num=pasteBottom-len(self._datasource.Rows)+1
-        if num > 0:
-            self.Datasource.InsertEmptyRows(self.Datasource.NumRows, num)
-        # # Refresh the datagrid from the Datasource to make it also bigger
-        # self.RefreshWxGridFromDatasource(StartRow=pasteTop, EndRow=pasteBottom, StartCol=pasteLeft, EndCol=pasteRight)
-
-        # Copy the cells from the clipboard to the grid in lstData.
-        for i, row in enumerate(self.clipboard, start=pasteTop):
-            for j, cellval in enumerate(row, start=pasteLeft):
-                self._datasource[i][j]=cellval
-        self.RefreshWxGridFromDatasource(StartRow=pasteTop, EndRow=pasteBottom, StartCol=pasteLeft, EndCol=pasteRight)
+        # If the paste-to box extends beyond the last column and the datasource can't add columns, drop what doesn't fit
+        values=self.clipboard
+        if pasteRight >= self.Datasource.NumCols and not self.Datasource.CanAddColumns:
+            width=self.Datasource.NumCols-pasteLeft
+            if width <= 0:
+                return
+            values=[row[:width] for row in values]
+
+        with self._Phase("paste", Rows=len(values), Cells=len(values)*len(values[0])), self.BatchUpdate(), self._undoLog.Group():
+            # Does the paste-to box extend beyond the end of the available rows?  If so, add all the rows needed in one go.
+            oldNumRows=self.Datasource.NumRows
+            num=pasteBottom-oldNumRows+1
+            if num > 0:
+                self._undoLog.Record(RowsChange(oldNumRows, self.Datasource.AppendEmptyRows(num), True, self.Datasource.NumCols))
+            # Likewise the columns
+            oldNumCols=self.Datasource.NumCols
+            if pasteRight >= oldNumCols and self.Datasource.CanAddColumns:
+                self.ExpandDataSourceToInclude(pasteTop, pasteRight)
+                self._undoLog.Record(ColumnsChange(oldNumCols, [self.Datasource.ColDefs[i] for i in range(oldNumCols, self.Datasource.NumCols)], True))
+
+            # Copy the cells from the clipboard to the datasource, keeping the values they replace for undo.
+            # (Only the rows which already existed are needed: undoing removes the added rows, and redoing puts them back with their cells.)
+            old=[]
+            if self._undoLog.IsRecording and pasteTop < oldNumRows:
+                width=max(len(vals) for vals in values)
+                old=self._BlockValues(pasteTop, pasteLeft, min(pasteBottom, oldNumRows-1), pasteLeft+width-1)
+            done=len(values)
+            if len(values)*len(values[0]) <= self._pasteProgressCells:
+                self.Datasource.SetBlock(pasteTop, pasteLeft, values)
+            else:
+                done=self._PasteInChunks(pasteTop, pasteLeft, values)
+            if old:
+                old=old[:done]
+                self._RecordCellsEdit(pasteTop, pasteLeft, old, [vals+old[i][len(vals):] for i, vals in enumerate(values[:len(old)])])
+            if done < len(values) and num > 0:
+                # The paste was cancelled: drop any of the rows added for it which didn't get used
+                firstUnused=max(oldNumRows, pasteTop+done)
+                self.DeleteRows(firstUnused, oldNumRows+num-firstUnused)
+            self._IndexRows(pasteTop, pasteTop+done-1)
+
+            # The refresh is done (once) when the batch ends
+            self.RefreshWxGridFromChanges()
+
+
+    # Store values in the datasource a chunk of rows at a time, showing progress and allowing the user to cancel
+    # Return the number of rows stored
+    def _PasteInChunks(self, top: int, left: int, values: list[list[str]]) -> int:
+        dlg=wx.ProgressDialog("Pasting", f"Pasting {len(values):,} rows", maximum=len(values), parent=self._wxGrid,
+                              style=wx.PD_APP_MODAL|wx.PD_CAN_ABORT|wx.PD_AUTO_HIDE|wx.PD_ELAPSED_TIME|wx.PD_REMAINING_TIME)
+        done=0
+        try:
+            while done < len(values):
+                chunk=values[done:done+self._pasteChunkRows]
+                self.Datasource.SetBlock(top+done, left, chunk)
+                done+=len(chunk)
+                keepGoing, _=dlg.Update(done, f"Pasted {done:,} of {len(values):,} rows")
+                if not keepGoing:
+                    break
+        finally:
+            dlg.Destroy()
+        return done
 
 
     def ExpandGridToInclude(self, irow: int, icol: int=0) -> None:
         if self._grid.NumberRows < irow:
-            self._grid.AppendRows(irow+1-self._grid.NumberRows)
+            self._AppendGridRows(irow+1-self._grid.NumberRows)
 
     # --------------------------------------------------------
     # Expand the grid's data source so that the local item (irow, icol) exists.
@@ -971,17 +3818,21 @@ class DataGrid():
         assert irow >= 0 and icol >= 0
 
         # Add new rows if needed
+        oldNumRows=self._datasource.NumRows
         while irow >= self._datasource.NumRows:
             self._datasource.InsertEmptyRows(self._datasource.NumRows, irow-self._datasource.NumRows+1)
+        self._datasource.AllowCellEdits.RowsAdded(oldNumRows, self._datasource.NumRows-oldNumRows)
+        self._IndexRows(oldNumRows, self._datasource.NumRows-1)
 
         # And add new columns
         # Many data sources do not allow expanding the number of columns, so check that first
         assert icol < len(self._datasource.ColDefs) or self._datasource.CanAddColumns
-        if self._datasource.CanAddColumns:
+        if self._datasource.CanAddColumns and icol >= len(self._datasource.ColDefs):
             while icol >= len(self._datasource.ColDefs):
                 self._datasource.ColDefs.append(ColDefinition())
                 for j in range(self._datasource.NumRows):
                     self._datasource.Rows[j].append("") # Note that append is implemented only when columns can be added
+            self._IndexRows(0, self._datasource.NumRows-1)
 
 
     #------------------
@@ -991,28 +3842,41 @@ class DataGrid():
         col=event.GetCol()
         newVal=self._grid.GetCellValue(row, col)
 
-        self.GridCellChangeProcessing(row, col, newVal)
-
-    def GridCellChangeProcessing(self, row: int, col: int, newVal: str):
-
-        # If we're entering data in a new cols or a new column, append the necessary number of new rows and/or columns to the data source
-        self.ExpandDataSourceToInclude(row, col)
-
-        self._datasource[row][col]=newVal
+        row=self.SourceRow(row)     # The grid may be showing a filtered view
+        if row < 0:
+            return
+        # In virtual mode the table has already stored the new value in the datasource, but the event still has the old one
+        self.GridCellChangeProcessing(row, col, newVal, OldVal=event.GetString() if self.IsVirtual else None)
+
+    def GridCellChangeProcessing(self, row: int, col: int, newVal: str, OldVal: str|None=None):
+
+        with self._undoLog.Group():
+            # If we're entering data in a new cols or a new column, append the necessary number of new rows and/or columns to the data source
+            oldNumRows=self._datasource.NumRows
+            self.ExpandDataSourceToInclude(row, col)
+            if self._datasource.NumRows > oldNumRows:
+                self._undoLog.Record(RowsChange(oldNumRows, self._datasource.Rows[oldNumRows:], True, self._datasource.NumCols))
+
+            if OldVal is None:
+                OldVal=self._datasource[row][col]
+            self._RecordCellsEdit(row, col, [[OldVal]], [[newVal]])
+            self._datasource[row][col]=newVal
+        self._IndexRows(row, row)
         # Log("set datasource("+str(cols)+", "+str(col)+")="+newVal)
         self.ColorSingleCellByValue(row, col)
-        self.RefreshWxGridFromDatasource(StartRow=row, EndRow=row, StartCol=col, EndCol=col)
-        self.AutoSizeColumns()
+        self.RefreshWxGridFromDatasource(StartRow=row, EndRow=row, StartCol=col, EndCol=col)     # This also resizes the column
 
     # ------------------
     def OnGridEditorShown(self, event):       
+        self.FlushScheduledRefresh()     # The editor must start from the cell's current value
         irow=event.GetRow()
         icol=event.GetCol()
+        self._PopulateRows(irow, irow)
         if self.Datasource.ColDefs[icol].IsEditable == IsEditable.No:
             event.Veto()
             return
         if self.Datasource.ColDefs[icol].IsEditable == IsEditable.Maybe:
-            if (irow, icol) not in self.Datasource.AllowCellEdits:
+            if (self.SourceRow(irow), icol) not in self.Datasource.AllowCellEdits:
                 event.Veto()
                 return
 
@@ -1035,7 +3899,7 @@ class DataGrid():
             return False
         # Measure with the cell's own font: heading/text rows are bold and so render wider than the
         # grid's default font, and underestimating their width let long headings slip past this check.
-        textWidth=self._grid.GetFullTextExtent(text, self._grid.GetCellFont(irow, icol))[0]
+        textWidth=SharedTextMeasurer.Width(self._grid, text, self._grid.GetCellFont(irow, icol))
         # The editor can't show more than what's actually on screen, so the usable width is the smaller
         # of the cell's own (possibly merged) width and the grid's visible width.
         effectiveWidth=min(self._grid.CellToRect(irow, icol).GetWidth(), self._grid.GetClientSize().GetWidth())
@@ -1045,9 +3909,11 @@ class DataGrid():
     # ------------------
     # Edit a too-long cell value in a simple wrapping popup, then commit it through the normal path.
     def _PopupEditLongText(self, irow: int, icol: int) -> None:
-        cur=self._datasource[irow][icol]
+        if self.SourceRow(irow) < 0:
+            return
+        cur=self._datasource[self.SourceRow(irow)][icol]
         cur="" if cur is None else str(cur)
-        with wx.TextEntryDialog(self._grid, "Edit the cell's text:", "Edit long text",
+        with wx.TextEntryDialog(self._wxGrid, "Edit the cell's text:", "Edit long text",
                                 value=cur, style=wx.OK|wx.CANCEL|wx.TE_MULTILINE) as dlg:
             # Centre the dialog over the cell being edited (so it's clear which cell is in play), then
             # nudge it so the whole box stays on the display. CellToRect gives logical coords; convert
@@ -1067,7 +3933,7 @@ class DataGrid():
             dlg.SetPosition((x, y))
             if dlg.ShowModal() == wx.ID_OK:
                 newVal=dlg.GetValue().replace("\r", "").replace("\n", " ")
-                self.GridCellChangeProcessing(irow, icol, newVal)
+                self.GridCellChangeProcessing(self.SourceRow(irow), icol, newVal)
 
 
     # ------------------
@@ -1101,7 +3967,7 @@ class DataGrid():
 
         # We enable the Paste popup menu item if there is something to paste
         mi=popup.FindItemById(popup.FindItem("Paste"))
-        mi.Enabled=self.clipboard is not None and len(self.clipboard) > 0 and len(self.clipboard[0]) > 0  # Enable only if the clipboard contains actual content
+        mi.Enabled=not self.IsFiltered and self._ClipboardHasCells()  # Enable only if the clipboard contains actual content
 
 
     # ------------------
@@ -1170,17 +4036,17 @@ class DataGrid():
 
 
     #------------------------------------
+    # Select whole rows top..bottom (inclusive), replacing any existing selection.  This is a single block, however many rows there are.
     def SelectRows(self, top, bottom) -> None:       
-        self._grid.SelectRow(top)
-        for i in range(top+1, bottom+1):
-            self._grid.SelectRow(i, addToSelected = True)
+        self._selectionSnapshot=None        # This is newer than any snapshot
+        self._grid.SelectBlock(top, 0, bottom, max(self._grid.NumberCols-1, 0))
 
 
     #------------------------------------
+    # Select whole columns left..right (inclusive), replacing any existing selection
     def SelectCols(self, left, right) -> None:       
-        self._grid.SelectCol(left)
-        for i in range(left+1, right+1):
-            self._grid.SelectCol(i, addToSelected = True)
+        self._selectionSnapshot=None        # This is newer than any snapshot
+        self._grid.SelectBlock(0, left, max(self._grid.NumberRows-1, 0), right)
 
 
     #------------------------------------
@@ -1229,12 +4095,19 @@ class DataGrid():
         if event.KeyCode == 67 and self.cntlDown:   # cntl-C
             self.CopyCells(top, left, bottom, right)
 
-        elif event.KeyCode == 86 and self.cntlDown and self.clipboard is not None and len(self.clipboard) > 0: # cntl-V
-            self.PasteCells(top, left)
+        elif event.KeyCode == 86 and self.cntlDown and not self.IsFiltered: # cntl-V
+            self.PasteFromClipboard(top, left)
 
         elif event.KeyCode == 65 and self.cntlDown:   # cntl-A: select all rows that have content
-            if self.Datasource.NumRows > 0:
-                self.SelectRows(0, self.Datasource.NumRows-1)
+            numrows=len(self._viewRowIDs) if self.IsFiltered else self.Datasource.NumRows
+            if numrows > 0:
+                self.SelectRows(0, numrows-1)
+
+        elif event.KeyCode == 90 and self.cntlDown:   # cntl-Z
+            self.Undo()
+
+        elif event.KeyCode == 89 and self.cntlDown:   # cntl-Y
+            self.Redo()
 
         elif event.KeyCode == 308:                  # cntl key alone
             self.cntlDown=True
@@ -1250,19 +4123,17 @@ class DataGrid():
                     if self.Datasource.CanMoveColumns:
                         self.MoveCols(left, right-left+1, left-1)     # And move 'em left 1
                         self.SelectCols(left-1, right-1)
-                        self.RefreshWxGridFromDatasource(StartCol=left-1, EndCol=right)
+                        self.ScheduleRefresh(StartCol=left-1, EndCol=right)     # Auto-repeated moves are repainted together
 
-        elif event.KeyCode == 315 and self.HasSelection():      # Up arrow
+        elif event.KeyCode == 315 and self.HasSelection() and not self.IsFiltered:      # Up arrow
             top, bottom=self.ExtendRowSelection()
             if top != -1 and top > 0:   # There must be a selection there must be at least one col open to the top
                 if bottom < self.Datasource.NumRows:  # Entire block must be within defined cells
                     self.MoveRows(top, bottom-top+1, top-1)     # And move 'em up 1
                     self.SelectRows(top-1, bottom-1)
-                    self.RefreshWxGridFromDatasource(StartRow=top-1, EndRow=bottom)
                     # Near the top edge, keep one non-selected row visible above the moving block so a
                     # group header scrolls into view before the block reaches it. (No-op mid-list.)
-                    if top-2 >= 0:
-                        self._grid.MakeCellVisible(top-2, 0)
+                    self.ScheduleRefresh(StartRow=top-1, EndRow=bottom, MakeVisible=(top-2, 0) if top-2 >= 0 else None)
 
         elif event.KeyCode == 316 and self.HasSelection():      # Right arrow
             #print("**move right")
@@ -1271,18 +4142,17 @@ class DataGrid():
                 if self.Datasource.CanMoveColumns:
                     self.MoveCols(left, right-left+1, left+1)     # And move 'em up 1
                     self.SelectCols(left+1, right+1)
-                    self.RefreshWxGridFromDatasource(StartCol=left, EndCol=right+1)
+                    self.ScheduleRefresh(StartCol=left, EndCol=right+1)
 
-        elif event.KeyCode == 317 and self.HasSelection():      # Down arrow
+        elif event.KeyCode == 317 and self.HasSelection() and not self.IsFiltered:      # Down arrow
             top, bottom=self.ExtendRowSelection()
             if top != -1 and bottom < self.Datasource.NumRows-1:   # There must be a selection and at least one cols available beloe the selection's bottom
                 if bottom < self.NumRows-1:  # Entire block must be within defined cells
                     self.MoveRows(top, bottom-top+1, top+1)     # And move 'em up 1
                     self.SelectRows(top+1, bottom+1)
-                    self.RefreshWxGridFromDatasource(StartRow=top, EndRow=bottom+1)
                     # Near the bottom edge, keep the bottom of the moving block visible (no margin row
                     # below it, unlike the top). (No-op mid-list.)
-                    self._grid.MakeCellVisible(bottom+1, 0)
+                    self.ScheduleRefresh(StartRow=top, EndRow=bottom+1, MakeVisible=(bottom+1, 0))
 
         else:
             event.Skip()
@@ -1307,18 +4177,25 @@ class DataGrid():
     # Paste the cells on the clipboard into the grid at the click location
     def OnPopupPaste(self, event):       
         self._grid.SaveEditControlValue()
+        if self.IsFiltered:
+            return
         top, left, _, _=self.LocateSelection()
-        self.PasteCells(top, left)
+        self.PasteFromClipboard(top, left)
 
 
     #------------------------------------
     def OnPopupEraseSelection(self, event):       
         self._grid.SaveEditControlValue()
+        if self.IsFiltered:
+            return
         top, left, bottom, right=self.Datasource.LimitBoxToActuals(self.LocateSelection())
+        if self._undoLog.IsRecording and bottom >= top and right >= left:
+            self._RecordCellsEdit(top, left, self._BlockValues(top, left, bottom, right), [[""]*(right-left+1) for _ in range(top, bottom+1)])
         for irow in range(top, bottom+1):
             for icol in range (left, right+1):
                 self.Datasource[irow][icol]=""
-        self.RefreshWxGridFromDatasource(StartRow=top, EndRow=bottom+1, StartCol=left, EndCol=right+1)
+        self._IndexRows(top, bottom)
+        self.RefreshWxGridFromDatasource(StartRow=top, EndRow=bottom, StartCol=left, EndCol=right)      # This also resizes the columns
 
 
     #------------------------------------
@@ -1327,28 +4204,26 @@ class DataGrid():
         self._grid.SaveEditControlValue()
         _, left, _, right=self.SelectionBoundingBox()
         if left == -1 or right == -1:
-            del self.Datasource.ColDefs[self.clickedColumn]
-            for i, row in enumerate(self.Datasource.Rows):
-                row.DelCol(self.clickedColumn)
-        else:
-            icols=slice(left, right+1)
-            del self.Datasource.ColDefs[icols]
-            for i, row in enumerate(self.Datasource.Rows):
-                row.DelCol(icols)
+            left=right=self.clickedColumn
+        self._RecordColumnsDeleted(left, right-left+1)
+        self.Datasource.DeleteColumns(left, right-left+1)
+        self._IndexRows(0, self.Datasource.NumRows-1)
         self._grid.ClearSelection()
-        self.RefreshWxGridFromDatasource()
+        self.RefreshWxGridFromChanges()
 
 
     #------------------------------------
     def DeleteSelectedRows(self):       
         self._grid.SaveEditControlValue()
+        if self.IsFiltered:
+            return
         top, _, bottom, _=self.SelectionBoundingBox()
         if top == -1 or bottom == -1:
             top=self.clickedRow
             bottom=self.clickedRow
-        del self.Datasource.Rows[top:bottom+1]
+        self.DeleteRows(top, bottom-top+1)
         self._grid.ClearSelection()
-        self.RefreshWxGridFromDatasource()
+        self.RefreshWxGridFromChanges()
 
 
     #------------------------------------
@@ -1357,8 +4232,10 @@ class DataGrid():
         v=MessageBoxInput("Enter the new column name", title="Renaming column", ignoredebugger=True)
         if v is not None:
             icol=self.clickedColumn
-            self.Datasource.ColDefs[icol].Name=v
-            self.RefreshWxGridFromDatasource()
+            coldef=self.Datasource.ColDefs[icol]
+            self._undoLog.Record(ColumnRename(coldef, coldef.Name, v))
+            coldef.Name=v
+            self.RefreshWxGridFromChanges()     # Nothing but the header has changed
 
 
     #------------------------------------
@@ -1370,33 +4247,28 @@ class DataGrid():
                 #event.Skip()
                 return
 
-        for row in self.Datasource.Rows:
-            row._cells=row._cells[:icol+1]+[""]+row._cells[icol+1:]
-        self.Datasource.ColDefs=self.Datasource.ColDefs[:icol+1]+ColDefinitionsList([ColDefinition(name)])+self.Datasource.ColDefs[icol+1:]
-        self.RefreshWxGridFromDatasource()
+        coldef=ColDefinition(name)
+        self.Datasource.InsertColumn2(icol+1, coldef)
+        self._undoLog.Record(ColumnsChange(icol+1, [coldef], True))
+        self._IndexRows(0, self.Datasource.NumRows-1)
+        self.RefreshWxGridFromChanges()
 
 
     #------------------------------------
     def DeleteColumn(self, icol: int) -> None:       
         self._grid.SaveEditControlValue()
+        self._RecordColumnsDeleted(icol, 1)
+        self.Datasource.DeleteColumn(icol)
+        self._IndexRows(0, self.Datasource.NumRows-1)
+        self.RefreshWxGridFromChanges()
 
-        for row in self.Datasource.Rows:
-            if icol == 0:
-                row._cells=row._cells[1:]
-            elif icol == self.NumCols-1:
-                row._cells=row._cells[:-1]
-            else:
-                row._cells=row._cells[:icol]+row._cells[icol+1:]
 
-        # And now the column header
-        if icol == 0:
-            self.Datasource.ColDefs=self.Datasource.ColDefs[1:]
-        elif icol == len(self.Datasource.ColDefs)-1:
-            self.Datasource.ColDefs=self.Datasource.ColDefs[:-1]
-        else:   # It's in the middle
-            self.Datasource.ColDefs=self.Datasource.ColDefs[:icol]+self.Datasource.ColDefs[icol+1:]
-
-        self.RefreshWxGridFromDatasource()
+    # Keep the cells of columns about to be deleted so the deletion can be undone
+    def _RecordColumnsDeleted(self, icol: int, num: int) -> None:
+        ds=self.Datasource
+        if self._undoLog.IsRecording and 0 <= icol < ds.NumCols:
+            num=min(num, ds.NumCols-icol)
+            self._undoLog.Record(ColumnsChange(icol, [ds.ColDefs[i] for i in range(icol, icol+num)], False, *_ColumnCells(ds, icol, num)))
 
 
     #------------------------------------
@@ -1420,3 +4292,182 @@ class DataGrid():
     # ------------------
     def HideColLabels(self) -> None: 
         self._grid.HideColLabels()
+
+
+#================================================================
+# Load a CSV or TSV file into a DataGrid's datasource without freezing the UI:
+#       loader=DelimitedFileLoader(dataGrid, filename, Delimiter="\t", HeaderRow=True, OnDone=...)
+#       loader.Start()
+# The file is parsed a chunk of rows at a time on a worker thread.  Each chunk is handed to the UI thread (using wx.CallAfter)
+# which appends it to the datasource and the grid, so the grid fills in as the file is read.  The first chunk is small
+# so that the first screenful appears almost at once.  The worker stays at most MaxChunksAhead chunks ahead of the UI thread,
+# so the event queue never holds more than that however big the file, and the UI keeps responding while the file loads.
+# The progress message is not modal.
+# The rows are appended to whatever the datasource already holds.  The datasource must support AppendEmptyRows() and SetBlock().
+# If HeaderRow is True, the file's first line names its columns.  If the datasource has no columns yet, these become its
+#   column definitions.  Otherwise each of the file's columns goes into the datasource's column of the same name, which is
+#   added if there isn't one and the datasource CanAddColumns (and dropped if it can't); the existing ColDefs are kept.
+#   Without a HeaderRow, cells beyond the datasource's columns are dropped unless it CanAddColumns.
+# OnDone(error) is called on the UI thread when loading ends; error is None unless the file couldn't be read.  Without an OnDone,
+#   the error is logged.
+class DelimitedFileLoader:
+    FirstChunkRows: int=200
+    ChunkRows: int=5000
+    MaxChunksAhead: int=2      # The most chunks handed to the UI thread which it hasn't yet taken in
+
+    def __init__(self, dataGrid: DataGrid, filename: str, Delimiter: str=",", HeaderRow: bool=False, Encoding: str="utf-8",
+                 OnDone: Callable[[Exception|None], None]|None=None, ShowProgress: bool=True):
+        self._dataGrid=dataGrid
+        self._filename=filename
+        self._delimiter=Delimiter
+        self._headerRow=HeaderRow
+        self._encoding=Encoding
+        self._onDone=OnDone
+        self._progress: ProgressMessage|None=ProgressMessage(wx.GetTopLevelParent(dataGrid.Grid), Modal=False) if ShowProgress else None
+        self._cancel=threading.Event()
+        self._thread: threading.Thread|None=None
+        self._maxCols: int=0        # Rows are cut to this many cells (0 means they're left alone)
+        self._room=threading.Semaphore(self.MaxChunksAhead)      # Taken by the worker for each chunk, and given back as the UI thread takes it in
+        self._headerTaken=threading.Event()     # Set once the UI thread has matched the header's columns to the datasource's
+        self._columnMap: list[int]|None=None    # With a header, the datasource column for each of the file's (-1 if it's dropped), unless they match
+        self.RowsLoaded: int=0
+
+    @property
+    def IsRunning(self) -> bool:     # DelimitedFileLoader
+        return self._thread is not None
+
+    @property
+    def Cancelled(self) -> bool:     # DelimitedFileLoader
+        return self._cancel.is_set()
+
+    # Start loading.  This must be called on the UI thread.
+    def Start(self) -> None:     # DelimitedFileLoader
+        ds=self._dataGrid.Datasource
+        if not self._headerRow and not ds.CanAddColumns:
+            self._maxCols=ds.NumCols
+        if self._progress is not None:
+            self._progress.Show(f"Loading {os.path.basename(self._filename)}")
+        self._thread=threading.Thread(target=self._Run, name="DelimitedFileLoader", daemon=True)
+        self._thread.start()
+
+    # Stop loading.  The rows already loaded are kept.
+    def Cancel(self) -> None:     # DelimitedFileLoader
+        self._cancel.set()
+
+    # --------------------------
+    # The worker thread.  It reads and parses the file, but leaves the datasource and grid strictly to the UI thread.
+    def _Run(self) -> None:     # DelimitedFileLoader
+        error: Exception|None=None
+        try:
+            size=max(os.path.getsize(self._filename), 1)
+            charsRead=0
+            with open(self._filename, newline="", encoding=self._encoding) as f:
+                def Lines():
+                    nonlocal charsRead
+                    for line in f:
+                        charsRead+=len(line)
+                        yield line
+                reader=csv.reader(Lines(), delimiter=self._delimiter)
+
+                maxCols=self._maxCols
+                columnMap: list[int]|None=None
+                if self._headerRow:
+                    header=next(reader, None)
+                    if header is not None:
+                        maxCols=len(header)
+                        wx.CallAfter(self._ReceiveHeader, header)
+                        if not self._Wait(self._headerTaken.wait):
+                            return
+                        columnMap=self._columnMap
+
+                chunkRows=self.FirstChunkRows
+                while not self._cancel.is_set():
+                    chunk=list(itertools.islice(reader, chunkRows))
+                    if not chunk:
+                        break
+                    if columnMap is not None:
+                        chunk=self._Remap(chunk, columnMap)
+                    elif maxCols > 0:
+                        chunk=[row[:maxCols] if len(row) > maxCols else row for row in chunk]
+                    if not self._Wait(self._room.acquire):
+                        return
+                    wx.CallAfter(self._ReceiveChunk, chunk, min(charsRead/size, 1.0))
+                    chunkRows=self.ChunkRows
+        except Exception as e:     # Not just OSError, UnicodeDecodeError and csv.Error: e.g., a bad Encoding raises LookupError
+            error=e
+        finally:
+            # However loading ends, the UI thread must close the progress message and mark the loader as finished
+            wx.CallAfter(self._Finish, error)
+
+    # Wait (on the worker thread) for the UI thread, using wait(timeout=...).  Return False if loading is cancelled meanwhile.
+    def _Wait(self, wait: Callable[..., bool]) -> bool:     # DelimitedFileLoader
+        while not wait(timeout=0.1):
+            if self._cancel.is_set():
+                return False
+        return not self._cancel.is_set()
+
+    # Put the file's cells into the datasource's columns
+    @staticmethod
+    def _Remap(rows: list[list[str]], columnMap: list[int]) -> list[list[str]]:     # DelimitedFileLoader
+        width=max(columnMap)+1
+        remapped=[]
+        for row in rows:
+            cells=[""]*width
+            for val, icol in zip(row, columnMap):
+                if icol >= 0:
+                    cells[icol]=val
+            remapped.append(cells)
+        return remapped
+
+    # --------------------------
+    # The rest runs on the UI thread
+    def _ReceiveHeader(self, header: list[str]) -> None:     # DelimitedFileLoader
+        try:
+            if self._cancel.is_set():
+                return
+            ds=self._dataGrid.Datasource
+            if ds.NumCols == 0:
+                ds.ColDefs=ColDefinitionsList([ColDefinition(name) for name in header])
+                return
+            columnMap: list[int]=[]
+            for name in header:
+                icol=ds.ColDefs.IndexOfName(name)
+                if icol in columnMap:
+                    icol=-1     # A second column of the same name
+                if icol < 0 and ds.CanAddColumns:
+                    ds.InsertColumn2(-1, ColDefinition(name))
+                    icol=ds.NumCols-1
+                columnMap.append(icol)
+            if ds.NumCols > len(header) or columnMap != list(range(len(header))):
+                self._columnMap=columnMap
+        finally:
+            self._headerTaken.set()
+
+    def _ReceiveChunk(self, rows: list[list[str]], fraction: float) -> None:     # DelimitedFileLoader
+        try:
+            if self._cancel.is_set():
+                return
+            ds=self._dataGrid.Datasource
+            top=ds.NumRows
+            ds.AppendEmptyRows(len(rows))
+            width=max(len(row) for row in rows)
+            if width > ds.NumCols and ds.CanAddColumns:
+                self._dataGrid.ExpandDataSourceToInclude(top, width-1)
+            ds.SetBlock(top, 0, rows)
+            self._dataGrid._IndexRows(top, top+len(rows)-1)
+            self._dataGrid.RefreshWxGridFromChanges()
+            self.RowsLoaded+=len(rows)
+            if self._progress is not None:
+                self._progress.Show(f"Loading {os.path.basename(self._filename)}: {self.RowsLoaded:,} rows ({fraction:.0%})")
+        finally:
+            self._room.release()      # The worker may go on to the next chunk
+
+    def _Finish(self, error: Exception|None) -> None:     # DelimitedFileLoader
+        self._thread=None
+        if self._progress is not None:
+            self._progress.Close()
+        if self._onDone is not None:
+            self._onDone(error)
+        elif error is not None:
+            # Raising it here, in a CallAfter, would just be an unhandled exception in the event loop
+            Log(f"DelimitedFileLoader: loading {self._filename} failed: {error!r}")
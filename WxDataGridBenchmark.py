@@ -0,0 +1,522 @@
+from __future__ import annotations
+from typing import Callable
+from collections import Counter
+from dataclasses import dataclass
+import argparse
+import json
+import time
+
+import wx
+import wx.grid
+
+from WxDataGrid import DataGrid, GridInstrumentation, PhaseStats, GridDataSource, GridDataRowClass, ColDefinition, ColDefinitionsList, ColumnarGridDataSource
+
+
+#================================================================
+# Benchmarks for DataGrid's hot paths.  Run it as a script:
+#       python WxDataGridBenchmark.py                   # 1k, 10k and 100k rows against a stand-in grid
+#       python WxDataGridBenchmark.py --sizes 10000 --virtual --columnar
+#       xvfb-run python WxDataGridBenchmark.py --real   # Against a hidden wx.grid.Grid
+#       python WxDataGridBenchmark.py --save-baseline before.json      # Record a run...
+#       python WxDataGridBenchmark.py --baseline before.json           # ...and, after a change, compare with it
+# Each case is timed on a freshly loaded grid and reports the wall time and the number of calls DataGrid made on the grid,
+#   so that a regression shows up as a number rather than as a feeling that things have gotten sluggish.
+# The counting and the per-phase timings come from DataGrid.Instrument().  (Use --phases to list the phases.)
+
+
+#================================================================
+# A stand-in for wx.grid.Grid which keeps just enough state (its shape, cell values, cursor and selection) for DataGrid
+#   to work against, and does no drawing at all.  The timings then measure DataGrid itself.
+class StandInFont:
+    def GetNativeFontInfoDesc(self) -> str:     # StandInFont
+        return "stand-in"
+    def GetBaseFont(self) -> StandInFont:     # StandInFont
+        return self
+    def Bold(self) -> StandInFont:     # StandInFont
+        return self
+    def Underlined(self) -> StandInFont:     # StandInFont
+        return self
+
+
+@dataclass
+class StandInBlock:
+    TopRow: int
+    LeftCol: int
+    BottomRow: int
+    RightCol: int
+
+
+class StandInGrid:
+    ScrollLineX: int=15
+
+    def __init__(self) -> None:
+        self._numRows: int=0
+        self._numCols: int=0
+        self._values: dict[tuple[int, int], str]={}
+        self._table: wx.grid.GridTableBase|None=None
+        self._cursor: tuple[int, int]=(0, 0)
+        self._blocks: list[StandInBlock]=[]
+        self._colSizes: dict[int, int]={}
+        self._font=StandInFont()
+
+    # --------------------------------------------------------
+    # Shape.  With a table, the table owns the grid's shape.
+    @property
+    def NumberRows(self) -> int:     # StandInGrid
+        return self._table.GetNumberRows() if self._table is not None else self._numRows
+
+    @property
+    def NumberCols(self) -> int:     # StandInGrid
+        return self._table.GetNumberCols() if self._table is not None else self._numCols
+
+    def GetNumberRows(self) -> int:     # StandInGrid
+        return self.NumberRows
+
+    def GetNumberCols(self) -> int:     # StandInGrid
+        return self.NumberCols
+
+    def SetTable(self, table: wx.grid.GridTableBase, takeOwnership: bool=False) -> None:     # StandInGrid
+        self._table=table
+
+    def GetTable(self) -> wx.grid.GridTableBase|None:     # StandInGrid
+        return self._table
+
+    def AppendRows(self, num: int) -> None:     # StandInGrid
+        self._numRows+=num
+
+    def InsertRows(self, pos: int, num: int) -> None:     # StandInGrid
+        self._numRows+=num
+        self._values={(irow+num if irow >= pos else irow, icol): val for (irow, icol), val in self._values.items()}
+
+    def DeleteRows(self, pos: int, num: int) -> None:     # StandInGrid
+        self._numRows-=num
+        if pos == 0 and self._numRows == 0:
+            self._values.clear()
+            return
+        self._values={(irow-num if irow >= pos else irow, icol): val for (irow, icol), val in self._values.items() if not pos <= irow < pos+num}
+
+    def AppendCols(self, num: int) -> None:     # StandInGrid
+        self._numCols+=num
+
+    def InsertCols(self, pos: int, num: int) -> None:     # StandInGrid
+        self._numCols+=num
+        self._values={(irow, icol+num if icol >= pos else icol): val for (irow, icol), val in self._values.items()}
+
+    def DeleteCols(self, pos: int, num: int) -> None:     # StandInGrid
+        self._numCols-=num
+        self._values={(irow, icol-num if icol >= pos else icol): val for (irow, icol), val in self._values.items() if not pos <= icol < pos+num}
+
+    # --------------------------------------------------------
+    # Cells
+    def ClearGrid(self) -> None:     # StandInGrid
+        self._values.clear()
+
+    def SetCellValue(self, irow: int, icol: int, val: str) -> None:     # StandInGrid
+        self._values[irow, icol]=val
+
+    def GetCellValue(self, irow: int, icol: int) -> str:     # StandInGrid
+        if self._table is not None:
+            return self._table.GetValue(irow, icol)
+        return self._values.get((irow, icol), "")
+
+    def GetCellFont(self, irow: int, icol: int) -> StandInFont:     # StandInGrid
+        return self._font
+
+    def GetDefaultCellFont(self) -> StandInFont:     # StandInGrid
+        return self._font
+
+    def GetLabelFont(self) -> StandInFont:     # StandInGrid
+        return self._font
+
+    # A fixed-pitch approximation, which is all the column widths need
+    def GetFullTextExtent(self, text: str, font: StandInFont|None=None) -> tuple[int, int, int, int]:     # StandInGrid
+        return 7*len(text), 16, 3, 0
+
+    def GetColSize(self, icol: int) -> int:     # StandInGrid
+        return self._colSizes.get(icol, 80)
+
+    def SetColSize(self, icol: int, width: int) -> None:     # StandInGrid
+        self._colSizes[icol]=width
+
+    # Everything else DataGrid asks of the grid only affects the way it looks
+    def SetCellSize(self, irow: int, icol: int, numRows: int, numCols: int) -> None:     # StandInGrid
+        pass
+    def SetCellFont(self, irow: int, icol: int, font) -> None:     # StandInGrid
+        pass
+    def SetCellBackgroundColour(self, irow: int, icol: int, colour) -> None:     # StandInGrid
+        pass
+    def SetCellTextColour(self, irow: int, icol: int, colour) -> None:     # StandInGrid
+        pass
+    def SetColLabelValue(self, icol: int, label: str) -> None:     # StandInGrid
+        pass
+    def SetRowLabelSize(self, width: int) -> None:     # StandInGrid
+        pass
+    def AutoSizeColumns(self, setAsMin: bool=True) -> None:     # StandInGrid
+        pass
+    def AutoSize(self) -> None:     # StandInGrid
+        pass
+    def BeginBatch(self) -> None:     # StandInGrid
+        pass
+    def EndBatch(self) -> None:     # StandInGrid
+        pass
+    def ForceRefresh(self) -> None:     # StandInGrid
+        pass
+    def SaveEditControlValue(self) -> None:     # StandInGrid
+        pass
+    def MakeCellVisible(self, irow: int, icol: int) -> None:     # StandInGrid
+        pass
+    def Bind(self, event, handler) -> None:     # StandInGrid
+        pass
+    def Destroy(self) -> None:     # StandInGrid
+        pass
+
+    # --------------------------------------------------------
+    # The viewport: 40 rows of 20 pixels, scrolled to the top
+    _rowHeight: int=20
+
+    def GetGridWindow(self) -> StandInGrid:     # StandInGrid
+        return self
+
+    def GetClientSize(self) -> wx.Size:     # StandInGrid
+        return wx.Size(800, 40*self._rowHeight)
+
+    def GetViewStart(self) -> tuple[int, int]:     # StandInGrid
+        return 0, 0
+
+    def GetScrollPixelsPerUnit(self) -> tuple[int, int]:     # StandInGrid
+        return 15, 15
+
+    def Scroll(self, x: int, y: int) -> None:     # StandInGrid
+        pass
+
+    def YToRow(self, y: int, clipToMinMax: bool=False) -> int:     # StandInGrid
+        irow=y//self._rowHeight
+        if irow >= self.NumberRows:
+            return self.NumberRows-1 if clipToMinMax else -1
+        return irow
+
+    # --------------------------------------------------------
+    # The cursor and selection
+    def GetGridCursorRow(self) -> int:     # StandInGrid
+        return self._cursor[0]
+
+    def GetGridCursorCol(self) -> int:     # StandInGrid
+        return self._cursor[1]
+
+    @property
+    def GridCursorRow(self) -> int:     # StandInGrid
+        return self._cursor[0]
+
+    @property
+    def GridCursorCol(self) -> int:     # StandInGrid
+        return self._cursor[1]
+
+    def SetGridCursor(self, irow: int, icol: int) -> None:     # StandInGrid
+        self._cursor=(irow, icol)
+
+    def GetSelectedBlocks(self) -> list[StandInBlock]:     # StandInGrid
+        return list(self._blocks)
+
+    def GetSelectedRows(self) -> list[int]:     # StandInGrid
+        return []
+
+    def GetSelectedCols(self) -> list[int]:     # StandInGrid
+        return []
+
+    def GetSelectedCells(self) -> list:     # StandInGrid
+        return []
+
+    @property
+    def SelectedCells(self) -> list:     # StandInGrid
+        return []
+
+    @property
+    def SelectionBlockTopLeft(self) -> list[tuple[int, int]]:     # StandInGrid
+        return [(b.TopRow, b.LeftCol) for b in self._blocks]
+
+    @property
+    def SelectionBlockBottomRight(self) -> list[tuple[int, int]]:     # StandInGrid
+        return [(b.BottomRow, b.RightCol) for b in self._blocks]
+
+    def GetSelectionBlockTopLeft(self) -> list[tuple[int, int]]:     # StandInGrid
+        return self.SelectionBlockTopLeft
+
+    def GetSelectionBlockBottomRight(self) -> list[tuple[int, int]]:     # StandInGrid
+        return self.SelectionBlockBottomRight
+
+    def ClearSelection(self) -> None:     # StandInGrid
+        self._blocks.clear()
+
+    def SelectRow(self, irow: int, addToSelected: bool=False) -> None:     # StandInGrid
+        self.SelectBlock(irow, 0, irow, max(self.NumberCols-1, 0), addToSelected)
+
+    def SelectCol(self, icol: int, addToSelected: bool=False) -> None:     # StandInGrid
+        self.SelectBlock(0, icol, max(self.NumberRows-1, 0), icol, addToSelected)
+
+    def SelectBlock(self, top: int, left: int, bottom: int, right: int, addToSelected: bool=False) -> None:     # StandInGrid
+        if not addToSelected:
+            self._blocks.clear()
+        self._blocks.append(StandInBlock(top, left, bottom, right))
+
+
+#================================================================
+# Synthetic data: a row-by-row datasource with a mix of column types, so that coloring has validation to do
+class SyntheticRow(GridDataRowClass):
+    def __init__(self, cells: list[str]) -> None:
+        self._cells=cells
+
+    def Signature(self) -> int:     # SyntheticRow(GridDataRowClass)
+        return hash(tuple(self._cells))
+
+    @property
+    def Cells(self) -> list[str]:     # SyntheticRow(GridDataRowClass)
+        return self._cells
+    @Cells.setter
+    def Cells(self, cells: list[str]) -> None:     # SyntheticRow(GridDataRowClass)
+        self._cells=cells
+
+    def __getitem__(self, index: int|slice) -> str|list[str]:     # SyntheticRow(GridDataRowClass)
+        return self._cells[index]
+
+    def __setitem__(self, index: int|slice, value: str) -> None:     # SyntheticRow(GridDataRowClass)
+        self._cells[index]=value
+
+    @property
+    def IsEmptyRow(self) -> bool:     # SyntheticRow(GridDataRowClass)
+        return all(cell == "" for cell in self._cells)
+
+    def DelCol(self, icol: int|slice) -> None:     # SyntheticRow(GridDataRowClass)
+        del self._cells[icol]
+
+    def append(self, val: str) -> None:     # SyntheticRow(GridDataRowClass)
+        self._cells.append(val)
+
+
+class SyntheticDatasource(GridDataSource):
+    def __init__(self, coldefs: ColDefinitionsList, rows: list[list[str]]) -> None:
+        super().__init__()
+        self._colDefs=coldefs
+        self._rows: list[SyntheticRow]=[SyntheticRow(cells) for cells in rows]
+        self._gridDataRowClass=SyntheticRow
+
+    @property
+    def NumRows(self) -> int:     # SyntheticDatasource(GridDataSource)
+        return len(self._rows)
+
+    def __getitem__(self, index: int) -> SyntheticRow:     # SyntheticDatasource(GridDataSource)
+        return self._rows[index]
+
+    def __setitem__(self, index: int, row: SyntheticRow) -> None:     # SyntheticDatasource(GridDataSource)
+        self._rows[index]=row
+
+    @property
+    def Rows(self) -> list[SyntheticRow]:     # SyntheticDatasource(GridDataSource)
+        return self._rows
+    @Rows.setter
+    def Rows(self, rows: list[SyntheticRow]) -> None:     # SyntheticDatasource(GridDataSource)
+        self._rows=rows
+
+    def InsertEmptyRows(self, insertat: int, num: int=1) -> None:     # SyntheticDatasource(GridDataSource)
+        self._rows[insertat:insertat]=[SyntheticRow([""]*self.NumCols) for _ in range(num)]
+
+    @property
+    def CanAddColumns(self) -> bool:     # SyntheticDatasource(GridDataSource)
+        return True
+
+
+_months=["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+_syntheticColumns: list[tuple[str, str, Callable[[int], str]]]=[
+    ("Title", "str", lambda i: f"Fanzine number {i}"),
+    ("Editor", "str", lambda i: f"Editor {i%997}"),
+    ("Year", "year", lambda i: str(1930+i%100)),      # About a fifth of these are out of range and so get colored
+    ("Month", "month", lambda i: _months[i%12] if i%50 else "Smarch"),
+    ("Issue", "int", lambda i: str(i%200) if i%40 else "#"),
+    ("Date", "date", lambda i: f"{_months[i%12]} {1+i%28}, {1940+i%60}"),
+    ("Pages", "int", lambda i: str(4+i%60)),
+    ("Notes", "str", lambda i: "" if i%3 else f"Note on issue {i}"),
+]
+
+def MakeDatasource(numRows: int, Columnar: bool=False) -> GridDataSource:
+    coldefs=ColDefinitionsList([ColDefinition(name, Type=type) for name, type, _ in _syntheticColumns])
+    rows=[[make(i) for _, _, make in _syntheticColumns] for i in range(numRows)]
+    if Columnar:
+        return ColumnarGridDataSource(coldefs, rows)
+    return SyntheticDatasource(coldefs, rows)
+
+
+#================================================================
+# The cases.  Each is given a DataGrid already loaded from a fresh datasource, and does the operation being timed.
+def _PasteRows(dg: DataGrid) -> None:
+    dg.clipboard=[[f"Pasted {i}.{j}" for j in range(4)] for i in range(1000)]
+    dg.PasteCells(dg.Datasource.NumRows//2, 1)
+
+def _MoveRowsDown(dg: DataGrid) -> None:
+    # As the down arrow does it, a step at a time
+    top=dg.Datasource.NumRows//2
+    for i in range(20):
+        dg.MoveRows(top+i, 100, top+i+1)
+        dg.RefreshWxGridFromDatasource(StartRow=top+i, EndRow=top+i+100)
+
+def _DeleteRows(dg: DataGrid) -> None:
+    dg.DeleteRows(dg.Datasource.NumRows//2, min(1000, dg.Datasource.NumRows//4))
+    dg.RefreshWxGridFromChanges()
+
+def _InsertColumn(dg: DataGrid) -> None:
+    dg.Datasource.InsertColumn2(2, ColDefinition("Inserted"))
+    dg.RefreshWxGridFromChanges()
+
+def _RefreshRows(dg: DataGrid) -> None:
+    middle=dg.Datasource.NumRows//2
+    dg.RefreshWxGridFromDatasource(StartRow=middle, EndRow=middle+99)
+
+def _RefreshCols(dg: DataGrid) -> None:
+    dg.RefreshWxGridFromDatasource(StartCol=2, EndCol=3)
+
+def _SelectAll(dg: DataGrid) -> None:
+    # As ctrl-A does it, followed by a full refresh which has to keep the selection
+    dg.SelectRows(0, dg.Datasource.NumRows-1)
+    dg.RefreshWxGridFromDatasource()
+
+
+Cases: dict[str, Callable[[DataGrid], None]]={
+    "refresh full": lambda dg: dg.RefreshWxGridFromDatasource(),
+    "refresh 100 rows": _RefreshRows,
+    "refresh 2 cols": _RefreshCols,
+    "color all": lambda dg: dg.ColorCellsByValue(),
+    "move rows x20": _MoveRowsDown,
+    "paste 1000x4": _PasteRows,
+    "delete rows": _DeleteRows,
+    "insert column": _InsertColumn,
+    "select all": _SelectAll,
+}
+
+
+@dataclass
+class BenchmarkResult:
+    Case: str
+    NumRows: int
+    Seconds: float
+    Calls: Counter
+    Phases: dict[str, PhaseStats]
+
+    @property
+    def TotalCalls(self) -> int:     # BenchmarkResult
+        return sum(self.Calls.values())
+
+
+#================================================================
+# Run one case against a freshly made grid and datasource
+# MakeGrid returns the grid to use: a StandInGrid or a (hidden) wx.grid.Grid
+def RunCase(case: str, numRows: int, MakeGrid: Callable[[], object], Virtual: bool=False, Columnar: bool=False,
+            ViewportFirst: bool=False) -> BenchmarkResult:
+    grid=MakeGrid()
+    dg=DataGrid(grid, VirtualMode=Virtual, ViewportFirst=ViewportFirst)
+    dg.Datasource=MakeDatasource(numRows, Columnar=Columnar)
+    dg.RefreshWxGridFromDatasource()
+
+    stats: GridInstrumentation
+    with dg.Instrument() as stats:
+        start=time.perf_counter()
+        Cases[case](dg)
+        seconds=time.perf_counter()-start
+    grid.Destroy()
+    return BenchmarkResult(case, numRows, seconds, stats.Calls, stats.Phases)
+
+
+def RunBenchmarks(sizes: list[int], cases: list[str], MakeGrid: Callable[[], object], Virtual: bool=False, Columnar: bool=False,
+                  ViewportFirst: bool=False, Repeat: int=1) -> list[BenchmarkResult]:
+    results: list[BenchmarkResult]=[]
+    for numRows in sizes:
+        for case in cases:
+            # Keep the fastest run.  (The call counts are the same every time.)
+            runs=[RunCase(case, numRows, MakeGrid, Virtual=Virtual, Columnar=Columnar, ViewportFirst=ViewportFirst) for _ in range(Repeat)]
+            results.append(min(runs, key=lambda r: r.Seconds))
+    return results
+
+
+#================================================================
+# A baseline is a saved run: the time and wx calls of each case, keyed by (case, rows), along with the options it was run with
+#   so that like can be compared with like.
+Baseline=dict[tuple[str, int], tuple[float, int]]
+
+def SaveBaseline(results: list[BenchmarkResult], filename: str, Mode: str="") -> None:
+    with open(filename, "w") as f:
+        json.dump({"Mode": Mode, "Results": [[r.Case, r.NumRows, r.Seconds, r.TotalCalls] for r in results]}, f, indent=1)
+
+# Return the baseline and the options it was run with
+def LoadBaseline(filename: str) -> tuple[Baseline, str]:
+    with open(filename) as f:
+        saved=json.load(f)
+    return {(case, numRows): (seconds, calls) for case, numRows, seconds, calls in saved["Results"]}, saved["Mode"]
+
+
+# With Phases, each case is followed by the phases DataGrid went through, slowest first
+# With a Baseline, each case's time and wx calls are shown beside the baseline's, along with the ratio of the two (now/baseline,
+#   so below 1.00 is an improvement)
+def Report(results: list[BenchmarkResult], TopCalls: int=3, Phases: bool=False, Baseline: Baseline|None=None) -> str:
+    if Baseline is None:
+        lines=[f"{'case':<18} {'rows':>8} {'ms':>10} {'wx calls':>10}  most frequent"]
+    else:
+        lines=[f"{'case':<18} {'rows':>8} {'ms':>10} {'base ms':>10} {'ratio':>6} {'wx calls':>10} {'base calls':>10} {'ratio':>6}  most frequent"]
+    for r in results:
+        top=", ".join(f"{name} {num:,}" for name, num in r.Calls.most_common(TopCalls))
+        if Baseline is None:
+            lines.append(f"{r.Case:<18} {r.NumRows:>8,} {r.Seconds*1000:>10.1f} {r.TotalCalls:>10,}  {top}")
+        elif (r.Case, r.NumRows) not in Baseline:
+            lines.append(f"{r.Case:<18} {r.NumRows:>8,} {r.Seconds*1000:>10.1f} {'-':>10} {'-':>6} {r.TotalCalls:>10,} {'-':>10} {'-':>6}  {top}")
+        else:
+            baseSeconds, baseCalls=Baseline[(r.Case, r.NumRows)]
+            lines.append(f"{r.Case:<18} {r.NumRows:>8,} {r.Seconds*1000:>10.1f} {baseSeconds*1000:>10.1f} {_Ratio(r.Seconds, baseSeconds):>6} "
+                         f"{r.TotalCalls:>10,} {baseCalls:>10,} {_Ratio(r.TotalCalls, baseCalls):>6}  {top}")
+        if Phases:
+            for name, phase in sorted(r.Phases.items(), key=lambda item: -item[1].Seconds):
+                top=", ".join(f"{call} {num:,}" for call, num in phase.Calls.most_common(TopCalls))
+                lines.append(f"  {name:<16} {phase.Count:>8,} {phase.Seconds*1000:>10.1f} {sum(phase.Calls.values()):>10,}  {top}")
+    return "\n".join(lines)
+
+def _Ratio(now: float, base: float) -> str:
+    if base == 0:
+        return "-" if now == 0 else "inf"
+    return f"{now/base:.2f}"
+
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Time DataGrid's hot paths and count the calls they make on the wx grid.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="The numbers of rows to use")
+    parser.add_argument("--cases", nargs="+", choices=list(Cases.keys()), default=list(Cases.keys()))
+    parser.add_argument("--virtual", action="store_true", help="Use DataGrid's VirtualMode")
+    parser.add_argument("--columnar", action="store_true", help="Use a ColumnarGridDataSource")
+    parser.add_argument("--viewport-first", action="store_true", help="Use DataGrid's ViewportFirst.  (The rows it leaves for idle time aren't timed.)")
+    parser.add_argument("--real", action="store_true", help="Use a hidden wx.grid.Grid (needs a display; use Xvfb when headless)")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each case this many times and report the fastest")
+    parser.add_argument("--phases", action="store_true", help="Also report the time and wx calls of each phase of DataGrid's work, with the number of times it was entered")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save this run's results to FILE, to compare later runs with")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare this run with the one saved in FILE by --save-baseline")
+    args=parser.parse_args()
+    mode=" ".join(name for name, on in (("virtual", args.virtual), ("columnar", args.columnar), ("viewport-first", args.viewport_first), ("real", args.real)) if on)
+
+    baseline: Baseline|None=None
+    if args.baseline:
+        baseline, baseMode=LoadBaseline(args.baseline)
+        if baseMode != mode:
+            print(f"Note: the baseline was run with options '{baseMode}', but this run with '{mode}'")
+
+    MakeGrid: Callable[[], object]=StandInGrid
+    if args.real:
+        app=wx.App(False)
+        frame=wx.Frame(None)        # Never shown
+
+        def MakeGrid() -> wx.grid.Grid:
+            grid=wx.grid.Grid(frame)
+            if not args.virtual:
+                grid.CreateGrid(0, 0)   # In virtual mode DataGrid supplies the table
+            return grid
+
+    results=RunBenchmarks(args.sizes, args.cases, MakeGrid, Virtual=args.virtual, Columnar=args.columnar, ViewportFirst=args.viewport_first, Repeat=args.repeat)
+    print(Report(results, Phases=args.phases, Baseline=baseline))
+    if args.save_baseline:
+        SaveBaseline(results, args.save_baseline, Mode=mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -63,6 +63,7 @@ class ProgressMessage2(object):
 # A class to display progress messages
 #       ProgressMessage(parent).Show(message)       # Display a message, creating a popup dialog if needed
 #       ProgressMessage(parent).Close(delay=sec)    # Delay sec seconds and then close the progress message
+#       ProgressMessage(parent, Modal=False)        # The message doesn't block the rest of the app (e.g., for work done in the background)
 # It may also be used as:
 #   with ProgressMessage(parent, "message", delay=1) as msg:
 #       ...
@@ -71,12 +72,14 @@ class ProgressMessage2(object):
 class ProgressMessage(object):
     _progressMessageDlg: wx.ProgressDialog|None=None
 
-    def __init__(self, parent: wx.TopLevelWindow|None=None) -> None:
+    def __init__(self, parent: wx.TopLevelWindow|None=None, Modal: bool=True) -> None:
         self._parent=parent
+        self._modal=Modal
 
     def Show(self, s: str|None, close: bool=False, delay: float=0) -> None:  # ConInstanceFramePage
         if ProgressMessage._progressMessageDlg is None:
-            ProgressMessage._progressMessageDlg=wx.ProgressDialog("progress", s, maximum=100, parent=None, style=wx.PD_APP_MODAL|wx.PD_AUTO_HIDE)
+            style=wx.PD_APP_MODAL|wx.PD_AUTO_HIDE if self._modal else wx.PD_AUTO_HIDE
+            ProgressMessage._progressMessageDlg=wx.ProgressDialog("progress", s, maximum=100, parent=None, style=style)
         Log(f"ProgressMessage.Show('{s}')")
         self._progressMessageDlg.Pulse(s)
 
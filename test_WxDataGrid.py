@@ -0,0 +1,337 @@
+from __future__ import annotations
+import queue
+import pytest
+
+wx=pytest.importorskip("wx")
+
+from WxDataGrid import DataGrid, Color, ColDefinition, ColDefinitionsList, ColumnarGridDataSource, GridChanges, DelimitedFileLoader, TextMeasurer, SharedTextMeasurer
+from WxDataGridBenchmark import StandInGrid, RunBenchmarks, Report, SaveBaseline, LoadBaseline
+
+
+#================================================================
+# Tests of DataGrid's pure-Python machinery.  The grid is the benchmark's StandInGrid, so no wx event loop (or display) is needed.
+
+def MakeDataGrid(rows: list[list[str]], names: list[str]|None=None, **kwargs) -> DataGrid:
+    names=names or [f"Col{i}" for i in range(len(rows[0]))]
+    dg=DataGrid(StandInGrid(), **kwargs)
+    dg.Datasource=ColumnarGridDataSource(ColDefinitionsList([ColDefinition(name) for name in names]), rows)
+    dg.RefreshWxGridFromDatasource()
+    return dg
+
+def Fanzines(num: int) -> list[list[str]]:
+    return [[f"Fanzine {i}", f"Editor{i}", str(1950+i)] for i in range(num)]
+
+def FilteredRows(dg: DataGrid) -> list[list[str]]:
+    return [dg.Datasource.Rows[dg.SourceRow(i)].Cells for i in range(len(dg._viewRowIDs))]
+
+
+#================================================================
+# GridChanges: the dirty rows and columns are renumbered as rows and columns come and go
+
+def test_grid_changes_renumber_dirty_rows_and_cols():
+    changes=GridChanges()
+    changes.MarkRowsDirty(5, 2)
+    changes.RowsInserted(3, 2)
+    assert changes.DirtyRows == {3, 4, 7, 8}
+    changes.RowsDeleted(6, 2)       # Takes row 7 and moves row 8 up
+    assert changes.DirtyRows == {3, 4, 6}
+    changes.MarkColsDirty(1)
+    changes.ColsInserted(0, 1)
+    changes.ColsDeleted(2, 1)
+    assert changes.DirtyCols == {0}
+    assert changes.Structural == [("insert rows", 3, 2), ("delete rows", 6, 2), ("insert cols", 0, 1), ("delete cols", 2, 1)]
+    changes.Clear()
+    assert changes.IsEmpty
+
+def test_edit_in_a_batch_is_refreshed_where_its_row_ends_up():
+    dg=MakeDataGrid(Fanzines(10), VirtualMode=False)
+    with dg.BatchUpdate():
+        dg.Datasource[5][0]="Edited"
+        dg.RefreshWxGridFromDatasource(StartRow=5, EndRow=5)
+        dg.InsertEmptyRows(0, 2)
+        dg.DeleteRows(3, 1)
+    assert dg._grid.GetCellValue(6, 0) == "Edited"
+    assert dg._grid.GetCellValue(2, 0) == "Fanzine 0" and dg._grid.GetCellValue(3, 0) == "Fanzine 2"
+
+
+#================================================================
+# RowSearchIndex, kept up to date as columns and rows change
+
+def test_filter_after_column_delete():
+    dg=MakeDataGrid(Fanzines(20), ["Title", "Editor", "Year"], VirtualMode=True, LazyColoring=True)
+    dg.SetFilter("Fanzine")
+    assert len(dg._viewRowIDs) == 20
+    dg.ClearFilter()
+    dg.DeleteColumn(0)
+    dg.SetFilter("Fanzine")
+    assert dg._viewRowIDs == []
+    dg.SetFilter("Editor7")
+    assert FilteredRows(dg) == [["Editor7", "1957"]]
+
+def test_filter_after_column_delete_is_undone():
+    dg=MakeDataGrid(Fanzines(20), ["Title", "Editor", "Year"], VirtualMode=True, LazyColoring=True)
+    dg.RebuildSearchIndex()
+    dg.DeleteColumn(0)
+    dg.Undo()
+    dg.SetFilter("Fanzine")
+    assert len(dg._viewRowIDs) == 20
+    dg.ClearFilter()
+    dg.Redo()
+    dg.SetFilter("Fanzine")
+    assert dg._viewRowIDs == []
+
+def test_filter_after_load():
+    dg=MakeDataGrid(Fanzines(3), ["Title", "Editor", "Year"], VirtualMode=True, LazyColoring=True)
+    dg.RebuildSearchIndex()
+    loader=DelimitedFileLoader(dg, "unused.csv", ShowProgress=False)
+    # The worker thread hands the UI thread chunks of rows; here the UI thread's half is called directly
+    loader._ReceiveChunk([["Loaded zine", "Someone", "1999"], ["Another", "Loaded", "2001"]], 1.0)
+    dg.SetFilter("loaded")
+    assert FilteredRows(dg) == [["Loaded zine", "Someone", "1999"], ["Another", "Loaded", "2001"]]
+
+def test_filter_after_rows_are_added():
+    dg=MakeDataGrid(Fanzines(3), ["Title", "Editor", "Year"], VirtualMode=True, LazyColoring=True)
+    dg.RebuildSearchIndex()
+    dg.GridCellChangeProcessing(5, 0, "Latecomer")      # Typing past the end adds the rows needed
+    dg.clipboard=[["Pasted", "Past", "TheEnd"]]*2
+    dg.PasteCells(7, 0)
+    dg.SetFilter("latecomer")
+    assert FilteredRows(dg) == [["Latecomer", "", ""]]
+    dg.SetFilter("pasted")
+    assert FilteredRows(dg) == [["Pasted", "Past", "TheEnd"]]*2
+
+
+#================================================================
+# EditableCellIndex: permissions follow their rows
+
+def test_edit_permission_past_the_end_follows_its_row_when_sorted():
+    dg=MakeDataGrid(Fanzines(5))
+    dg.AllowCellEdit(7, 1)
+    dg.GridCellChangeProcessing(7, 0, "Aardvark")       # Typing into row 7 adds rows 5..7
+    dg.SortByColumns([0])
+    assert dg.Datasource[0][0] == "Aardvark"
+    assert list(dg.Datasource.AllowCellEdits) == [(0, 1)]
+
+def test_edit_permission_past_the_end_follows_its_row_after_paste():
+    dg=MakeDataGrid(Fanzines(5))
+    dg.AllowCellEdit(6, 2)
+    dg.clipboard=[["Pasted", "x", "y"], ["Aardvark", "x", "y"]]
+    dg.PasteCells(5, 0)
+    dg.SortByColumns([0])
+    assert list(dg.Datasource.AllowCellEdits) == [(0, 2)]
+
+def test_edit_permissions_across_move_and_sort():
+    dg=MakeDataGrid(Fanzines(10))
+    dg.AllowCellEdit(2, 0)
+    dg.AllowCellEdit(8, 1)
+    dg.AllowCellEdit(12, 2)     # Past the end: recorded by row number
+    dg.MoveRows(8, 2, 1)
+    assert sorted(dg.Datasource.AllowCellEdits) == [(1, 1), (4, 0), (12, 2)]
+    dg.SortByColumns([(2, False)])      # Descending by year reverses the rows
+    assert sorted(dg.Datasource.AllowCellEdits) == [(1, 1), (7, 0), (12, 2)]
+    assert dg.Datasource[1][1] == "Editor8" and dg.Datasource[7][0] == "Fanzine 2"
+    dg.Undo()
+    assert sorted(dg.Datasource.AllowCellEdits) == [(1, 1), (4, 0), (12, 2)]
+
+
+#================================================================
+# BackgroundValidator: a recolor validates only the rows it covers
+
+def test_background_validation_of_a_row_range(monkeypatch):
+    posted: queue.Queue=queue.Queue()
+    monkeypatch.setattr(wx, "CallAfter", lambda func, *args: posted.put((func, args)))     # Run on the test's thread instead of an event loop
+    def RunPending(dg: DataGrid) -> None:
+        while dg._backgroundValidator._pending:
+            func, args=posted.get(timeout=10)
+            func(*args)
+
+    rows=[[f"Fanzine {i}", str(1950+i%50)] for i in range(2000)]
+    rows[10][1]="Soon"
+    dg=DataGrid(StandInGrid(), BackgroundValidation=True)
+    dg.Datasource=ColumnarGridDataSource(ColDefinitionsList([ColDefinition("Title"), ColDefinition("Year", Type="year")]), rows)
+    dg.RefreshWxGridFromDatasource()
+    RunPending(dg)
+    year=dg.Datasource.ColDefs[1]
+    assert dg.GetCellStyle(10, 1).Background == Color.Pink
+
+    dg.Datasource[1500][1]="Later"
+    dg.ColorCellsByValue(StartRow=1000, EndRow=1999, StartCol=1, EndCol=1)
+    passes=dg._backgroundValidator._pending[id(year)]
+    assert [len(rowIDs) for rowIDs in passes.values()] == [1000]
+    RunPending(dg)
+    assert dg.GetCellStyle(1500, 1).Background == Color.Pink
+    assert dg.GetCellStyle(10, 1).Background == Color.Pink        # Outside the range, so untouched
+    assert dg.GetCellStyle(11, 1).Background != Color.Pink
+
+
+#================================================================
+# ColumnWidths and TextMeasurer.  StandInGrid's text is 7 pixels a character, and a column has a margin of 10.
+
+def test_column_widths_follow_edits_and_deletions():
+    dg=MakeDataGrid([["x"*10, "y"], ["x"*5, "y"], ["x"*10, "y"]])
+    widths=dg._columnWidths
+    assert widths.Width(0) == 80
+    dg.GridCellChangeProcessing(1, 0, "x"*20)
+    assert widths.Width(0) == 150
+    dg.GridCellChangeProcessing(1, 0, "x")      # The widest cell shrinks, so the column is measured again
+    assert widths.Width(0) == 80
+    dg.DeleteRows(0, 1)
+    dg.RefreshWxGridFromChanges()
+    assert widths.Width(0) == 80        # Row 2 is as wide
+    dg.DeleteRows(1, 1)
+    dg.RefreshWxGridFromChanges()
+    assert widths.Width(0) == 38        # Only "x" is left, which is narrower than the label
+    assert widths.Width(1) == 38
+
+def test_text_measurer_is_a_bounded_lru():
+    grid=StandInGrid()
+    font=grid.GetDefaultCellFont()
+    measurer=TextMeasurer(MaxSize=3)
+    assert measurer.Widths(grid, ["a", "bb", None, "c\ndddd"], font) == [7, 14, 0, 28]
+    assert len(measurer) == 3       # "a", the least recently used, was evicted
+    measurer.Widths(grid, ["bb"], font)     # A hit in a batch counts as a use, too...
+    measurer.Width(grid, "eee", font)       # ...so this evicts "c" rather than "bb"
+    measurer.ResetCounters()
+    measurer.Widths(grid, ["bb", "dddd", "eee"], font)
+    assert (measurer.Hits, measurer.Misses) == (3, 0)
+    measurer.Widths(grid, ["c"], font)
+    assert (measurer.Hits, measurer.Misses) == (3, 1)
+
+def test_measuring_a_big_grid_leaves_the_shared_cache_bounded(monkeypatch):
+    monkeypatch.setattr(SharedTextMeasurer, "MaxSize", 1000)
+    SharedTextMeasurer.Clear()
+    dg=MakeDataGrid([[f"Distinct value {i}", str(i)] for i in range(5000)])
+    assert dg._columnWidths.Width(0) == 7*len("Distinct value 4999")+10
+    assert SharedTextMeasurer.MaxSize == 1000
+    assert len(SharedTextMeasurer) <= 1000
+
+
+#================================================================
+# DelimitedFileLoader
+
+def RunLoader(loader: DelimitedFileLoader, monkeypatch) -> int:
+    posted: queue.Queue=queue.Queue()
+    monkeypatch.setattr(wx, "CallAfter", lambda func, *args: posted.put((func, args)))     # Run on the test's thread instead of an event loop
+    loader.Start()
+    mostPosted=0
+    while True:
+        func, args=posted.get(timeout=10)
+        mostPosted=max(mostPosted, posted.qsize()+1)
+        func(*args)
+        if func == loader._Finish:
+            return mostPosted
+
+def test_load_stays_a_few_chunks_ahead(tmp_path, monkeypatch):
+    filename=tmp_path/"fanzines.csv"
+    filename.write_text("".join(",".join(row)+"\n" for row in Fanzines(1000)))
+    dg=MakeDataGrid(Fanzines(2), ["Title", "Editor", "Year"])
+    loader=DelimitedFileLoader(dg, str(filename), ShowProgress=False)
+    loader.FirstChunkRows=loader.ChunkRows=10
+    mostPosted=RunLoader(loader, monkeypatch)
+    assert mostPosted <= loader.MaxChunksAhead+1        # The chunks waiting, and _Finish
+    assert loader.RowsLoaded == 1000 and dg.Datasource.NumRows == 1002
+    assert dg.Datasource[1001].Cells == ["Fanzine 999", "Editor999", "2949"]
+
+def test_load_merges_the_header_into_the_columns(tmp_path, monkeypatch):
+    filename=tmp_path/"fanzines.csv"
+    filename.write_text("year,Title,Notes\n1961,Xero,Hugo\n1959,Fanac,\n")
+    dg=MakeDataGrid(Fanzines(1), ["Title", "Editor", "Year"])
+    title=dg.Datasource.ColDefs[0]
+    RunLoader(DelimitedFileLoader(dg, str(filename), HeaderRow=True, ShowProgress=False), monkeypatch)
+    assert [cdef.Name for cdef in dg.Datasource.ColDefs] == ["Title", "Editor", "Year", "Notes"]
+    assert dg.Datasource.ColDefs[0] is title        # The caller's ColDefs are kept
+    assert [row.Cells for row in dg.Datasource.Rows] == [["Fanzine 0", "Editor0", "1950", ""], ["Xero", "", "1961", "Hugo"], ["Fanac", "", "1959", ""]]
+
+def test_column_widths_follow_erasing_and_partial_refreshes():
+    dg=MakeDataGrid([["x"*20, "y"], ["x"*5, "y"*10], ["x"*10, "y"]])
+    widths=dg._columnWidths
+    assert dg._grid.GetColSize(0) == 150
+    dg._grid.SelectBlock(0, 0, 0, 1)
+    dg.OnPopupEraseSelection(None)
+    assert widths.Width(0) == 80 and dg._grid.GetColSize(0) == 80
+    assert dg._grid.GetColSize(1) == 80
+    dg.Datasource[2][1]="y"*20
+    dg.RefreshWxGridFromDatasource(StartRow=2, EndRow=2)
+    assert dg._grid.GetColSize(1) == 150
+    dg.Datasource[1][0]="x"*30
+    dg.RefreshWxGridFromDatasource(StartCol=0, EndCol=0)
+    assert dg._grid.GetColSize(0) == 220
+
+
+#================================================================
+# The selection kept across a refresh
+
+def SelectedRows(dg: DataGrid) -> tuple[int, int]:
+    top, _, bottom, _=dg.SelectionBoundingBox()
+    return top, bottom
+
+def test_selection_snapshot_is_not_left_for_a_later_refresh():
+    dg=MakeDataGrid(Fanzines(10))
+    dg.SelectRows(2, 3)
+    assert not dg.Undo()        # Nothing to undo, so nothing is refreshed
+    dg._grid.SelectBlock(5, 0, 5, 2)        # As a click would
+    dg.DeleteRows(0, 1)
+    dg.RefreshWxGridFromChanges()
+    assert SelectedRows(dg) == (4, 4)
+
+def test_selection_set_after_a_move_is_kept():
+    dg=MakeDataGrid(Fanzines(10))
+    dg.SelectRows(2, 3)
+    dg.MoveRows(2, 2, 3)
+    dg.SelectRows(7, 7)
+    dg.RefreshWxGridFromDatasource(StartRow=2, EndRow=4)
+    assert SelectedRows(dg) == (7, 7)
+
+
+#================================================================
+# ColDefinitionsList's name index
+
+def test_name_lookup_after_in_place_changes():
+    coldefs=ColDefinitionsList([ColDefinition("Title"), ColDefinition("Editor"), ColDefinition("Year")])
+    assert coldefs.index("year") == 2
+    coldefs.List[0], coldefs.List[2]=coldefs.List[2], coldefs.List[0]
+    assert coldefs.index("year") == 0 and coldefs.index("title") == 2
+    coldefs.List[1]=ColDefinition("Issue")
+    assert "Issue" in coldefs and "Editor" not in coldefs
+    coldefs.List.sort(key=lambda cdef: cdef.Name)
+    assert [coldefs.IndexOfName(name) for name in ("Issue", "Title", "Year")] == [0, 1, 2]
+    coldefs.List=[ColDefinition("Notes")]
+    coldefs.List.append(ColDefinition("Pages"))
+    assert coldefs.index("pages") == 1
+
+
+#================================================================
+# The benchmark's comparison with a saved baseline
+
+def test_benchmark_compares_with_a_baseline(tmp_path):
+    results=RunBenchmarks([200], ["delete rows"], StandInGrid)
+    filename=str(tmp_path/"baseline.json")
+    SaveBaseline(results, filename, Mode="virtual")
+    baseline, mode=LoadBaseline(filename)
+    assert mode == "virtual"
+    assert baseline == {("delete rows", 200): (results[0].Seconds, results[0].TotalCalls)}
+    lines=Report(results+RunBenchmarks([300], ["delete rows"], StandInGrid), Baseline=baseline).splitlines()
+    assert lines[0].split()[:8] == ["case", "rows", "ms", "base", "ms", "ratio", "wx", "calls"]
+    calls=f"{results[0].TotalCalls:,}"
+    assert lines[1].split()[4:9] == [f"{results[0].Seconds*1000:.1f}", "1.00", calls, calls, "1.00"]
+    assert lines[2].split()[4:6] == ["-", "-"]       # Not in the baseline
+
+
+#================================================================
+# UndoLog's bound on its size
+
+def test_redo_keeps_the_undo_log_within_max_bytes():
+    dg=MakeDataGrid(Fanzines(10))
+    log=dg.UndoLog
+    for irow in range(3):
+        dg.GridCellChangeProcessing(irow, 0, f"Retitled {irow}")
+    entryBytes=log.Bytes//3
+    assert log.Bytes == 3*entryBytes
+    assert dg.Undo() and dg.Undo() and dg.Undo()
+    assert log.Bytes == 0
+    log.MaxBytes=2*entryBytes
+    assert dg.Redo() and dg.Redo() and dg.Redo()
+    assert log.Bytes == 2*entryBytes
+    assert [dg.Datasource[irow][0] for irow in range(3)] == ["Retitled 0", "Retitled 1", "Retitled 2"]
+    assert dg.Undo() and dg.Undo() and not dg.Undo()        # The oldest edit was forgotten
+    assert [dg.Datasource[irow][0] for irow in range(3)] == ["Retitled 0", "Fanzine 1", "Fanzine 2"]